@@ -17,7 +17,9 @@
 # limitations under the License.
 
 import os
+import random
 import pathlib
+import functools
 import numpy as np
 from skimage import img_as_float, img_as_ubyte
 
@@ -30,10 +32,16 @@ except ModuleNotFoundError:
 from abr_dataset_tools.utils import expandpath, parse_dataset_configs, \
     build_dataset_info, build_directory_info, build_render_setup, build_camera_info, \
     plot_sample, corners3d_outside_image
+from abr_dataset_tools.index import load_annotation_index
+from abr_dataset_tools.loader import iter_batches, BatchCollator
 
 from abr_dataset_tools import get_logger
 logger = get_logger()
 
+# modalities that can be loaded selectively, see ABRDataset.load_sample
+IMAGE_MODALITIES = ('rgb', 'range', 'depth', 'mask', 'backdrop')
+OBJECT_MODALITIES = ('pose', 'bboxes', 'object_masks')
+MODALITIES = IMAGE_MODALITIES + OBJECT_MODALITIES
 
 # Description strings
 ___str_dir_info__ = """
@@ -50,13 +58,13 @@ Root directory: {root}\n\
         └─ backdrop/"""
 
 ___str_sample_struct__ = """
-Sample (dict):
+Sample (dict): (only the requested modalities are loaded, see load_sample)
     image_id (numeric):             # id for image related to sample
     num_objects (int):              # number of objects
     images (dict):                  # collection of images
-        rgb (np.array):             # rgb image (float [0, 1])
+        rgb (np.array):             # rgb image (float [0, 1], or native uint8 w/o conversion)
         range (np.array):           # range values in m
-        depth (np.array):           # depth values (usually) in .1mm (see depth_scale in Dataset.cfg)
+        depth (np.array):           # depth values (usually) in .1mm (see depth_scale in Dataset.cfg), native uint16
         mask (np.array):            # composite seg. mask (int [0, 255])
         backdrop (np.array):        # background mask (inverse of composite mask) (int [0, 255])
     objects (list(dict)):           # objects with their properties. See create_empty_object_sample
@@ -77,6 +85,155 @@ Sample (dict):
             oobb (np.array)         # object oriented bounding box"""
 
 
+def collapse_mask(mask):
+    """Collapse a (3 channel) mask as written by blender to a single channel with values in {0, 1}"""
+    if mask.ndim == 3:
+        mask = mask[:, :, 0]
+    return ((mask == np.max(mask)) & (mask != 0)).astype(np.uint8)
+
+
+def build_sample(image_id, read_annotations, read_image, modalities=None, convert: bool = None, cam_info=None):
+    """
+    Build a sample from annotations and images, reading only what is required.
+
+    Image modalities are stored in sample['images'], object modalities in
+    the entries of sample['objects']. Note that the composite mask ('mask')
+    is computed from the per-object masks, which hence are read in this case.
+    Reading is delegated to the given callables, such that samples can be
+    built from different storage formats (directories, shards).
+
+    Args:
+        image_id(numeric): id of the sample
+        read_annotations(callable): returns the list of annotations of the sample (as in the json file)
+        read_image(callable): called with (modality, suffix=''), returns the decoded image.
+            For object masks, modality is 'mask' and suffix the mask_name of the object
+
+    Optional Args:
+        modalities(iterable): modalities to load, any of MODALITIES, i.e.
+            images: 'rgb', 'range', 'depth', 'mask', 'backdrop'
+            objects: 'pose' (ids, visibility, object and camera pose), 'bboxes', 'object_masks'
+            Default: None, which loads all modalities
+        convert(bool): if True, convert rgb and depth to float [0, 1] and composite mask and
+            backdrop to int [0, 255]. Otherwise keep the native dtypes of the files (uint8/uint16
+            for png, float32 for exr, masks as uint8 {0, 1}). Single object masks are always
+            uint8 {0, 1}. Default: None, which converts only if all modalities are loaded,
+            i.e. the behavior of previous versions
+        cam_info(dict): camera info, used to check projected 3d boxes. Default: None (no check)
+
+    Returns:
+        sample(dict): dictionary with information regarding images and objects contained therein
+
+    Raises:
+        ValueError: unknown modality
+    """
+    if convert is None:
+        convert = modalities is None
+    modalities = MODALITIES if modalities is None else tuple(modalities)
+    unknown = set(modalities) - set(MODALITIES)
+    if unknown:
+        raise ValueError(f'Unknown modalities {sorted(unknown)}. Available: {MODALITIES}')
+
+    # init
+    sample = dict()
+    sample['image_id'] = image_id
+
+    # load the json file and extract relevant information, if required at all
+    load_object_masks = 'object_masks' in modalities or 'mask' in modalities
+    if load_object_masks or 'pose' in modalities or 'bboxes' in modalities:
+        annotations = read_annotations()
+        sample['num_objects'] = len(annotations)
+        sample['objects'] = list()
+    else:
+        annotations = list()
+
+    composite_mask = None
+    log_msg = ''
+    for a in annotations:
+        obj = dict()
+
+        # set model and object name and id. Support single and multi object annotations
+        obj['object_class_name'] = a['object_class_name']
+        obj['object_class_id'] = a['object_class_id']
+        obj['object_name'] = a['object_name']
+        obj['object_id'] = a['object_id']
+        obj['mask_name'] = a['mask_name']
+
+        if 'pose' in modalities:
+            # work out pose: convert to expected format first
+            obj['pose'] = {
+                'q': np.array(a['pose']['q']),  # WXYZ
+                't': np.array(a['pose']['t'])
+            }
+
+            # new version fields
+            try:
+                obj['visible'] = a['visible']
+                obj['camera_pose'] = {
+                    'q': np.array(a['camera_pose']['q']),  # WXYZ
+                    't': np.array(a['camera_pose']['t'])
+                }
+            except KeyError:
+                obj['visible'] = ''
+                obj['camera_pose'] = None
+                msg = 'No visibility/camera_pose info. This might be an old version Dataset.\n'
+                if msg not in log_msg:
+                    log_msg += msg
+
+        if 'bboxes' in modalities:
+            # work out boxes
+            obj['bboxes'] = {
+                'corners2d': np.array(a['bbox']['corners2d']),
+                'corners3d': np.array(a['bbox']['corners3d']),
+                'aabb': np.array(a['bbox']['aabb']),
+                'oobb': np.array(a['bbox']['oobb'])
+            }
+
+            # check 3d boxes
+            # boxes are missing (None) for invisible objects
+            if cam_info is not None and a['bbox']['corners3d'] is not None and \
+                    corners3d_outside_image(obj['bboxes']['corners3d'], cam_info['width'], cam_info['height']):
+                obj_name_id = f'{obj["object_class_name"]}:{obj["object_class_id"]}'
+                log_msg += f'ATTENTION: Projected 3d bbox of {obj_name_id} partially outside of the image view\n'
+
+        if load_object_masks:
+            mask = collapse_mask(read_image('mask', obj['mask_name']))
+            if 'object_masks' in modalities:
+                obj['mask'] = mask
+
+            # merge composite mask
+            if composite_mask is None:
+                composite_mask = mask.copy()
+            else:
+                composite_mask[mask != 0] = 1
+
+        sample['objects'].append(obj)
+
+    # log only once per sample
+    if log_msg != '':
+        logger.warn(log_msg)
+
+    # work out images
+    images = dict()
+    if 'rgb' in modalities:
+        rgb = read_image('rgb')
+        images['rgb'] = img_as_float(rgb) if convert else np.asarray(rgb)
+    if 'mask' in modalities and composite_mask is not None:
+        images['mask'] = composite_mask * 255 if convert else composite_mask
+    if 'range' in modalities:
+        # collapse range to single axis, keep range info as float
+        range_img = read_image('range')[:, :, 0]
+        images['range'] = np.asarray(range_img, dtype=np.float32)
+    if 'depth' in modalities:
+        depth = read_image('depth')
+        images['depth'] = img_as_float(depth) if convert else np.asarray(depth)
+    if 'backdrop' in modalities:
+        backdrop = np.asarray(read_image('backdrop')[:, :, 0])
+        images['backdrop'] = img_as_ubyte(backdrop / max(np.max(backdrop), 1)) if convert else backdrop
+
+    sample['images'] = images
+    return sample
+
+
 class ABRDataset:
     """Class to handle dataset generated using AMIRA Blender Rendering"""
 
@@ -94,6 +251,12 @@ class ABRDataset:
             transform: torch-like sequential transform to apply to images while loading.
                         Transform must be implemented as a series of callable handling
                         the images in the loaded sample.
+            annotation_index(bool): if True, read annotations from the annotation index
+                        next to Dataset.cfg, which is built if missing or out of date
+                        (see abr_dataset_tools.index). Default: True
+            num_workers(int): number of processes to build the annotation index. Default: None (cpu count)
+            cache(cache.SampleCache): cache for decoded images, e.g. cache.MemoryCache(max_bytes)
+                        or cache.DiskCache(directory, max_bytes). Cached images are read-only. Default: None
 
         Returns:
             None
@@ -107,6 +270,7 @@ class ABRDataset:
         super(ABRDataset, self).__init__()
         self._root = expandpath(root, check_file=True)
         self.transform = kwargs.get('transform', None)  # allow for tranform to be applied
+        self.cache = kwargs.get('cache', None)  # cache for decoded images
 
         # load configuration from root dir
         dset_cfg = parse_dataset_configs(self._root)
@@ -118,9 +282,6 @@ class ABRDataset:
         self.dir_info = build_directory_info(self._root)
         self.cam_info = build_camera_info(dset_cfg['camera_info'])
 
-        # get filenames from RGB images
-        self.fnames = sorted([f.stem for f in pathlib.Path(self.dir_info['images']['rgb']).iterdir() if f.is_file()])
-
         # early on check convention
         self._convention = convention
         if convention == 'opencv':
@@ -128,7 +289,24 @@ class ABRDataset:
         elif convention == 'opengl':
             self.annotations_path = self.dir_info['annotations']['opengl']
         else:
-            raise ValueError(f'Uknown convention "{self.cfg.convention}')
+            raise ValueError(f'Uknown convention "{convention}"')
+
+        # columnar annotations of all samples. If the index is not available (e.g. the
+        # dataset is on read-only storage), annotations are parsed from json per sample
+        self.annotation_index = None
+        if kwargs.get('annotation_index', True):
+            try:
+                self.annotation_index = load_annotation_index(self._root, convention,
+                                                              num_workers=kwargs.get('num_workers', None))
+            except OSError as err:
+                logger.warn(f'Could not build annotation index, reading annotations from json files: {err}')
+
+        # get filenames from index or RGB images
+        if self.annotation_index is not None:
+            self.fnames = self.annotation_index.fnames
+        else:
+            self.fnames = sorted([f.stem for f in pathlib.Path(self.dir_info['images']['rgb']).iterdir()
+                                  if f.is_file()])
 
         # read parts from scenario setup and store in list self.parts,
         # where the list index corresponds to the model_id
@@ -162,128 +340,68 @@ class ABRDataset:
                     part_info['blend_scale'] = scale * 3 if len(scale) == 1 else scale
             self.parts.append(part_info)
 
-    def load_sample(self, index):
+    def _image_path(self, modality, index, suffix=''):
+        """Path to the image of given modality for the sample at given index"""
+        ext = 'exr' if modality == 'range' else 'png'
+        return os.path.join(self.dir_info['images'][modality], f'{self.fnames[index]}{suffix}.{ext}')
+
+    def _read_annotations(self, index):
+        """Read the annotations of the sample at given index, from the index if available or json"""
+        if self.annotation_index is not None:
+            return self.annotation_index.get_annotations(index)
+        with open(os.path.join(self.annotations_path, f'{self.fnames[index]}.json'), 'r') as f:
+            return json.load(f)
+
+    def _read_image(self, index, modality, suffix=''):
+        """Read and decode the image of given modality for the sample at given index"""
+        if self.cache is None:
+            return imageio.imread(self._image_path(modality, index, suffix))
+        # key by filename instead of index, such that persistent caches remain valid if samples are added
+        return self.cache.get((self.fnames[index], modality, suffix),
+                              lambda: imageio.imread(self._image_path(modality, index, suffix)))
+
+    def load_sample(self, index, modalities=None, convert: bool = None):
         """
-        Load sample from dataset given index number
+        Load sample from dataset given index number.
+
+        Only the files required for the requested modalities are read and decoded,
+        see build_sample.
 
         Args:
             index(int): index value for image
 
+        Optional Args:
+            modalities(iterable): modalities to load, any of MODALITIES. Default: None (all)
+            convert(bool): convert images to float/int [0, 255]. Default: None. See build_sample
+
         Returns:
             sample(dict): dictionary with information regarding images and objects contained therein
-        """
-
-        # get the name of the pngs
-        fname_png = f"{self.fnames[index]}.png"
-        fname_json = f"{self.fnames[index]}.json"
-
-        # load the json file and extract relevant information
-        with open(os.path.join(self.annotations_path, fname_json), 'r') as f:
-            annotations = json.load(f)
-
-        # init
-        sample = dict()
-
-        # fill out sample
-        sample['image_id'] = index
-        sample['num_objects'] = len(annotations)
-        sample['objects'] = list()
-
-        composite_mask = None
-        log_msg = ''
-        for a in annotations:
-            obj = dict()
-
-            # set model and object name and id. Support single and multi object annotations
-            obj['object_class_name'] = a['object_class_name']
-            obj['object_class_id'] = a['object_class_id']
-            obj['object_name'] = a['object_name']
-            obj['object_id'] = a['object_id']
-            obj['mask_name'] = a['mask_name']
-
-            # work out pose: convert to expected format first
-            obj['pose'] = {
-                'q': np.array(a['pose']['q']),  # WXYZ
-                't': np.array(a['pose']['t'])
-            }
 
-            # work out boxes
-            obj['bboxes'] = {
-                'corners2d': np.array(a['bbox']['corners2d']),
-                'corners3d': np.array(a['bbox']['corners3d']),
-                'aabb': np.array(a['bbox']['aabb']),
-                'oobb': np.array(a['bbox']['oobb'])
-            }
-
-            # check 3d boxes
-            if corners3d_outside_image(obj['bboxes']['corners3d'], self.cam_info['width'], self.cam_info['height']):
-                obj_name_id = f'{obj["object_class_name"]}:{obj["object_class_id"]}'
-                log_msg += f'ATTENTION: Projected 3d bbox of {obj_name_id} partially outside of the image view\n'
-
-            fname_mask_png = f"{self.fnames[index]}{obj['mask_name']}.png"
-            mask = imageio.imread(os.path.join(self.dir_info['images']['mask'], fname_mask_png))
-
-            # collapse mask and depth to single axis (blender returns mask and depth with 3 channels)
-            mask = (mask[:, :, 0] / np.max(mask)).astype(np.uint8)
-
-            obj['mask'] = mask
-
-            # merge composite mask
-            if composite_mask is None:
-                composite_mask = mask
-            else:
-                composite_mask[mask != 0] = 1
-
-            # new version fields
-            try:
-                obj['visible'] = a['visible']
-                obj['camera_pose'] = {
-                    'q': np.array(a['camera_pose']['q']),  # WXYZ
-                    't': np.array(a['camera_pose']['t'])
-                }
-            except KeyError:
-                obj['visible'] = ''
-                obj['camera_pose'] = None
-                msg = 'No visibility/camera_pose info. This might be an old version Dataset.\n'
-                if msg not in log_msg:
-                    log_msg += msg
-
-            sample['objects'].append(obj)
-
-        # log only once per sample
-        if log_msg != '':
-            logger.warn(log_msg)
-
-        # work out images
-        rgb = imageio.imread(os.path.join(self.dir_info['images']['rgb'], fname_png))
-        backdrop = imageio.imread(os.path.join(self.dir_info['images']['backdrop'], fname_png))[:, :, 0]
-        range_img = imageio.imread(os.path.join(self.dir_info['images']['range'], fname_png.replace("png", "exr")))
-        depth = imageio.imread(os.path.join(self.dir_info['images']['depth'], fname_png))
-        # collapse depth to single axis
-        range_img = range_img[:, :, 0]
-
-        # assign images
-        sample['images'] = {
-            'rgb': img_as_float(rgb),
-            'mask': img_as_ubyte(composite_mask / np.max(composite_mask)),
-            'range': np.asarray(range_img, dtype=np.float32),  # keep depth info
-            'depth': img_as_float(depth),
-            'backdrop': img_as_ubyte(backdrop / np.max(backdrop))
-        }
-        return sample
+        Raises:
+            ValueError: unknown modality
+        """
+        return build_sample(
+            index,
+            read_annotations=lambda: self._read_annotations(index),
+            read_image=lambda modality, suffix='': self._read_image(index, modality, suffix),
+            modalities=modalities, convert=convert, cam_info=self.cam_info)
 
     def apply_transform(self, sample):
         if self.transform is not None:
             sample = self.transform(sample)
         return sample
 
-    def get_sample(self, index):
+    def get_sample(self, index, modalities=None, convert: bool = None):
         """
         Public interface to load samples from given index
 
         Args:
             index(int): index of desired sample
 
+        Optional Args:
+            modalities(iterable): modalities to load. Default: None (all). See load_sample
+            convert(bool): convert images to float/int [0, 255]. Default: None. See load_sample
+
         Returns:
             sample(dict): dictionary with sample info (images, objects)
 
@@ -292,14 +410,20 @@ class ABRDataset:
         """
         if not 0 <= index < len(self):
             raise OverflowError('Given index outside dataset size')
-        return self.__getitem__(index)
+        if modalities is None and convert is None:
+            return self.__getitem__(index)
+        return self.apply_transform(self.load_sample(index, modalities=modalities, convert=convert))
 
-    def get_samples(self, indexes):
+    def get_samples(self, indexes, modalities=None, convert: bool = None):
         """Public interface to load a list of samples from given indexes
 
         Args:
             indexes(list/iterable): iterable with desired indexes to load
 
+        Optional Args:
+            modalities(iterable): modalities to load. Default: None (all). See load_sample
+            convert(bool): convert images to float/int [0, 255]. Default: None. See load_sample
+
         Returns:
             list(dict): list with samples corresponding to given indexes
 
@@ -308,23 +432,63 @@ class ABRDataset:
         """
         samples = []
         for i in indexes:
-            samples.append(self.get_sample(i))
+            samples.append(self.get_sample(i, modalities=modalities, convert=convert))
         return samples
 
-    def get_images(self, index):
+    def iter_batches(self, batch_size: int, num_workers: int = 4, prefetch: int = 2, indexes=None,
+                     shuffle: bool = False, seed: int = None, ordered: bool = True, drop_last: bool = False,
+                     modalities=None, convert: bool = None, use_processes: bool = False,
+                     reuse_buffers: bool = True):
+        """Iterate over batches of samples, which are loaded in parallel.
+
+        Images of equal shape are collated into contiguous arrays of shape (batch_size, ...),
+        objects are returned as list (per sample) of lists. See loader.BatchCollator.
+
+        Args:
+            batch_size(int): number of samples per batch
+
+        Optional Args:
+            num_workers(int): number of threads/processes to load samples. Default: 4
+            prefetch(int): number of batches loaded ahead. Default: 2
+            indexes(iterable): indexes of samples to load. Default: None (all samples)
+            shuffle(bool): shuffle indexes. Default: False
+            seed(int): seed for shuffling. Default: None
+            ordered(bool): if False, samples are batched in order of completion. Default: True
+            drop_last(bool): drop the last batch if it is smaller than batch_size. Default: False
+            modalities(iterable): modalities to load. Default: None (all). See load_sample
+            convert(bool): convert images to float/int [0, 255]. Default: None. See load_sample
+            use_processes(bool): load samples in processes instead of threads. Default: False
+            reuse_buffers(bool): collate images into the same arrays for each batch, which are
+                hence only valid until the next batch is requested. Default: True
+
+        Yields:
+            batch(dict): dictionary with image_id, images, num_objects and objects
         """
-        Public interface to load images (rgb, depth, mask) corresponding to given index
+        indexes = list(range(len(self))) if indexes is None else list(indexes)
+        if shuffle:
+            random.Random(seed).shuffle(indexes)
+        load_fn = functools.partial(self.get_sample, modalities=modalities, convert=convert)
+        return iter_batches(load_fn, indexes, batch_size, num_workers=num_workers, prefetch=prefetch,
+                            ordered=ordered, drop_last=drop_last, use_processes=use_processes,
+                            collate_fn=BatchCollator(reuse_buffers=reuse_buffers))
+
+    def get_images(self, index, modalities=IMAGE_MODALITIES):
+        """
+        Public interface to load images (rgb, range, depth, mask, backdrop) corresponding to given index
 
         Args:
             index(int): index to load
 
+        Optional Args:
+            modalities(iterable): image modalities to load. Default: IMAGE_MODALITIES
+
         Returns:
-            images(dict): dict containing (rgb, depth, mask)
+            images(dict): dict containing (rgb, range, depth, mask, backdrop)
 
         Raises:
             OverflowError: index is out of dataset bound
         """
-        return self.get_sample(index)['images']
+        return self.get_sample(index, modalities=modalities, convert=True)['images']
 
     def get_rgb(self, index):
         """
@@ -339,7 +503,7 @@ class ABRDataset:
         Raises:
             OverflowError: index is out of dataset bound
         """
-        return self.get_images(index)['rgb']
+        return self.get_images(index, modalities=('rgb',))['rgb']
 
     def get_depth(self, index):
         """
@@ -354,7 +518,7 @@ class ABRDataset:
         Raises:
             OverflowError: index is out of dataset bound
         """
-        return self.get_images(index)['depth']
+        return self.get_images(index, modalities=('depth',))['depth']
 
     def get_mask(self, index):
         """
@@ -369,7 +533,7 @@ class ABRDataset:
         Raises:
             OverflowError: index is out of dataset bound
         """
-        return self.get_images(index)['mask']
+        return self.get_images(index, modalities=('mask',))['mask']
 
     def plot_images(self, index, plot_2d_box: bool = False, plot_3d_box: bool = False):
         """Public interface to plot images from sample
@@ -393,7 +557,9 @@ class ABRDataset:
             plot_2d_box(bool): if True plot 2d bounding box for objects. Default: False
             plot_3d_box(bool): if True plot 3d bounding box for objects. Default: False
         """
-        plot_sample(self.get_sample(index), target='rgb', plot_2d_box=plot_2d_box, plot_3d_box=plot_3d_box)
+        modalities = ('rgb', 'bboxes') if plot_2d_box or plot_3d_box else ('rgb',)
+        plot_sample(self.get_sample(index, modalities=modalities, convert=True), target='rgb',
+                    plot_2d_box=plot_2d_box, plot_3d_box=plot_3d_box)
 
     def plot_depth(self, index):
         """Public interface to plot depth from sample
@@ -401,7 +567,7 @@ class ABRDataset:
         Args:
             index(int): index of sample to plot
         """
-        plot_sample(self.get_sample(index), target='depth')
+        plot_sample(self.get_sample(index, modalities=('depth',), convert=True), target='depth')
 
     def plot_mask(self, index):
         """Public interface to plot composite seg. mask from sample
@@ -409,7 +575,7 @@ class ABRDataset:
         Args:
             index(int): index of sample to plot
         """
-        plot_sample(self.get_sample(index), target='mask')
+        plot_sample(self.get_sample(index, modalities=('mask',), convert=True), target='mask')
 
     def plot_backdrop(self, index):
         """Public interface to plot backdrop image from sample
@@ -417,7 +583,36 @@ class ABRDataset:
         Args:
             index(int): index of sample to plot
         """
-        plot_sample(self.get_sample(index), target='backdrop')
+        plot_sample(self.get_sample(index, modalities=('backdrop',), convert=True), target='backdrop')
+
+    def query_objects(self, **kwargs):
+        """Vectorized selection of annotated objects of all samples, see AnnotationIndex.select_objects
+
+        Kwargs Args:
+            object_class_id, object_class_name, visible, min_distance, max_distance
+
+        Returns:
+            np.array(bool): mask over all object rows of the annotation index
+
+        Raises:
+            RuntimeError: dataset was opened without annotation index
+        """
+        if self.annotation_index is None:
+            raise RuntimeError('Queries require the annotation index')
+        return self.annotation_index.select_objects(**kwargs)
+
+    def query_samples(self, **kwargs):
+        """Indexes of all samples with at least one object meeting the given criteria, see query_objects
+
+        Returns:
+            np.array(int): sorted sample indexes
+
+        Raises:
+            RuntimeError: dataset was opened without annotation index
+        """
+        if self.annotation_index is None:
+            raise RuntimeError('Queries require the annotation index')
+        return self.annotation_index.select_samples(**kwargs)
 
     def get_parts(self):
         return self.parts
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 - for information on the respective copyright owner
+# see the NOTICE file and/or the repository
+# <https://github.com/boschresearch/amira-blender-rendering>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Caches for decoded images with a byte budget and LRU eviction.
+
+Decoding png/exr files is usually the main cost when loading samples. The
+caches store decoded images (in their native dtype, before any conversion),
+keyed by sample (filename), modality and (for object masks) the mask name.
+Cached arrays are read-only, such that cached data can not be modified
+accidentally.
+"""
+
+import os
+import threading
+import collections
+import numpy as np
+
+
+class SampleCache:
+    """Base class of caches. Keeps track of LRU order, size and statistics.
+
+    Args:
+        max_bytes(int): max total size of cached arrays in bytes
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = int(max_bytes)
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()  # key -> size in bytes
+        self._lock = threading.Lock()
+
+    def _load(self, key):
+        raise NotImplementedError()
+
+    def _store(self, key, array):
+        """Store array, return size in bytes"""
+        raise NotImplementedError()
+
+    def _remove(self, key):
+        raise NotImplementedError()
+
+    def get(self, key, load_fn):
+        """Get cached array for key, or load and cache it
+
+        Args:
+            key(tuple): (sample filename, modality, suffix)
+            load_fn(callable): loads the array if not cached
+
+        Returns:
+            np.array (read-only)
+        """
+        with self._lock:
+            if key in self._entries:
+                try:
+                    array = self._load(key)
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return array
+                except FileNotFoundError:
+                    # evicted by another process sharing the cache directory
+                    self.nbytes -= self._entries.pop(key)
+            self.misses += 1
+
+        # decode outside of the lock, such that several threads can decode in parallel
+        array = np.asarray(load_fn())
+        if array.nbytes > self.max_bytes:
+            return array
+
+        with self._lock:
+            if key not in self._entries:
+                while self._entries and self.nbytes + array.nbytes > self.max_bytes:
+                    old_key, size = self._entries.popitem(last=False)
+                    self._remove(old_key)
+                    self.nbytes -= size
+                    self.evictions += 1
+                self._entries[key] = self._store(key, array)
+                self.nbytes += self._entries[key]
+            return self._load(key)
+
+    def __getstate__(self):
+        # locks can not be pickled, e.g. when a dataset is sent to worker processes
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def stats(self):
+        """Return dict with cache statistics"""
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests if requests > 0 else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'nbytes': self.nbytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits, self.misses, self.evictions = 0, 0, 0
+
+    def clear(self):
+        with self._lock:
+            for key in self._entries:
+                self._remove(key)
+            self._entries.clear()
+            self.nbytes = 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class MemoryCache(SampleCache):
+    """Cache decoded arrays in memory
+
+    Args:
+        max_bytes(int): max total size of cached arrays in bytes
+    """
+
+    def __init__(self, max_bytes: int):
+        super(MemoryCache, self).__init__(max_bytes)
+        self._arrays = dict()
+
+    def _load(self, key):
+        return self._arrays[key]
+
+    def _store(self, key, array):
+        array = np.ascontiguousarray(array)
+        array.flags.writeable = False
+        self._arrays[key] = array
+        return array.nbytes
+
+    def _remove(self, key):
+        del self._arrays[key]
+
+
+class DiskCache(SampleCache):
+    """Cache decoded arrays on disk as raw .npy files, which are memory-mapped when read.
+
+    Existing files in the cache directory are reused, such that the cache
+    persists between runs. Use one directory per dataset. Several processes can
+    share a directory, but each of them accounts for the budget separately.
+
+    Args:
+        directory(str): cache directory
+        max_bytes(int): max total size of cached files in bytes
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        super(DiskCache, self).__init__(max_bytes)
+        self.directory = os.path.expanduser(os.path.expandvars(directory))
+        os.makedirs(self.directory, exist_ok=True)
+
+        # restore entries of previous runs. Most recently used files are kept
+        # until the budget is reached, older files are removed
+        files = [f for f in os.scandir(self.directory) if f.is_file() and f.name.endswith('.npy')]
+        kept = []
+        full = False
+        for f in sorted(files, key=lambda f: f.stat().st_mtime, reverse=True):
+            key = self._parse_filename(f.name)
+            if key is None:
+                continue
+            size = f.stat().st_size
+            full = full or self.nbytes + size > self.max_bytes
+            if full:
+                os.remove(f.path)
+                continue
+            kept.append((key, size))
+            self.nbytes += size
+        # entries are ordered least recently used first
+        for key, size in reversed(kept):
+            self._entries[key] = size
+
+    @staticmethod
+    def _filename(key):
+        fname, modality, suffix = key
+        return f'{modality}.{suffix}.{fname}.npy'
+
+    @staticmethod
+    def _parse_filename(name):
+        parts = name[:-4].split('.', 2)
+        if len(parts) != 3:
+            return None
+        return parts[2], parts[0], parts[1]
+
+    def _path(self, key):
+        return os.path.join(self.directory, self._filename(key))
+
+    def _load(self, key):
+        return np.load(self._path(key), mmap_mode='r')
+
+    def _store(self, key, array):
+        path = self._path(key)
+        tmp_path = f'{path}.tmp{os.getpid()}-{threading.get_ident()}'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_path, path)
+        return os.path.getsize(path)
+
+    def _remove(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 - for information on the respective copyright owner
+# see the NOTICE file and/or the repository
+# <https://github.com/boschresearch/amira-blender-rendering>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Export datasets rendered with ABR to COCO and BOP formats.
+
+COCO: instance segmentation annotations with masks as (compressed) RLE, as
+written by pycocotools, in a single json file.
+
+BOP: ground truth poses in the format of the BOP benchmark (scene_gt.json,
+scene_gt_info.json, scene_camera.json, mask_visib/), with all samples in a
+single BOP scene, and the ground truth as BOP results csv file. Images are
+linked into the BOP directory structure. Note that ABR masks only contain the
+visible part of objects, hence bbox_obj is the bounding box of the projected
+3D box and px_count_all/visib_fract are not available.
+
+Masks are decoded and encoded in a process pool, and all outputs are written
+incrementally, such that the memory footprint does not depend on the size of
+the dataset. Object ids are the class ids of ABR plus an offset (default 1),
+since both formats reserve 0.
+
+Usage:
+
+    python -m abr_dataset_tools.export coco /path/to/dataset /path/to/instances.json --workers 16
+    python -m abr_dataset_tools.export bop /path/to/dataset /path/to/bop/test --workers 16
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import numpy as np
+import imageio
+from concurrent.futures import ProcessPoolExecutor
+
+from abr_dataset_tools import get_logger
+from abr_dataset_tools.abr import ABRDataset
+from abr_dataset_tools.loader import prefetch_map
+from abr_dataset_tools.utils import parse_dataset_configs, quaternion_to_rotation_matrix
+from abr_dataset_tools.validate import read_png_header
+
+logger = get_logger()
+
+
+def rle_to_string(counts):
+    """Compress RLE counts to a string, as done by pycocotools (rleToString in maskApi.c)"""
+    chars = list()
+    for i, x in enumerate(counts):
+        x = int(x)
+        if i > 2:
+            x -= int(counts[i - 2])
+        more = True
+        while more:
+            c = x & 0x1f
+            x >>= 5
+            more = x != -1 if c & 0x10 else x != 0
+            if more:
+                c |= 0x20
+            chars.append(chr(c + 48))
+    return ''.join(chars)
+
+
+def encode_rle(mask):
+    """Encode a binary mask as compressed RLE in the format of pycocotools
+
+    Args:
+        mask(np.array): (H, W) mask, non-zero pixels belong to the object
+
+    Returns:
+        dict with size [H, W] and (compressed) counts
+    """
+    height, width = mask.shape
+    # column-major order, counts start with the number of background pixels
+    pixels = np.asarray(mask, dtype=bool).ravel(order='F')
+    bounds = np.concatenate(([0], np.flatnonzero(pixels[1:] != pixels[:-1]) + 1, [pixels.size]))
+    counts = np.diff(bounds)
+    if pixels.size > 0 and pixels[0]:
+        counts = np.concatenate(([0], counts))
+    return {'size': [height, width], 'counts': rle_to_string(counts)}
+
+
+def mask_to_bbox(mask):
+    """Bounding box [x, y, width, height] of the non-zero pixels of a mask"""
+    xs, ys = np.flatnonzero(mask.any(axis=0)), np.flatnonzero(mask.any(axis=1))
+    if xs.size == 0:
+        return [0, 0, 0, 0]
+    return [int(xs[0]), int(ys[0]), int(xs[-1] - xs[0] + 1), int(ys[-1] - ys[0] + 1)]
+
+
+def _corners_to_bbox(corners, width, height):
+    """Bounding box [x, y, width, height] of projected points, clipped to the image"""
+    if corners is None or corners.dtype == object:
+        return [-1, -1, -1, -1]
+    x0, y0 = np.clip(np.floor(corners.min(axis=0)), 0, [width - 1, height - 1]).astype(int)
+    x1, y1 = np.clip(np.floor(corners.max(axis=0)), 0, [width - 1, height - 1]).astype(int)
+    return [int(x0), int(y0), int(x1 - x0 + 1), int(y1 - y0 + 1)]
+
+
+class _StreamWriter:
+    """Write the items of a json list or dict to a file one by one"""
+
+    def __init__(self, f):
+        self.f = f
+        self.count = 0
+
+    def write(self, text):
+        self.f.write(text if self.count == 0 else ',\n' + text)
+        self.count += 1
+
+
+# dataset used by worker processes, see _init_worker
+_worker_dataset = None
+
+
+def _init_worker(dataset):
+    global _worker_dataset
+    _worker_dataset = dataset
+
+
+def _encode_sample(dataset, index, mask_dir=None):
+    """Load objects and masks of a sample, encode masks. Optionally write masks in BOP format"""
+    fname = dataset.fnames[index]
+    width, height = read_png_header(os.path.join(dataset.dir_info['images']['rgb'], f'{fname}.png'))
+    sample = dataset.get_sample(index, modalities=('pose', 'bboxes', 'object_masks'), convert=False)
+    objects = list()
+    for gt_id, obj in enumerate(sample['objects']):
+        mask = obj.pop('mask')
+        obj['segmentation'] = encode_rle(mask)
+        obj['area'] = int(np.count_nonzero(mask))
+        # objects of frames without visible objects are annotated with visible=False
+        # (old datasets without visibility info store '') and an empty mask
+        obj['is_visible'] = obj.get('visible', '') is not False and obj['area'] > 0
+        if obj['is_visible']:
+            obj['bbox_visib'] = mask_to_bbox(mask)
+            obj['bbox_obj'] = _corners_to_bbox(obj['bboxes']['corners3d'], width, height)
+        else:
+            # BOP convention for objects that are not visible
+            obj['bbox_visib'] = [-1, -1, -1, -1]
+            obj['bbox_obj'] = [-1, -1, -1, -1]
+        if mask_dir is not None:
+            imageio.imwrite(os.path.join(mask_dir, f'{index:06d}_{gt_id:06d}.png'), mask * 255)
+        objects.append(obj)
+    return {'index': index, 'fname': fname, 'width': width, 'height': height, 'objects': objects}
+
+
+def _encode_chunk(args):
+    indexes, mask_dir = args
+    return [_encode_sample(_worker_dataset, i, mask_dir) for i in indexes]
+
+
+def iter_encoded_samples(dataset, num_workers: int = None, chunk_size: int = 32, mask_dir: str = None):
+    """Encode the masks of all samples of a dataset in a process pool
+
+    Args:
+        dataset(ABRDataset): dataset
+
+    Optional Args:
+        num_workers(int): number of processes. Default: None (cpu count)
+        chunk_size(int): number of samples per task. Default: 32
+        mask_dir(str): if given, masks are written to this directory in BOP format. Default: None
+
+    Yields:
+        dict with index, fname, width, height, and objects (see ABRDataset.get_sample) with
+        segmentation (RLE), area, is_visible, bbox_visib and bbox_obj, in the order of samples.
+        Boxes of objects that are not visible are [-1, -1, -1, -1]
+    """
+    num_workers = os.cpu_count() if num_workers is None else num_workers
+    tasks = ((list(range(i, min(i + chunk_size, len(dataset)))), mask_dir)
+             for i in range(0, len(dataset), chunk_size))
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker, initargs=(dataset,)) as executor:
+        done = 0
+        for chunk in prefetch_map(_encode_chunk, tasks, executor, max_pending=2 * num_workers):
+            for s in chunk:
+                yield s
+            done += len(chunk)
+            logger.info(f'Encoded {done}/{len(dataset)} samples')
+
+
+def _get_categories(dataset, id_offset):
+    return [{'id': p['model_id'] + id_offset, 'name': p['model_name'], 'supercategory': 'object'}
+            for p in dataset.parts]
+
+
+def export_coco(root: str, output: str, num_workers: int = None, chunk_size: int = 32, id_offset: int = 1):
+    """Export a dataset to COCO instance segmentation format
+
+    Images are referenced by their path relative to the dataset root, image ids
+    are the sample indexes. Objects that are not visible (or have an empty mask)
+    are not annotated.
+
+    Args:
+        root(str): path to dataset root directory
+        output(str): path of json file to write
+
+    Optional Args:
+        num_workers(int): number of processes to encode masks. Default: None (cpu count)
+        chunk_size(int): number of samples per task. Default: 32
+        id_offset(int): offset added to class ids to get category ids. Default: 1
+
+    Returns:
+        number of images and annotations written
+    """
+    dataset = ABRDataset(root, convention='opencv', num_workers=num_workers)
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    # images and annotations are written in one pass, annotations to a temporary file first
+    tmp_path = f'{output}.annotations.tmp'
+    num_images, num_annotations = 0, 0
+    try:
+        with open(output, 'w') as f, open(tmp_path, 'w') as f_ann:
+            info = {'description': f'ABR dataset {dataset.root}', 'version': '1.0'}
+            f.write(f'{{"info": {json.dumps(info)},\n"licenses": [],\n')
+            f.write(f'"categories": {json.dumps(_get_categories(dataset, id_offset))},\n"images": [\n')
+            images, annotations = _StreamWriter(f), _StreamWriter(f_ann)
+            for s in iter_encoded_samples(dataset, num_workers=num_workers, chunk_size=chunk_size):
+                images.write(json.dumps({
+                    'id': s['index'],
+                    'file_name': f"Images/rgb/{s['fname']}.png",
+                    'width': s['width'],
+                    'height': s['height']}))
+                for obj in s['objects']:
+                    if not obj['is_visible']:
+                        continue
+                    annotations.write(json.dumps({
+                        'id': annotations.count + 1,
+                        'image_id': s['index'],
+                        'category_id': int(obj['object_class_id']) + id_offset,
+                        'segmentation': obj['segmentation'],
+                        'area': obj['area'],
+                        'bbox': obj['bbox_visib'],
+                        'iscrowd': 0}))
+            num_images, num_annotations = images.count, annotations.count
+
+        with open(output, 'a') as f, open(tmp_path, 'r') as f_ann:
+            f.write('\n],\n"annotations": [\n')
+            shutil.copyfileobj(f_ann, f)
+            f.write('\n]}\n')
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    logger.info(f'Wrote {num_images} images and {num_annotations} annotations to {output}')
+    return num_images, num_annotations
+
+
+def _link(src, dst):
+    if os.path.lexists(dst):
+        os.remove(dst)
+    os.symlink(src, dst)
+
+
+def export_bop(root: str, output: str, scene_id: int = 0, num_workers: int = None, chunk_size: int = 32,
+               id_offset: int = 1, link_images: bool = True):
+    """Export a dataset to BOP format, as one BOP scene
+
+    Writes {output}/{scene_id:06d}/ with scene_gt.json, scene_gt_info.json,
+    scene_camera.json, mask_visib/ and (optionally) rgb/ and depth/ with links
+    to the images of the dataset. Image ids are the sample indexes. The ground
+    truth is also written as BOP results file {output}/gt_{scene_id:06d}.csv.
+    Objects that are not visible keep their pose, with boxes [-1, -1, -1, -1]
+    and px_count_visib 0 in scene_gt_info.
+
+    Args:
+        root(str): path to dataset root directory
+        output(str): path of BOP split directory, e.g. /path/to/bop/dataset/test
+
+    Optional Args:
+        scene_id(int): id of the BOP scene. Default: 0
+        num_workers(int): number of processes to encode masks. Default: None (cpu count)
+        chunk_size(int): number of samples per task. Default: 32
+        id_offset(int): offset added to class ids to get BOP object ids. Default: 1
+        link_images(bool): create links to rgb and depth images. Default: True
+
+    Returns:
+        number of images and ground truth poses written
+
+    Raises:
+        ValueError: the dataset does not contain camera intrinsics
+    """
+    dataset = ABRDataset(root, convention='opencv', num_workers=num_workers)
+    fx, fy, cx, cy = [float(v) for v in dataset.cam_info['intrinsic']]
+    if fx <= 0 or fy <= 0:
+        raise ValueError(f'Dataset {dataset.root} does not contain camera intrinsics')
+    cfg = parse_dataset_configs(dataset.root)
+    depth_scale = float(cfg['postprocess'].get('depth_scale', 1e4)) if 'postprocess' in cfg.sections() else 1e4
+    camera = {'cam_K': [fx, 0.0, cx, 0.0, fy, cy, 0.0, 0.0, 1.0], 'depth_scale': 1e3 / depth_scale}
+
+    scene_dir = os.path.join(output, f'{scene_id:06d}')
+    mask_dir = os.path.join(scene_dir, 'mask_visib')
+    os.makedirs(mask_dir, exist_ok=True)
+    if link_images:
+        for modality in ('rgb', 'depth'):
+            os.makedirs(os.path.join(scene_dir, modality), exist_ok=True)
+
+    files = {name: open(os.path.join(scene_dir, f'{name}.json'), 'w')
+             for name in ('scene_gt', 'scene_gt_info', 'scene_camera')}
+    num_images, num_poses = 0, 0
+    try:
+        writers = {name: _StreamWriter(f) for name, f in files.items()}
+        for f in files.values():
+            f.write('{\n')
+        with open(os.path.join(output, f'gt_{scene_id:06d}.csv'), 'w') as f_csv:
+            f_csv.write('scene_id,im_id,obj_id,score,R,t,time\n')
+            for s in iter_encoded_samples(dataset, num_workers=num_workers, chunk_size=chunk_size,
+                                          mask_dir=mask_dir):
+                im_id = s['index']
+                gt, gt_info = list(), list()
+                for obj in s['objects']:
+                    R = quaternion_to_rotation_matrix(obj['pose']['q'])
+                    t = np.asarray(obj['pose']['t'], dtype=np.float64)
+                    obj_id = int(obj['object_class_id']) + id_offset
+                    gt.append({'cam_R_m2c': R.ravel().tolist(), 'cam_t_m2c': t.tolist(), 'obj_id': obj_id})
+                    gt_info.append({'bbox_obj': obj['bbox_obj'], 'bbox_visib': obj['bbox_visib'],
+                                    'px_count_visib': obj['area']})
+                    f_csv.write(f"{scene_id},{im_id},{obj_id},1.0,{' '.join(map(str, R.ravel()))},"
+                                f"{' '.join(map(str, t))},-1\n")
+                writers['scene_gt'].write(f'"{im_id}": {json.dumps(gt)}')
+                writers['scene_gt_info'].write(f'"{im_id}": {json.dumps(gt_info)}')
+                writers['scene_camera'].write(f'"{im_id}": {json.dumps(camera)}')
+                num_poses += len(gt)
+
+                if link_images:
+                    for modality in ('rgb', 'depth'):
+                        _link(os.path.join(dataset.dir_info['images'][modality], f"{s['fname']}.png"),
+                              os.path.join(scene_dir, modality, f'{im_id:06d}.png'))
+            num_images = writers['scene_gt'].count
+        for f in files.values():
+            f.write('\n}\n')
+    finally:
+        for f in files.values():
+            f.close()
+    logger.info(f'Wrote {num_images} images and {num_poses} poses to {scene_dir}')
+    return num_images, num_poses
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export a dataset rendered with ABR to COCO or BOP format')
+    parser.add_argument('format', type=str, choices=['coco', 'bop'], help='Output format')
+    parser.add_argument('root_path', type=str, help='(Absolute) Path to dataset root directory')
+    parser.add_argument('output', type=str, help='COCO: json file to write. BOP: split directory to write to')
+    parser.add_argument('--workers', type=int, default=None, help='Number of processes. Default: cpu count')
+    parser.add_argument('--id-offset', type=int, default=1,
+                        help='Offset added to class ids to get category/object ids. Default: 1')
+    parser.add_argument('--scene-id', type=int, default=0, help='BOP: id of the scene to write. Default: 0')
+    parser.add_argument('--no-links', action='store_true', help='BOP: do not link rgb and depth images')
+    args = parser.parse_args(argv)
+
+    if args.format == 'coco':
+        export_coco(args.root_path, args.output, num_workers=args.workers, id_offset=args.id_offset)
+    else:
+        export_bop(args.root_path, args.output, scene_id=args.scene_id, num_workers=args.workers,
+                   id_offset=args.id_offset, link_images=not args.no_links)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,394 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 - for information on the respective copyright owner
+# see the NOTICE file and/or the repository
+# <https://github.com/boschresearch/amira-blender-rendering>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Columnar index of all annotations of a dataset.
+
+Reading the annotations of a dataset requires to open and parse one json file
+per image. The index collects the annotations of all images of one convention
+(OpenCV/OpenGL) in columnar arrays, which are stored in a single file next to
+Dataset.cfg. The file is memory-mapped when opened, such that opening even
+large datasets is fast, and queries on all objects can be vectorized.
+
+File layout: 8 bytes magic, 8 bytes header length, json header, followed by the
+raw column data. Each column starts at an offset aligned to 64 bytes.
+Object columns contain one row per annotated object. The objects of sample i are
+stored in rows object_offsets[i]:object_offsets[i + 1].
+"""
+
+import os
+import json
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from abr_dataset_tools import get_logger
+logger = get_logger()
+
+_MAGIC = b'ABRIDX01'
+_ALIGN = 64
+_VERSION = 1
+
+# object columns with numeric data: name -> (dtype, shape per object)
+_NUMERIC_COLUMNS = {
+    'sample': (np.int64, ()),
+    'object_class_id': (np.int64, ()),
+    'object_id': (np.int64, ()),
+    'visible': (np.int8, ()),           # 1: visible, 0: not visible, -1: unknown (old datasets)
+    'q': (np.float64, (4,)),            # WXYZ
+    't': (np.float64, (3,)),
+    'camera_q': (np.float64, (4,)),     # WXYZ
+    'camera_t': (np.float64, (3,)),
+    'corners2d': (np.float64, (2, 2)),
+    'corners3d': (np.float64, (9, 2)),
+    'aabb': (np.float64, (9, 3)),
+    'oobb': (np.float64, (9, 3)),
+}
+# object columns with strings. Stored as fixed length byte strings
+_STRING_COLUMNS = ('object_class_name', 'object_name', 'mask_name')
+
+
+def get_index_path(root: str, convention: str = 'opencv'):
+    """Default location of the annotation index of a dataset, next to Dataset.cfg"""
+    return os.path.join(root, f'Annotations.{convention.lower()}.index')
+
+
+def _get_annotations_path(root: str, convention: str):
+    if convention.lower() == 'opencv':
+        return os.path.join(root, 'Annotations', 'OpenCV')
+    elif convention.lower() == 'opengl':
+        return os.path.join(root, 'Annotations', 'OpenGL')
+    raise ValueError(f'Uknown convention "{convention}"')
+
+
+def _get_fingerprint(root: str, convention: str):
+    """Information to detect if the index is out of date.
+
+    Adding or removing annotation files changes the modification time of the
+    annotation directory. Note that rewriting an existing file in place does not.
+    """
+    ann_path = _get_annotations_path(root, convention)
+    cfg_path = os.path.join(root, 'Dataset.cfg')
+    return {
+        'annotations_mtime_ns': os.stat(ann_path).st_mtime_ns,
+        'config_mtime_ns': os.stat(cfg_path).st_mtime_ns if os.path.exists(cfg_path) else 0,
+    }
+
+
+def _to_array(value, dtype, shape):
+    """Convert a json value to an array of given shape. Missing values (None) are stored as nan"""
+    if value is None:
+        return np.full(shape, np.nan, dtype=dtype)
+    return np.asarray(value, dtype=dtype).reshape(shape)
+
+
+def _parse_files(args):
+    """Parse a chunk of annotation files into columns.
+
+    Args:
+        args(tuple): (directory, list of filename stems, index of first sample)
+
+    Returns:
+        tuple (dict with object columns, np.array with number of objects per sample)
+    """
+    directory, stems, first_sample = args
+    columns = {name: list() for name in list(_NUMERIC_COLUMNS) + list(_STRING_COLUMNS)}
+    counts = np.zeros(len(stems), dtype=np.int64)
+    for i, stem in enumerate(stems):
+        with open(os.path.join(directory, f'{stem}.json'), 'r') as f:
+            annotations = json.load(f)
+        counts[i] = len(annotations)
+        for a in annotations:
+            columns['sample'].append(first_sample + i)
+            for name in ('object_class_id', 'object_id'):
+                columns[name].append(a[name])
+            for name in _STRING_COLUMNS:
+                columns[name].append(str(a[name]))
+            visible = a.get('visible', None)
+            columns['visible'].append(-1 if visible is None else int(bool(visible)))
+            camera_pose = a.get('camera_pose', None) or dict()
+            for name, value in (('q', a['pose']['q']), ('t', a['pose']['t']),
+                                ('camera_q', camera_pose.get('q', None)), ('camera_t', camera_pose.get('t', None))):
+                columns[name].append(_to_array(value, *_NUMERIC_COLUMNS[name]))
+            for name in ('corners2d', 'corners3d', 'aabb', 'oobb'):
+                columns[name].append(_to_array(a['bbox'][name], *_NUMERIC_COLUMNS[name]))
+
+    arrays = dict()
+    for name, (dtype, shape) in _NUMERIC_COLUMNS.items():
+        arrays[name] = np.array(columns[name], dtype=dtype).reshape((-1,) + shape)
+    for name in _STRING_COLUMNS:
+        arrays[name] = np.array([s.encode('utf-8') for s in columns[name]], dtype=np.bytes_)
+    return arrays, counts
+
+
+def build_annotation_index(root: str, convention: str = 'opencv', path: str = None,
+                           num_workers: int = None, chunk_size: int = 1000):
+    """Build the annotation index of a dataset and write it to disk.
+
+    Args:
+        root(str): path to dataset root directory
+
+    Optional Args:
+        convention(str): annotations convention ['opencv' , 'opengl']. Default: 'opencv'
+        path(str): path of the index file. Default: see get_index_path
+        num_workers(int): number of processes to parse annotations. Default: None (cpu count)
+        chunk_size(int): number of annotation files parsed per task. Default: 1000
+
+    Returns:
+        str: path of the index file
+    """
+    path = get_index_path(root, convention) if path is None else path
+    ann_path = _get_annotations_path(root, convention)
+    # fingerprint before listing, such that files added while building render the index stale
+    fingerprint = _get_fingerprint(root, convention)
+    stems = sorted(f.name[:-5] for f in os.scandir(ann_path) if f.is_file() and f.name.endswith('.json'))
+    logger.info(f'Building annotation index for {len(stems)} samples in {ann_path}')
+
+    tasks = [(ann_path, stems[i:i + chunk_size], i) for i in range(0, len(stems), chunk_size)]
+    if num_workers == 1 or len(tasks) <= 1:
+        results = [_parse_files(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            results = list(executor.map(_parse_files, tasks))
+
+    columns = dict()
+    for name, (dtype, shape) in _NUMERIC_COLUMNS.items():
+        parts = [r[0][name] for r in results]
+        columns[name] = np.concatenate(parts) if parts else np.zeros((0,) + shape, dtype=dtype)
+    for name in _STRING_COLUMNS:
+        parts = [r[0][name] for r in results]
+        columns[name] = np.concatenate(parts) if parts else np.zeros(0, dtype='S1')
+    counts = np.concatenate([r[1] for r in results]) if results else np.zeros(0, dtype=np.int64)
+    columns['object_offsets'] = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+    columns['fname'] = np.array([s.encode('utf-8') for s in stems], dtype=np.bytes_) if stems \
+        else np.zeros(0, dtype='S1')
+
+    _write_index(path, columns, {
+        'version': _VERSION,
+        'convention': convention.lower(),
+        'num_samples': len(stems),
+        'num_objects': int(counts.sum()),
+        'fingerprint': fingerprint,
+    })
+    return path
+
+
+def _write_index(path: str, columns: dict, header: dict):
+    """Write columns to an index file. The file is replaced atomically"""
+    header = dict(header)
+    header['columns'] = dict()
+    offset = 0
+    for name, array in columns.items():
+        header['columns'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += -(-array.nbytes // _ALIGN) * _ALIGN
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    # pad header such that data starts aligned
+    header_len = -(-(len(header_bytes) + 16) // _ALIGN) * _ALIGN - 16
+    header_bytes += b' ' * (header_len - len(header_bytes))
+
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    with open(tmp_path, 'wb') as f:
+        f.write(_MAGIC)
+        f.write(np.array(header_len, dtype='<u8').tobytes())
+        f.write(header_bytes)
+        data_start = f.tell()
+        for name, array in columns.items():
+            f.seek(data_start + header['columns'][name]['offset'])
+            f.write(np.ascontiguousarray(array).tobytes())
+        # make sure the file covers the padding of the last column
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+
+
+class AnnotationIndex:
+    """Memory-mapped columnar annotations of a dataset.
+
+    Object columns (one row per object) are accessible as attributes, e.g.
+    index.object_class_id, index.visible, index.q, index.t, index.corners2d.
+    Missing values (e.g. boxes of invisible objects) are nan.
+    """
+
+    def __init__(self, path: str):
+        """Open an existing index file.
+
+        Args:
+            path(str): path to index file
+
+        Raises:
+            RuntimeError: given file is not a valid index file
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(8) != _MAGIC:
+                raise RuntimeError(f'File {path} is not an annotation index')
+            header_len = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+            self.header = json.loads(f.read(header_len).decode('utf-8'))
+        if self.header.get('version', None) != _VERSION:
+            raise RuntimeError(f'Unsupported annotation index version in {path}')
+
+        data_start = 16 + header_len
+        self.columns = dict()
+        for name, col in self.header['columns'].items():
+            dtype, shape = np.dtype(col['dtype']), tuple(col['shape'])
+            if int(np.prod(shape)) == 0:
+                self.columns[name] = np.zeros(shape, dtype=dtype)
+            else:
+                self.columns[name] = np.memmap(path, dtype=dtype, mode='r', offset=data_start + col['offset'],
+                                               shape=shape)
+
+    def __getstate__(self):
+        # memory-maps are re-opened instead of copying all data
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def __getattr__(self, name):
+        columns = self.__dict__.get('columns', dict())
+        if name in columns:
+            return columns[name]
+        raise AttributeError(f'{self.__class__.__name__} has no attribute or column {name}')
+
+    @property
+    def num_samples(self):
+        return self.header['num_samples']
+
+    @property
+    def num_objects(self):
+        return self.header['num_objects']
+
+    @property
+    def fnames(self):
+        """Filename stems of all samples"""
+        return [f.decode('utf-8') for f in self.columns['fname']]
+
+    def is_stale(self, root: str):
+        """Check if the annotations of a dataset changed since the index was built"""
+        try:
+            return _get_fingerprint(root, self.header['convention']) != self.header['fingerprint']
+        except FileNotFoundError:
+            return True
+
+    def object_range(self, index):
+        """Return (start, stop) of the object rows of the sample at given index"""
+        offsets = self.columns['object_offsets']
+        return int(offsets[index]), int(offsets[index + 1])
+
+    def get_annotations(self, index):
+        """Get the annotations of a sample in the same structure as stored in its json file
+
+        Args:
+            index(int): index of sample
+
+        Returns:
+            list(dict): annotations of all objects of the sample
+        """
+        def _to_list(array):
+            return None if np.isnan(array).all() else array.tolist()
+
+        annotations = list()
+        c = self.columns
+        for r in range(*self.object_range(index)):
+            a = {
+                'object_class_name': c['object_class_name'][r].decode('utf-8'),
+                'object_class_id': int(c['object_class_id'][r]),
+                'object_name': c['object_name'][r].decode('utf-8'),
+                'object_id': int(c['object_id'][r]),
+                'mask_name': c['mask_name'][r].decode('utf-8'),
+                'pose': {'q': c['q'][r].tolist(), 't': c['t'][r].tolist()},
+                'bbox': {name: _to_list(c[name][r]) for name in ('corners2d', 'corners3d', 'aabb', 'oobb')}
+            }
+            # old version datasets do not contain these fields
+            if c['visible'][r] >= 0:
+                a['visible'] = bool(c['visible'][r])
+            if not np.isnan(c['camera_q'][r]).all():
+                a['camera_pose'] = {'q': c['camera_q'][r].tolist(), 't': c['camera_t'][r].tolist()}
+            annotations.append(a)
+        return annotations
+
+    def select_objects(self, object_class_id=None, object_class_name=None, visible=None,
+                       min_distance=None, max_distance=None):
+        """Vectorized selection of objects. All given criteria have to be met.
+
+        Optional Args:
+            object_class_id(int or iterable): class id(s) to select
+            object_class_name(str or iterable): class name(s) to select
+            visible(bool): select only (in)visible objects
+            min_distance(float): min distance of object to camera (norm of t)
+            max_distance(float): max distance of object to camera (norm of t)
+
+        Returns:
+            np.array(bool): mask over all object rows
+        """
+        c = self.columns
+        selected = np.ones(self.num_objects, dtype=bool)
+        if object_class_id is not None:
+            selected &= np.isin(c['object_class_id'], np.atleast_1d(object_class_id))
+        if object_class_name is not None:
+            names = [n.encode('utf-8') for n in np.atleast_1d(object_class_name)]
+            selected &= np.isin(c['object_class_name'], names)
+        if visible is not None:
+            selected &= c['visible'] == int(bool(visible))
+        if min_distance is not None or max_distance is not None:
+            distance = np.linalg.norm(c['t'], axis=1)
+            if min_distance is not None:
+                selected &= distance >= min_distance
+            if max_distance is not None:
+                selected &= distance <= max_distance
+        return selected
+
+    def select_samples(self, **kwargs):
+        """Get indexes of all samples that contain at least one object that meets the given criteria.
+
+        Kwargs Args:
+            see select_objects
+
+        Returns:
+            np.array(int): sorted sample indexes
+        """
+        return np.unique(self.columns['sample'][self.select_objects(**kwargs)])
+
+    def __len__(self):
+        return self.num_samples
+
+
+def load_annotation_index(root: str, convention: str = 'opencv', path: str = None,
+                          rebuild: bool = False, num_workers: int = None):
+    """Open the annotation index of a dataset. The index is (re)built if missing or stale.
+
+    Args:
+        root(str): path to dataset root directory
+
+    Optional Args:
+        convention(str): annotations convention ['opencv' , 'opengl']. Default: 'opencv'
+        path(str): path of the index file. Default: see get_index_path
+        rebuild(bool): force rebuilding the index. Default: False
+        num_workers(int): number of processes to build the index. Default: None (cpu count)
+
+    Returns:
+        AnnotationIndex
+    """
+    path = get_index_path(root, convention) if path is None else path
+    if not rebuild and os.path.exists(path):
+        try:
+            index = AnnotationIndex(path)
+            if not index.is_stale(root):
+                return index
+            logger.info(f'Annotation index {path} is out of date')
+        except (RuntimeError, ValueError, OSError) as err:
+            logger.warn(f'Could not open annotation index {path}: {err}')
+    return AnnotationIndex(build_annotation_index(root, convention, path=path, num_workers=num_workers))
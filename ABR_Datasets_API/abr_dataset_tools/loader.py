@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 - for information on the respective copyright owner
+# see the NOTICE file and/or the repository
+# <https://github.com/boschresearch/amira-blender-rendering>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Parallel loading and batch collation of samples.
+
+Samples are loaded in a thread or process pool. The number of samples that are
+loaded ahead of the consumer is bounded. Images of all samples in a batch are
+collated into contiguous arrays, which can be reused between batches.
+"""
+
+import collections
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+# function used to load samples in worker processes, see _init_process
+_process_load_fn = None
+
+
+def _init_process(load_fn):
+    global _process_load_fn
+    _process_load_fn = load_fn
+
+
+def _process_load(index):
+    return _process_load_fn(index)
+
+
+def prefetch_map(fn, items, executor, max_pending: int, ordered: bool = True):
+    """Map fn over items in an executor, with at most max_pending items in flight.
+
+    Args:
+        fn(callable): function to apply
+        items(iterable): arguments for fn
+        executor(concurrent.futures.Executor): executor to run fn in
+        max_pending(int): max number of submitted but not yet consumed items
+
+    Optional Args:
+        ordered(bool): if True, yield results in the order of items. Otherwise as they complete. Default: True
+
+    Yields:
+        results of fn
+    """
+    items = iter(items)
+    pending = collections.deque()
+
+    def _fill():
+        while len(pending) < max(1, max_pending):
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            pending.append(executor.submit(fn, item))
+
+    try:
+        _fill()
+        while pending:
+            if ordered:
+                future = pending.popleft()
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                future = next(f for f in pending if f in done)
+                pending.remove(future)
+            result = future.result()
+            _fill()
+            yield result
+    finally:
+        # consumer stopped early or loading failed
+        for future in pending:
+            future.cancel()
+
+
+class BatchCollator:
+    """Collate a list of samples into a batch.
+
+    Images of equal shape and dtype are stacked into an array of shape (N, ...).
+    Modalities with varying shape are returned as lists, as are the objects of
+    all samples.
+
+    Optional Args:
+        reuse_buffers(bool): if True, image arrays are written into the same buffers
+            for each batch. Arrays of a batch are hence only valid until the next batch
+            is collated. Default: True
+    """
+
+    def __init__(self, reuse_buffers: bool = True):
+        self.reuse_buffers = reuse_buffers
+        self._buffers = dict()
+
+    def _get_buffer(self, modality, shape, dtype):
+        buf = self._buffers.get(modality, None)
+        if buf is not None and buf.dtype == dtype and buf.shape[1:] == shape[1:] and buf.shape[0] >= shape[0]:
+            return buf[:shape[0]]
+        buf = np.empty(shape, dtype=dtype)
+        if self.reuse_buffers:
+            self._buffers[modality] = buf
+        return buf
+
+    def __call__(self, samples):
+        batch = {
+            'image_id': np.array([s['image_id'] for s in samples]),
+            'images': dict(),
+        }
+        if all('objects' in s for s in samples):
+            batch['num_objects'] = np.array([s['num_objects'] for s in samples], dtype=np.int64)
+            batch['objects'] = [s['objects'] for s in samples]
+
+        modalities = samples[0]['images'].keys() if samples else list()
+        for modality in modalities:
+            arrays = [s['images'].get(modality, None) for s in samples]
+            if any(a is None or a.shape != arrays[0].shape or a.dtype != arrays[0].dtype for a in arrays):
+                batch['images'][modality] = arrays
+                continue
+            buf = self._get_buffer(modality, (len(arrays),) + arrays[0].shape, arrays[0].dtype)
+            for k, a in enumerate(arrays):
+                buf[k] = a
+            batch['images'][modality] = buf
+        return batch
+
+
+def iter_batches(load_fn, indexes, batch_size: int, num_workers: int = 4, prefetch: int = 2,
+                 ordered: bool = True, drop_last: bool = False, use_processes: bool = False,
+                 collate_fn=None):
+    """Load samples in parallel and yield collated batches.
+
+    Args:
+        load_fn(callable): loads the sample for a given index. Has to be picklable if use_processes is True
+        indexes(iterable): indexes of samples to load
+        batch_size(int): number of samples per batch
+
+    Optional Args:
+        num_workers(int): number of threads/processes to load samples. Default: 4
+        prefetch(int): number of batches loaded ahead. Default: 2
+        ordered(bool): if True, samples are batched in the order of indexes. Otherwise in order
+            of completion, which avoids waiting for slow samples. Default: True
+        drop_last(bool): drop the last batch if it is smaller than batch_size. Default: False
+        use_processes(bool): load samples in processes instead of threads. Default: False
+        collate_fn(callable): function to collate a list of samples. Default: None (BatchCollator())
+
+    Yields:
+        batches as returned by collate_fn
+    """
+    collate_fn = BatchCollator() if collate_fn is None else collate_fn
+    max_pending = max(1, prefetch) * batch_size
+    if use_processes:
+        executor = ProcessPoolExecutor(max_workers=num_workers, initializer=_init_process, initargs=(load_fn,))
+        fn = _process_load
+    else:
+        executor = ThreadPoolExecutor(max_workers=num_workers)
+        fn = load_fn
+
+    try:
+        samples = list()
+        results = prefetch_map(fn, indexes, executor, max_pending, ordered=ordered)
+        try:
+            for sample in results:
+                samples.append(sample)
+                if len(samples) == batch_size:
+                    yield collate_fn(samples)
+                    samples = list()
+            if samples and not drop_last:
+                yield collate_fn(samples)
+        finally:
+            results.close()
+    finally:
+        executor.shutdown(wait=True)
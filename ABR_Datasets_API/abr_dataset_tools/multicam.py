@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 - for information on the respective copyright owner
+# see the NOTICE file and/or the repository
+# <https://github.com/boschresearch/amira-blender-rendering>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Joint view on datasets rendered with several cameras.
+
+Scenes rendered with several cameras (scene_setup.cameras) store the images of
+each camera in a separate dataset {base_path}-{camera}. MultiCameraABRDataset
+opens all of them and joins them by (scene, view), such that synchronized
+samples of all cameras can be loaded at once.
+"""
+
+import os
+import re
+import glob
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+from abr_dataset_tools import get_logger
+from abr_dataset_tools.abr import ABRDataset
+from abr_dataset_tools.utils import expandpath, parse_dataset_configs
+
+logger = get_logger()
+
+_fname_pattern = re.compile(r's(\d+)_v(\d+)')
+
+
+def _get_cfg_list(cfg, section, key):
+    """Read a comma separated list from a configuration"""
+    if section not in cfg.sections():
+        return list()
+    return [v.strip() for v in cfg[section].get(key, '').split(',') if v.strip()]
+
+
+def find_camera_datasets(path: str):
+    """Find the datasets of all cameras that rendered the same scenes.
+
+    Args:
+        path(str): either the base path of the datasets (i.e. dataset.base_path,
+            without camera suffix) or the path to the dataset of one of the cameras
+
+    Returns:
+        OrderedDict: camera name -> dataset path, in the order of scene_setup.cameras if available
+
+    Raises:
+        FileNotFoundError: no camera dataset found
+    """
+    path = expandpath(path).rstrip(os.sep)
+    base, cameras = path, list()
+    if os.path.exists(os.path.join(path, 'Dataset.cfg')):
+        cameras = _get_cfg_list(parse_dataset_configs(path), 'scene_setup', 'cameras')
+        for cam in cameras:
+            if path.endswith(f'-{cam}'):
+                base = path[:-len(cam) - 1]
+                break
+
+    # discover siblings, which are not necessarily listed in the configuration
+    found = dict()
+    for p in glob.glob(f'{glob.escape(base)}-*'):
+        if os.path.isdir(p) and os.path.exists(os.path.join(p, 'Dataset.cfg')):
+            found[p[len(base) + 1:]] = p
+    if not found:
+        if os.path.exists(os.path.join(path, 'Dataset.cfg')):
+            # single camera dataset
+            return collections.OrderedDict([(os.path.basename(path), path)])
+        raise FileNotFoundError(f'No camera datasets found for {path}')
+
+    order = [c for c in cameras if c in found] + sorted(c for c in found if c not in cameras)
+    return collections.OrderedDict((c, found[c]) for c in order)
+
+
+def parse_scene_view(fname: str):
+    """Get (scene, view) from a filename such as s000001_v002. Returns None if the filename does not match"""
+    match = _fname_pattern.fullmatch(fname)
+    return None if match is None else (int(match.group(1)), int(match.group(2)))
+
+
+class MultiCameraABRDataset:
+    """Synchronized samples of all cameras of a dataset"""
+
+    def __init__(self, path: str, cameras: list = None, convention: str = 'opencv',
+                 num_workers: int = None, **kwargs):
+        """
+        Args:
+            path(str): base path of the datasets or path to the dataset of one of the cameras
+
+        Optional Args:
+            cameras(list): cameras to use. Default: None (all discovered cameras)
+            convention(str): annotations convention ['opencv' , 'opengl']. Default: 'opencv'
+            num_workers(int): number of threads to decode images of all cameras. Default: None (one per camera)
+
+        Kwargs Args:
+            passed to ABRDataset of each camera, e.g. transform, cache, annotation_index
+
+        Raises:
+            FileNotFoundError: no camera dataset found
+            ValueError: requested camera not found
+        """
+        paths = find_camera_datasets(path)
+        if cameras is not None:
+            missing = [c for c in cameras if c not in paths]
+            if missing:
+                raise ValueError(f'Cameras {missing} not found. Available: {list(paths)}')
+            paths = collections.OrderedDict((c, paths[c]) for c in cameras)
+        self.paths = paths
+        self.datasets = collections.OrderedDict(
+            (cam, ABRDataset(p, convention=convention, **kwargs)) for cam, p in paths.items())
+
+        # join samples of all cameras by filename, i.e. by (scene, view)
+        fnames = None
+        for dset in self.datasets.values():
+            fnames = set(dset.fnames) if fnames is None else fnames & set(dset.fnames)
+        for cam, dset in self.datasets.items():
+            if len(dset.fnames) != len(fnames):
+                logger.warn(f'{len(dset.fnames) - len(fnames)} samples of camera {cam} are missing for other cameras')
+        self.fnames = sorted(fnames, key=lambda f: (parse_scene_view(f) or (-1, -1), f))
+        self._local_index = dict()
+        for cam, dset in self.datasets.items():
+            lookup = {f: i for i, f in enumerate(dset.fnames)}
+            self._local_index[cam] = [lookup[f] for f in self.fnames]
+
+        self.num_workers = len(self.datasets) if num_workers is None else num_workers
+        self._executor = None
+
+    @property
+    def cameras(self):
+        return list(self.datasets.keys())
+
+    @property
+    def parallel_cameras(self):
+        """Cameras set up as parallel (stereo) cameras, see postprocess.parallel_cameras"""
+        cfg = parse_dataset_configs(next(iter(self.paths.values())))
+        patterns = _get_cfg_list(cfg, 'postprocess', 'parallel_cameras')
+        # camera names are matched as in the render manager
+        return [cam for cam in self.cameras if any(p in cam for p in patterns)]
+
+    def scene_view(self, index: int):
+        """Return (scene, view) of the sample at given index"""
+        return parse_scene_view(self.fnames[index])
+
+    def local_index(self, camera: str, index: int):
+        """Index of a sample within the dataset of the given camera"""
+        return self._local_index[camera][index]
+
+    def _map(self, fn, items):
+        if self.num_workers <= 1 or len(items) <= 1:
+            return [fn(item) for item in items]
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.num_workers)
+        return list(self._executor.map(fn, items))
+
+    def get_sample(self, index: int, modalities=None, convert: bool = None, cameras=None):
+        """Load synchronized samples of all cameras. Images of all cameras are decoded in parallel.
+
+        Args:
+            index(int): index of sample
+
+        Optional Args:
+            modalities(iterable): modalities to load. Default: None (all). See ABRDataset.load_sample
+            convert(bool): convert images to float/int [0, 255]. Default: None. See ABRDataset.load_sample
+            cameras(list): cameras to load. Default: None (all)
+
+        Returns:
+            OrderedDict: camera name -> sample
+
+        Raises:
+            OverflowError: index is out of dataset bound
+        """
+        if not 0 <= index < len(self):
+            raise OverflowError('Given index outside dataset size')
+        cameras = self.cameras if cameras is None else cameras
+
+        def _load(cam):
+            return self.datasets[cam].get_sample(self._local_index[cam][index], modalities=modalities,
+                                                 convert=convert)
+
+        return collections.OrderedDict(zip(cameras, self._map(_load, cameras)))
+
+    def get_stereo_pair(self, index: int, modalities=None, convert: bool = None):
+        """Load samples of the two parallel cameras, see parallel_cameras
+
+        Returns:
+            tuple with samples of both cameras, in the order of parallel_cameras
+
+        Raises:
+            RuntimeError: the dataset does not contain exactly two parallel cameras
+        """
+        cameras = self.parallel_cameras
+        if len(cameras) != 2:
+            raise RuntimeError(f'Expected two parallel cameras, found {cameras}')
+        samples = self.get_sample(index, modalities=modalities, convert=convert, cameras=cameras)
+        return tuple(samples.values())
+
+    def close(self):
+        """Stop decoding threads"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_executor'] = None
+        return state
+
+    def __len__(self):
+        return len(self.fnames)
+
+    def __getitem__(self, index):
+        return self.get_sample(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.get_sample(i)
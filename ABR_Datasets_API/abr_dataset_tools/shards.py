@@ -0,0 +1,392 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 - for information on the respective copyright owner
+# see the NOTICE file and/or the repository
+# <https://github.com/boschresearch/amira-blender-rendering>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Sequential shard format for datasets rendered with ABR.
+
+A dataset consists of many small files in several directories, which is slow
+to read from network storage. pack_shards converts a dataset into a few large
+(uncompressed) tar files. All files of a sample are stored consecutively with
+their original encoded bytes, named {sample}/{file}, e.g.
+
+    s000000_v000/rgb.png
+    s000000_v000/range.exr
+    s000000_v000/depth.png
+    s000000_v000/backdrop.png
+    s000000_v000/mask_s0_c0.png
+    s000000_v000/opencv.json
+    s000000_v000/opengl.json
+
+Next to each shard, an index file (.index.json) stores the byte offsets of all
+files, which allows random access. The output directory further contains
+Dataset.cfg and a manifest (shards.json) listing all shards.
+
+ShardDataset reads shards either sequentially (optionally shuffled) or by index.
+
+Usage:
+
+    python -m abr_dataset_tools.shards /path/to/dataset /path/to/output --samples-per-shard 1000
+"""
+
+import os
+import io
+import sys
+import json
+import shutil
+import random
+import tarfile
+import argparse
+import imageio
+
+from abr_dataset_tools import get_logger
+from abr_dataset_tools.abr import build_sample
+from abr_dataset_tools.utils import expandpath, build_directory_info, parse_dataset_configs, build_camera_info
+
+logger = get_logger()
+
+MANIFEST_FILENAME = 'shards.json'
+_VERSION = 1
+_TAR_BLOCK = tarfile.BLOCKSIZE
+
+
+def _get_sample_files(dir_info, stem):
+    """Get (member name, path) of all existing files of a sample"""
+    files = [
+        ('rgb.png', os.path.join(dir_info['images']['rgb'], f'{stem}.png')),
+        ('range.exr', os.path.join(dir_info['images']['range'], f'{stem}.exr')),
+        ('depth.png', os.path.join(dir_info['images']['depth'], f'{stem}.png')),
+        ('backdrop.png', os.path.join(dir_info['images']['backdrop'], f'{stem}.png')),
+    ]
+    # mask names are only known from the annotations
+    ann_path = os.path.join(dir_info['annotations']['opencv'], f'{stem}.json')
+    if not os.path.exists(ann_path):
+        ann_path = os.path.join(dir_info['annotations']['opengl'], f'{stem}.json')
+    if os.path.exists(ann_path):
+        with open(ann_path, 'r') as f:
+            for a in json.load(f):
+                name = f"mask{a['mask_name']}.png"
+                files.append((name, os.path.join(dir_info['images']['mask'], f"{stem}{a['mask_name']}.png")))
+    files += [
+        ('opencv.json', os.path.join(dir_info['annotations']['opencv'], f'{stem}.json')),
+        ('opengl.json', os.path.join(dir_info['annotations']['opengl'], f'{stem}.json')),
+    ]
+    return [(name, path) for name, path in files if os.path.exists(path)]
+
+
+class _ShardWriter:
+    """Write samples to a tar file and keep track of the data offsets of all members"""
+
+    def __init__(self, path):
+        self.path = path
+        self.tar = tarfile.open(path, mode='w', format=tarfile.PAX_FORMAT)
+        self.samples = list()
+        self.nbytes = 0
+
+    def add_sample(self, key, files):
+        entry = {'key': key, 'files': dict()}
+        for name, path in files:
+            with open(path, 'rb') as f:
+                data = f.read()
+            info = tarfile.TarInfo(f'{key}/{name}')
+            info.size = len(data)
+            info.mtime = int(os.path.getmtime(path))
+            info.mode = 0o644
+            self.tar.addfile(info, io.BytesIO(data))
+            # the data of a member ends at the current offset of the archive (padded to full blocks)
+            padded = -(-len(data) // _TAR_BLOCK) * _TAR_BLOCK
+            entry['files'][name] = [self.tar.offset - padded, len(data)]
+            self.nbytes += len(data)
+        self.samples.append(entry)
+
+    def close(self):
+        self.tar.close()
+        with open(get_shard_index_path(self.path), 'w') as f:
+            json.dump({'version': _VERSION, 'samples': self.samples}, f)
+
+
+def get_shard_index_path(shard_path):
+    return f'{shard_path}.index.json'
+
+
+def pack_shards(root: str, output: str, samples_per_shard: int = 1000, max_shard_bytes: int = None,
+                prefix: str = 'shard'):
+    """Convert a dataset into sequential shards.
+
+    Samples are stored in the order of their filenames. A new shard is started
+    when samples_per_shard or max_shard_bytes is reached, whichever comes first.
+
+    Args:
+        root(str): path to dataset root directory
+        output(str): path to output directory
+
+    Optional Args:
+        samples_per_shard(int): max number of samples per shard. Default: 1000
+        max_shard_bytes(int): max (approximate) size of a shard in bytes. Default: None (unlimited)
+        prefix(str): filename prefix of the shards. Default: 'shard'
+
+    Returns:
+        dict: the manifest of the shards
+    """
+    root = expandpath(root, check_file=True)
+    output = expandpath(output)
+    os.makedirs(output, exist_ok=True)
+    dir_info = build_directory_info(root)
+    stems = sorted(f.name[:-4] for f in os.scandir(dir_info['images']['rgb'])
+                   if f.is_file() and f.name.endswith('.png'))
+    logger.info(f'Packing {len(stems)} samples from {root} into shards in {output}')
+
+    manifest = {'version': _VERSION, 'num_samples': 0, 'shards': list()}
+    writer = None
+    for stem in stems:
+        if writer is not None:
+            too_large = max_shard_bytes is not None and writer.nbytes >= max_shard_bytes
+            shard_full = len(writer.samples) >= samples_per_shard or too_large
+            if shard_full:
+                writer.close()
+                writer = None
+        if writer is None:
+            name = f'{prefix}-{len(manifest["shards"]):06d}.tar'
+            writer = _ShardWriter(os.path.join(output, name))
+            manifest['shards'].append({'name': name, 'num_samples': 0})
+        writer.add_sample(stem, _get_sample_files(dir_info, stem))
+        manifest['shards'][-1]['num_samples'] += 1
+        manifest['num_samples'] += 1
+    if writer is not None:
+        writer.close()
+
+    shutil.copyfile(os.path.join(root, 'Dataset.cfg'), os.path.join(output, 'Dataset.cfg'))
+    with open(os.path.join(output, MANIFEST_FILENAME), 'w') as f:
+        json.dump(manifest, f, indent=0)
+    logger.info(f'Wrote {manifest["num_samples"]} samples to {len(manifest["shards"])} shards')
+    return manifest
+
+
+def shuffle_buffer(iterable, size: int, rng: random.Random = None):
+    """Approximately shuffle a stream using a buffer of given size
+
+    Args:
+        iterable: stream to shuffle
+        size(int): number of buffered elements. If < 2, the stream is not shuffled
+
+    Optional Args:
+        rng(random.Random): random number generator. Default: None (module random)
+    """
+    rng = random if rng is None else rng
+    if size < 2:
+        yield from iterable
+        return
+    buffer = list()
+    for item in iterable:
+        if len(buffer) < size:
+            buffer.append(item)
+            continue
+        i = rng.randrange(size)
+        yield buffer[i]
+        buffer[i] = item
+    rng.shuffle(buffer)
+    yield from buffer
+
+
+class ShardReader:
+    """Read raw samples from a single shard, either sequentially or by index.
+
+    Raw samples are tuples (key, files), where files is a dict from file name
+    (e.g. 'rgb.png', 'opencv.json') to the encoded bytes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._index = None
+
+    @property
+    def index(self):
+        """Offsets of all files of all samples. Loaded on first access"""
+        if self._index is None:
+            with open(get_shard_index_path(self.path), 'r') as f:
+                self._index = json.load(f)['samples']
+        return self._index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        """Read all samples sequentially"""
+        key, files = None, dict()
+        with tarfile.open(self.path, mode='r|') as tar:
+            for info in tar:
+                if not info.isfile():
+                    continue
+                member_key, name = info.name.split('/', 1)
+                if member_key != key and key is not None:
+                    yield key, files
+                    files = dict()
+                key = member_key
+                files[name] = tar.extractfile(info).read()
+        if key is not None:
+            yield key, files
+
+    def get(self, index: int, names=None):
+        """Read a sample by index within the shard
+
+        Args:
+            index(int): index of the sample in the shard
+
+        Optional Args:
+            names(iterable): only read the files with given names. Default: None (all files)
+
+        Returns:
+            tuple (key, files)
+        """
+        entry = self.index[index]
+        files = dict()
+        with open(self.path, 'rb') as f:
+            for name, (offset, size) in entry['files'].items():
+                if names is not None and name not in names:
+                    continue
+                f.seek(offset)
+                files[name] = f.read(size)
+        return entry['key'], files
+
+
+def decode_sample(files: dict, image_id=None, modalities=None, convert: bool = None,
+                  convention: str = 'opencv', cam_info=None):
+    """Decode a raw sample read from a shard, see ABRDataset.load_sample
+
+    Args:
+        files(dict): file name to encoded bytes
+
+    Optional Args:
+        image_id(numeric): id of the sample. Default: None
+        modalities(iterable): modalities to decode. Default: None (all)
+        convert(bool): convert images to float/int [0, 255]. Default: None. See build_sample
+        convention(str): annotations convention ['opencv' , 'opengl']. Default: 'opencv'
+        cam_info(dict): camera info to check projected 3d boxes. Default: None
+
+    Returns:
+        sample(dict)
+    """
+    def read_annotations():
+        return json.loads(files[f'{convention}.json'].decode('utf-8'))
+
+    def read_image(modality, suffix=''):
+        ext = 'exr' if modality == 'range' else 'png'
+        return imageio.imread(files[f'{modality}{suffix}.{ext}'], format=f'.{ext}')
+
+    return build_sample(image_id, read_annotations, read_image, modalities=modalities, convert=convert,
+                        cam_info=cam_info)
+
+
+class ShardDataset:
+    """Dataset stored in shards, see pack_shards"""
+
+    def __init__(self, path: str, convention: str = 'opencv'):
+        """
+        Args:
+            path(str): directory with shards and manifest
+
+        Optional Args:
+            convention(str): annotations convention ['opencv' , 'opengl']. Default: 'opencv'
+        """
+        self.path = expandpath(path, check_file=True)
+        if convention not in ('opencv', 'opengl'):
+            raise ValueError(f'Uknown convention "{convention}"')
+        self.convention = convention
+        with open(os.path.join(self.path, MANIFEST_FILENAME), 'r') as f:
+            self.manifest = json.load(f)
+        self.shards = [ShardReader(os.path.join(self.path, s['name'])) for s in self.manifest['shards']]
+        self._first_index = [0]
+        for s in self.manifest['shards']:
+            self._first_index.append(self._first_index[-1] + s['num_samples'])
+        self.cam_info = build_camera_info(parse_dataset_configs(self.path)['camera_info'])
+
+    def __len__(self):
+        return self.manifest['num_samples']
+
+    def _locate(self, index):
+        if not 0 <= index < len(self):
+            raise OverflowError('Given index outside dataset size')
+        for s in range(len(self.shards)):
+            if index < self._first_index[s + 1]:
+                return s, index - self._first_index[s]
+
+    def get_raw(self, index: int):
+        """Read the raw (encoded) sample at given index, see ShardReader.get"""
+        shard, local_index = self._locate(index)
+        return self.shards[shard].get(local_index)
+
+    def get_sample(self, index: int, modalities=None, convert: bool = None):
+        """Random access to the sample at given index, see ABRDataset.get_sample"""
+        _, files = self.get_raw(index)
+        return decode_sample(files, image_id=index, modalities=modalities, convert=convert,
+                             convention=self.convention, cam_info=self.cam_info)
+
+    def __getitem__(self, index):
+        return self.get_sample(index)
+
+    def iter_raw(self, shuffle_shards: bool = False, buffer_size: int = 0, seed: int = None,
+                 rank: int = 0, world_size: int = 1):
+        """Stream raw samples, reading shards sequentially.
+
+        Optional Args:
+            shuffle_shards(bool): read shards in random order. Default: False
+            buffer_size(int): size of shuffle buffer for samples. Default: 0 (no shuffling)
+            seed(int): seed for shuffling. Use the same seed on all ranks. Default: None
+            rank(int): rank of this reader, when shards are distributed to several readers. Default: 0
+            world_size(int): number of readers. Default: 1
+
+        Yields:
+            tuple (image_id, files)
+        """
+        rng = random.Random(seed)
+        order = list(range(len(self.shards)))
+        if shuffle_shards:
+            rng.shuffle(order)
+        order = order[rank::world_size]
+
+        def _stream():
+            for s in order:
+                for i, (_, files) in enumerate(self.shards[s]):
+                    yield self._first_index[s] + i, files
+
+        yield from shuffle_buffer(_stream(), buffer_size, rng)
+
+    def iter_samples(self, modalities=None, convert: bool = None, **kwargs):
+        """Stream decoded samples, see iter_raw for optional arguments"""
+        for image_id, files in self.iter_raw(**kwargs):
+            yield decode_sample(files, image_id=image_id, modalities=modalities, convert=convert,
+                                convention=self.convention, cam_info=self.cam_info)
+
+    def __iter__(self):
+        return self.iter_samples()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pack a dataset rendered with ABR into sequential shards')
+    parser.add_argument('root_path', type=str, help='(Absolute) Path to dataset root directory')
+    parser.add_argument('output_path', type=str, help='Output directory for shards')
+    parser.add_argument('--samples-per-shard', type=int, default=1000, help='Max number of samples per shard')
+    parser.add_argument('--max-shard-mb', type=float, default=None, help='Max size of a shard in MB')
+    parser.add_argument('--prefix', type=str, default='shard', help='Filename prefix of shards')
+    args = parser.parse_args(argv)
+
+    max_bytes = None if args.max_shard_mb is None else int(args.max_shard_mb * 1024 * 1024)
+    pack_shards(args.root_path, args.output_path, samples_per_shard=args.samples_per_shard,
+                max_shard_bytes=max_bytes, prefix=args.prefix)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
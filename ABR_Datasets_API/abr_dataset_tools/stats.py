@@ -0,0 +1,364 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 - for information on the respective copyright owner
+# see the NOTICE file and/or the repository
+# <https://github.com/boschresearch/amira-blender-rendering>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compute statistics of a dataset rendered with ABR.
+
+Statistics on annotations (per-class instance counts, visibility, bounding box
+sizes and aspect ratios, pose coverage) are computed vectorized on the
+annotation index. Statistics on images (depth and range values) require to
+decode images, which is done in parallel in a process pool. Each worker
+accumulates histograms, which are merged afterwards. Quantiles are estimated
+from histograms with logarithmic bins, with a relative error below 1%.
+
+Usage:
+
+    python -m abr_dataset_tools.stats /path/to/dataset --workers 8 --output stats.json
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from abr_dataset_tools import get_logger
+from abr_dataset_tools.abr import ABRDataset
+from abr_dataset_tools.index import load_annotation_index, get_index_path
+from abr_dataset_tools.utils import parse_dataset_configs, quaternion_to_rotation_matrix
+
+logger = get_logger()
+
+
+class Histogram:
+    """Histogram with fixed bins, which can be filled incrementally and merged
+
+    Args:
+        edges(np.array): bin edges
+    """
+
+    def __init__(self, edges):
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.counts = np.zeros(len(self.edges) - 1, dtype=np.int64)
+        self.underflow = 0
+        self.overflow = 0
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[np.isfinite(values)]
+        self.underflow += int(np.count_nonzero(values < self.edges[0]))
+        self.overflow += int(np.count_nonzero(values > self.edges[-1]))
+        self.counts += np.histogram(values, self.edges)[0]
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        return self
+
+    def to_dict(self):
+        return {
+            'edges': self.edges.tolist(),
+            'counts': self.counts.tolist(),
+            'underflow': self.underflow,
+            'overflow': self.overflow,
+        }
+
+
+class QuantileSketch:
+    """Mergeable sketch of a distribution of positive values.
+
+    Values are counted in logarithmically spaced bins, such that quantiles can
+    be estimated with bounded relative error (10 ** (1 / bins_per_decade) - 1).
+    Min, max, mean and the number of values are tracked exactly.
+
+    Optional Args:
+        lo(float): lower bound of binned range. Smaller values go to the first bin. Default: 1e-4
+        hi(float): upper bound of binned range. Larger values go to the last bin. Default: 1e4
+        bins_per_decade(int): resolution. Default: 256
+    """
+
+    def __init__(self, lo: float = 1e-4, hi: float = 1e4, bins_per_decade: int = 256):
+        self.lo, self.hi = lo, hi
+        self.bins_per_decade = bins_per_decade
+        self.counts = np.zeros(int(np.ceil(np.log10(hi / lo) * bins_per_decade)), dtype=np.int64)
+        self.count = 0
+        self.sum = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def add(self, values):
+        """Add values. Non-finite and non-positive values are ignored"""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[np.isfinite(values) & (values > 0)]
+        if values.size == 0:
+            return
+        idx = np.floor(np.log10(values / self.lo) * self.bins_per_decade).astype(np.int64)
+        self.counts += np.bincount(np.clip(idx, 0, len(self.counts) - 1), minlength=len(self.counts))
+        self.count += values.size
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantile(self, q: float):
+        """Estimate the q-quantile, q in [0, 1]"""
+        if self.count == 0:
+            return float('nan')
+        cumsum = np.cumsum(self.counts)
+        b = int(np.searchsorted(cumsum, q * self.count, side='left'))
+        b = min(b, len(self.counts) - 1)
+        # geometric center of the bin
+        value = self.lo * 10 ** ((b + 0.5) / self.bins_per_decade)
+        return float(np.clip(value, self.min, self.max))
+
+    def to_dict(self, quantiles=(0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)):
+        return {
+            'count': self.count,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+            'mean': self.sum / self.count if self.count else None,
+            'quantiles': {str(q): self.quantile(q) for q in quantiles},
+        }
+
+
+def _viewpoints(q, t):
+    """Direction from object to camera in object coordinates, as (azimuth, elevation) in degrees.
+
+    Args:
+        q(np.array(N, 4)): object rotations (WXYZ) relative to the camera
+        t(np.array(N, 3)): object translations relative to the camera
+    """
+    R = quaternion_to_rotation_matrix(q / np.linalg.norm(q, axis=1, keepdims=True))
+    # camera (origin) relative to the object, rotated into the object frame: R^T (-t)
+    v = -np.einsum('nji,nj->ni', R, t)
+    v /= np.linalg.norm(v, axis=1, keepdims=True)
+    return np.degrees(np.arctan2(v[:, 1], v[:, 0])), np.degrees(np.arcsin(np.clip(v[:, 2], -1, 1)))
+
+
+def compute_annotation_statistics(index, az_bins: int = 24, el_bins: int = 12):
+    """Compute statistics on annotations of all objects, vectorized on an annotation index
+
+    Args:
+        index(AnnotationIndex): annotation index of a dataset
+
+    Optional Args:
+        az_bins(int): number of azimuth bins for pose coverage. Default: 24
+        el_bins(int): number of elevation bins for pose coverage. Default: 12
+
+    Returns:
+        dict with statistics, in total and per class
+    """
+    names = np.asarray(index.object_class_name)
+    visible = np.asarray(index.visible)
+    t = np.asarray(index.t)
+    q = np.asarray(index.q)
+    corners2d = np.asarray(index.corners2d)
+    extent = np.abs(corners2d[:, 1, :] - corners2d[:, 0, :])
+    size = np.sqrt(extent[:, 0] * extent[:, 1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        aspect = extent[:, 0] / extent[:, 1]
+    distance = np.linalg.norm(t, axis=1)
+    valid_pose = np.isfinite(q).all(axis=1) & np.isfinite(t).all(axis=1) & (distance > 0)
+    az = np.full(len(q), np.nan)
+    el = np.full(len(q), np.nan)
+    if valid_pose.any():
+        az[valid_pose], el[valid_pose] = _viewpoints(q[valid_pose], t[valid_pose])
+
+    size_edges = np.concatenate(([0], np.logspace(0, 4, 41)))
+    aspect_edges = np.logspace(-2, 2, 41)
+    # translations are given in the units of the dataset (see postprocess unit conversion)
+    distance_edges = np.logspace(-3, 4, 71)
+
+    def _stats(selected):
+        vis = selected & (visible != 0)
+        coverage, _, _ = np.histogram2d(az[vis & valid_pose], el[vis & valid_pose],
+                                        bins=(az_bins, el_bins), range=((-180, 180), (-90, 90)))
+        h_size, h_aspect, h_distance = Histogram(size_edges), Histogram(aspect_edges), Histogram(distance_edges)
+        h_size.add(size[vis])
+        h_aspect.add(aspect[vis])
+        h_distance.add(distance[vis])
+        known = selected & (visible >= 0)
+        return {
+            'instances': int(np.count_nonzero(selected)),
+            'visible': int(np.count_nonzero(selected & (visible == 1))),
+            'visibility_rate': float(np.count_nonzero(selected & (visible == 1)) / max(1, np.count_nonzero(known))),
+            'bbox_size_px': h_size.to_dict(),
+            'bbox_aspect': h_aspect.to_dict(),
+            'distance': h_distance.to_dict(),
+            'viewpoint_coverage': float(np.count_nonzero(coverage) / coverage.size),
+            'viewpoint_histogram': coverage.astype(np.int64).tolist(),
+        }
+
+    stats = {
+        'num_samples': index.num_samples,
+        'num_objects': index.num_objects,
+        'total': _stats(np.ones(len(names), dtype=bool)),
+        'classes': dict(),
+    }
+    h_objects = Histogram(np.arange(-0.5, 100.5))
+    h_objects.add(np.diff(np.asarray(index.object_offsets)))
+    stats['objects_per_sample'] = h_objects.to_dict()
+    for name in np.unique(names):
+        stats['classes'][name.decode('utf-8')] = _stats(names == name)
+    return stats
+
+
+# dataset used by worker processes, see _init_worker
+_worker_dataset = None
+
+
+def _init_worker(dataset):
+    global _worker_dataset
+    _worker_dataset = dataset
+
+
+def _image_statistics(args):
+    """Accumulate depth/range statistics for a chunk of samples in a worker"""
+    indexes, modalities, depth_scale = args
+    sketches = {m: QuantileSketch() for m in modalities}
+    for i in indexes:
+        images = _worker_dataset.load_sample(i, modalities=modalities, convert=False)['images']
+        if 'depth' in images:
+            # depth is stored as integer, 0 denotes invalid values
+            sketches['depth'].add(images['depth'][images['depth'] > 0] / depth_scale)
+        if 'range' in images:
+            # background pixels have huge range values (blender uses 1e10)
+            sketches['range'].add(images['range'][images['range'] < sketches['range'].hi])
+    return len(indexes), sketches
+
+
+def compute_image_statistics(dataset, indexes, modalities=('depth', 'range'), num_workers: int = None,
+                             chunk_size: int = 64):
+    """Compute statistics on depth and range images in parallel
+
+    Args:
+        dataset(ABRDataset): dataset to process
+        indexes(iterable): indexes of samples to process
+
+    Optional Args:
+        modalities(iterable): subset of ('depth', 'range'). Default: both
+        num_workers(int): number of processes. Default: None (cpu count)
+        chunk_size(int): number of samples per task. Default: 64
+
+    Returns:
+        dict modality -> QuantileSketch (values in m)
+    """
+    indexes = list(indexes)
+    modalities = tuple(modalities)
+    cfg = parse_dataset_configs(dataset.root)
+    depth_scale = float(cfg['postprocess'].get('depth_scale', 1e4)) if 'postprocess' in cfg.sections() else 1e4
+    tasks = [(indexes[i:i + chunk_size], modalities, depth_scale) for i in range(0, len(indexes), chunk_size)]
+
+    sketches = {m: QuantileSketch() for m in modalities}
+    done = 0
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker, initargs=(dataset,)) as executor:
+        futures = [executor.submit(_image_statistics, t) for t in tasks]
+        for future in as_completed(futures):
+            n, partial = future.result()
+            for m in modalities:
+                sketches[m].merge(partial[m])
+            done += n
+            logger.info(f'Processed images of {done}/{len(indexes)} samples')
+    return sketches
+
+
+def compute_statistics(root: str, convention: str = 'opencv', image_stride: int = 1,
+                       image_modalities=('depth', 'range'), num_workers: int = None):
+    """Compute statistics of a dataset
+
+    Args:
+        root(str): path to dataset root directory
+
+    Optional Args:
+        convention(str): annotations convention ['opencv' , 'opengl']. Default: 'opencv'
+        image_stride(int): process images of every n-th sample only. Default: 1 (all)
+        image_modalities(iterable): images to process, subset of ('depth', 'range'). Default: both
+        num_workers(int): number of processes. Default: None (cpu count)
+
+    Returns:
+        dict: the report
+    """
+    dataset = ABRDataset(root, convention=convention, num_workers=num_workers)
+    index = dataset.annotation_index
+    if index is None:
+        # index could not be written to the dataset directory
+        tmp_path = os.path.join(tempfile.mkdtemp(), os.path.basename(get_index_path(dataset.root, convention)))
+        index = load_annotation_index(dataset.root, convention, path=tmp_path, num_workers=num_workers)
+    report = {
+        'root': dataset.root,
+        'convention': convention,
+        'annotations': compute_annotation_statistics(index),
+    }
+    if image_modalities and image_stride > 0:
+        indexes = range(0, len(dataset.fnames), image_stride)
+        sketches = compute_image_statistics(dataset, indexes, image_modalities, num_workers=num_workers)
+        report['images'] = {f'{m}_m': s.to_dict() for m, s in sketches.items()}
+        report['images']['num_samples'] = len(indexes)
+    return report
+
+
+def print_report(report):
+    """Print a summary of a statistics report"""
+    ann = report['annotations']
+    print(f"Dataset {report['root']}: {ann['num_samples']} samples, {ann['num_objects']} objects")
+    print(f"{'class':<30} {'instances':>10} {'visible':>8} {'median bbox':>12} {'coverage':>9}")
+    for name, s in ann['classes'].items():
+        counts = np.asarray(s['bbox_size_px']['counts'])
+        edges = np.asarray(s['bbox_size_px']['edges'])
+        median = edges[np.searchsorted(np.cumsum(counts), counts.sum() / 2) + 1] if counts.sum() else float('nan')
+        print(f"{name:<30} {s['instances']:>10} {100 * s['visibility_rate']:>7.1f}% {median:>10.0f}px "
+              f"{100 * s['viewpoint_coverage']:>8.1f}%")
+    for name, s in report.get('images', dict()).items():
+        if isinstance(s, dict) and s['count']:
+            q = s['quantiles']
+            print(f"{name}: min {s['min']:.4f}, p1 {q['0.01']:.4f}, median {q['0.5']:.4f}, "
+                  f"p99 {q['0.99']:.4f}, max {s['max']:.4f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compute statistics of a dataset rendered with ABR')
+    parser.add_argument('root_path', type=str, help='(Absolute) Path to dataset root directory')
+    parser.add_argument('--convention', type=str, default='opencv', choices=['opencv', 'opengl'],
+                        help='Annotation convention')
+    parser.add_argument('--workers', type=int, default=None, help='Number of processes. Default: cpu count')
+    parser.add_argument('--image-stride', type=int, default=1,
+                        help='Process images of every n-th sample only. 0 to skip images')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Path of the json report. Default: Statistics.json in the dataset root')
+    args = parser.parse_args(argv)
+
+    report = compute_statistics(args.root_path, convention=args.convention, image_stride=args.image_stride,
+                                num_workers=args.workers)
+    output = os.path.join(report['root'], 'Statistics.json') if args.output is None else args.output
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=1)
+    print_report(report)
+    print(f'Wrote report to {output}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -191,12 +191,12 @@ def build_camera_info(cfg):
         'width': cfg.getfloat('width'),
         'height': cfg.getfloat('height'),
         'zeroing': np.fromstring(cfg.get('zeroing', '0, 0, 0'), sep=',', dtype=np.float32),
-        'intrinsic': np.fromstring(cfg.get('instrinsic', '0, 0, 0, 0'), sep=',', dtype=np.float32),
+        'intrinsic': np.fromstring(cfg.get('intrinsic', '0, 0, 0, 0'), sep=',', dtype=np.float32),
         'sensor_width': float(cfg.get('sensor_width', 0.0)),
         'focal_length': float(cfg.get('focal_lenght', 0.0)),
         'hfov': float(cfg.get('hfov', 0.0)),
         'intrinsics_conversion_mode': str(cfg.get('intrinsics_conversion_mode', '')),
-        'original_intrinsic': np.fromstring(cfg.get('original_instrinsic', '0, 0, 0, 0'), sep=',', dtype=np.float32),
+        'original_intrinsic': np.fromstring(cfg.get('original_intrinsic', '0, 0, 0, 0'), sep=',', dtype=np.float32),
     }
     # additional info can be computed by the user
     return cam_info
@@ -205,30 +205,31 @@ def build_camera_info(cfg):
 def quaternion_to_rotation_matrix(q, quat_conv='WXYZ'):
     """
     Computes rotation matrix out of the quaternion (WXYZ (default) or XYZW convention).
-    Inverse funtion of rotation_matrix_to_quaternion
+    Inverse funtion of rotation_matrix_to_quaternion. Vectorized for a batch of quaternions.
 
     Args:
-        q(np.array (4,)): the quaternion (either WXYZ (default) or XYZW convention)
+        q(np.array (4,) or (N, 4)): the quaternion(s) (either WXYZ (default) or XYZW convention)
         quat_conv(str): convetion for given quaterion. Defautl: WXYZ
 
     Returns:
-        np.array of shape (3, 3)
-    
+        np.array of shape (3, 3), or (N, 3, 3) for a batch
+
     Raises:
         RuntimeError: unsupported given convention
     """
-    assert(len(q) == 4)
+    q = np.asarray(q, dtype=np.float64)
+    assert q.shape[-1] == 4
     if quat_conv == 'WXYZ':
-        w, x, y, z = q
+        w, x, y, z = np.moveaxis(q, -1, 0)
     elif quat_conv == 'XYZW':
-        x, y, z, w = q
+        x, y, z, w = np.moveaxis(q, -1, 0)
     else:
         raise RuntimeError("Convention {} not supported".format(quat_conv))
 
-    return np.array([
-        [1 - 2 * (y**2 + z**2), 2 * (x * y - w * z), 2 * (x * z + w * y)],
-        [2 * (x * y + w * z), 1 - 2 * (x**2 + z**2), 2 * (y * z - w * x)],
-        [2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x**2 + y**2)]])
+    return np.stack([
+        1 - 2 * (y**2 + z**2), 2 * (x * y - w * z), 2 * (x * z + w * y),
+        2 * (x * y + w * z), 1 - 2 * (x**2 + z**2), 2 * (y * z - w * x),
+        2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x**2 + y**2)], axis=-1).reshape(q.shape[:-1] + (3, 3))
 
 
 def corners3d_outside_image(box, width, height):
@@ -298,7 +299,7 @@ def plot_sample(sample, target='all', plot_2d_box=False, plot_3d_box=False):
         if target == 'rgb':
             plt.imshow(sample['images']['rgb'])
             # draw bboxes
-            for obj in sample['objects']:
+            for obj in sample.get('objects', []):
                 if plot_2d_box:
                     _draw_2d_bbox(ax, obj['bboxes'])
                 if plot_3d_box:
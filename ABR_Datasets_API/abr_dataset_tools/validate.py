@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 - for information on the respective copyright owner
+# see the NOTICE file and/or the repository
+# <https://github.com/boschresearch/amira-blender-rendering>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Check the integrity of a dataset rendered with ABR.
+
+For each sample, the following is checked:
+    - all files exist and are not empty
+    - png and exr files have a valid header with the expected image size and are
+      not truncated. This only reads the header and the end of each file
+    - annotations can be parsed
+    - the 2D bounding boxes of all objects agree with their masks (optional, as
+      this requires to decode the masks)
+Further, missing samples (gaps in the scene/view numbering) are detected.
+
+Samples are checked in a process pool and problems are reported as soon as
+they are found. Optionally, a repair list with the indexes of all scenes that
+have to be rendered again is written, which can be passed to render_dataset
+via --scene-list.
+
+Usage:
+
+    python -m abr_dataset_tools.validate /path/to/dataset --workers 16 --repair-list repair.txt
+"""
+
+import os
+import sys
+import json
+import struct
+import argparse
+from math import ceil, log
+import numpy as np
+import imageio
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from abr_dataset_tools import get_logger
+from abr_dataset_tools.utils import expandpath, parse_dataset_configs, build_directory_info, build_camera_info
+from abr_dataset_tools.multicam import parse_scene_view
+
+logger = get_logger()
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+_EXR_MAGIC = b'\x76\x2f\x31\x01'
+# number of scan lines per chunk for each EXR compression type
+_EXR_LINES_PER_CHUNK = {0: 1, 1: 1, 2: 1, 3: 16, 4: 32, 5: 16, 6: 32, 7: 32, 8: 32, 9: 256}
+
+
+def read_png_header(path: str):
+    """Read the image size of a png file and check that it is complete.
+
+    Args:
+        path(str): path to png file
+
+    Returns:
+        tuple (width, height)
+
+    Raises:
+        ValueError: invalid or truncated file
+    """
+    with open(path, 'rb') as f:
+        header = f.read(24)
+        if len(header) < 24 or header[:8] != _PNG_SIGNATURE or header[12:16] != b'IHDR':
+            raise ValueError('invalid png header')
+        width, height = struct.unpack('>II', header[16:24])
+        f.seek(-12, os.SEEK_END)
+        if f.read(12)[4:8] != b'IEND':
+            raise ValueError('truncated png file')
+    return width, height
+
+
+def read_exr_header(path: str):
+    """Read the image size of a (scan line) exr file and check that it is complete.
+
+    The file is considered complete if the last chunk referenced in the offset table
+    starts within the file.
+
+    Args:
+        path(str): path to exr file
+
+    Returns:
+        tuple (width, height)
+
+    Raises:
+        ValueError: invalid or truncated file
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        data = f.read(min(size, 1 << 16))
+        if data[:4] != _EXR_MAGIC:
+            raise ValueError('invalid exr header')
+        tiled_or_multipart = struct.unpack('<I', data[4:8])[0] & 0x1a00
+
+        # attributes: name\0 type\0 size value, terminated by an empty name
+        attributes = dict()
+        pos = 8
+        while True:
+            end = data.index(b'\0', pos)
+            name = data[pos:end].decode('ascii', errors='replace')
+            pos = end + 1
+            if not name:
+                break
+            pos = data.index(b'\0', pos) + 1
+            (attr_size,) = struct.unpack('<i', data[pos:pos + 4])
+            attributes[name] = data[pos + 4:pos + 4 + attr_size]
+            pos += 4 + attr_size
+        if 'dataWindow' not in attributes or 'compression' not in attributes:
+            raise ValueError('incomplete exr header')
+        x_min, y_min, x_max, y_max = struct.unpack('<iiii', attributes['dataWindow'])
+        width, height = x_max - x_min + 1, y_max - y_min + 1
+
+        if not tiled_or_multipart:
+            lines = _EXR_LINES_PER_CHUNK.get(attributes['compression'][0], 1)
+            chunks = -(-height // lines)
+            f.seek(pos)
+            offsets = np.frombuffer(f.read(8 * chunks), dtype='<u8')
+            if len(offsets) < chunks or offsets.max() >= size:
+                raise ValueError('truncated exr file')
+    return width, height
+
+
+def _check_size(name, size, cam_info):
+    width, height = cam_info.get('width', None), cam_info.get('height', None)
+    if width is not None and height is not None and tuple(size) != (int(width), int(height)):
+        return [f'{name}: size {size[0]}x{size[1]} differs from camera {int(width)}x{int(height)}']
+    return list()
+
+
+def validate_sample(dir_info, stem: str, cam_info: dict, check_masks: bool = True, tolerance: float = 1.0):
+    """Check all files of a sample
+
+    Args:
+        dir_info(dict): directory info of the dataset, see build_directory_info
+        stem(str): filename of the sample (without extension)
+        cam_info(dict): camera info of the dataset, see build_camera_info
+
+    Optional Args:
+        check_masks(bool): compare 2D bounding boxes in annotations with masks. Default: True
+        tolerance(float): max deviation of bounding box corners in pixels. Default: 1.0
+
+    Returns:
+        list(str): problems found. Empty if the sample is valid
+    """
+    problems = list()
+    images = [
+        ('rgb', os.path.join(dir_info['images']['rgb'], f'{stem}.png')),
+        ('depth', os.path.join(dir_info['images']['depth'], f'{stem}.png')),
+        ('backdrop', os.path.join(dir_info['images']['backdrop'], f'{stem}.png')),
+        ('range', os.path.join(dir_info['images']['range'], f'{stem}.exr')),
+    ]
+
+    def _check_file(name, path):
+        if not os.path.exists(path):
+            problems.append(f'{name}: missing file {path}')
+            return False
+        if os.path.getsize(path) == 0:
+            problems.append(f'{name}: empty file {path}')
+            return False
+        return True
+
+    for name, path in images:
+        if not _check_file(name, path):
+            continue
+        try:
+            size = read_exr_header(path) if path.endswith('.exr') else read_png_header(path)
+            problems += _check_size(name, size, cam_info)
+        except (ValueError, OSError, struct.error) as err:
+            problems.append(f'{name}: {err}')
+
+    for convention in ('opencv', 'opengl'):
+        path = os.path.join(dir_info['annotations'][convention], f'{stem}.json')
+        if not _check_file(f'annotations/{convention}', path):
+            continue
+        try:
+            with open(path, 'r') as f:
+                annotations = json.load(f)
+        except (ValueError, OSError) as err:
+            problems.append(f'annotations/{convention}: {err}')
+            continue
+        # masks are the same for both conventions
+        if convention != 'opencv':
+            continue
+
+        for a in annotations:
+            name = f'mask{a.get("mask_name", "")}'
+            path = os.path.join(dir_info['images']['mask'], f'{stem}{a.get("mask_name", "")}.png')
+            if not _check_file(name, path):
+                continue
+            try:
+                problems += _check_size(name, read_png_header(path), cam_info)
+            except (ValueError, OSError, struct.error) as err:
+                problems.append(f'{name}: {err}')
+                continue
+            corners2d = a.get('bbox', dict()).get('corners2d', None)
+            if not check_masks or corners2d is None:
+                continue
+            mask = imageio.imread(path)
+            mask = mask[:, :, 0] if mask.ndim == 3 else mask
+            xs, ys = np.nonzero(mask.any(axis=0))[0], np.nonzero(mask.any(axis=1))[0]
+            if xs.size == 0:
+                problems.append(f'{name}: empty mask for object with 2D bounding box')
+                continue
+            bbox = np.array([[xs[0], ys[0]], [xs[-1], ys[-1]]])
+            if np.abs(bbox - np.asarray(corners2d)).max() > tolerance:
+                problems.append(f'{name}: 2D bounding box {np.asarray(corners2d).tolist()} disagrees '
+                                f'with mask {bbox.tolist()}')
+    return problems
+
+
+# dataset information used by worker processes, see _init_worker
+_worker_args = None
+
+
+def _init_worker(dir_info, cam_info, check_masks):
+    global _worker_args
+    _worker_args = (dir_info, cam_info, check_masks)
+
+
+def _validate_chunk(stems):
+    dir_info, cam_info, check_masks = _worker_args
+    return [(stem, validate_sample(dir_info, stem, cam_info, check_masks=check_masks)) for stem in stems]
+
+
+def find_missing_samples(stems, scene_count: int, view_count: int):
+    """Find gaps in the naming of samples (s{scene}_v{view})
+
+    Returns:
+        tuple (list of missing (scene, view), list of stems that do not follow the naming scheme)
+    """
+    present, unexpected = set(), list()
+    for stem in stems:
+        scene_view = parse_scene_view(stem)
+        if scene_view is None:
+            unexpected.append(stem)
+        else:
+            present.add(scene_view)
+    missing = [(s, v) for s in range(scene_count) for v in range(view_count) if (s, v) not in present]
+    return missing, unexpected
+
+
+def validate_dataset(root: str, num_workers: int = None, check_masks: bool = True, chunk_size: int = 256,
+                     report_file: str = None, repair_list: str = None):
+    """Check the integrity of a dataset
+
+    Args:
+        root(str): path to dataset root directory
+
+    Optional Args:
+        num_workers(int): number of processes. Default: None (cpu count)
+        check_masks(bool): compare 2D bounding boxes with masks. Default: True
+        chunk_size(int): number of samples per task. Default: 256
+        report_file(str): json lines file, to which problems are written as soon as they are found. Default: None
+        repair_list(str): file to which the indexes of all scenes with problems are written. Default: None
+
+    Returns:
+        dict: stem -> list of problems, for all invalid samples, including missing samples
+    """
+    root = expandpath(root, check_file=True)
+    cfg = parse_dataset_configs(root)
+    dir_info = build_directory_info(root)
+    cam_info = build_camera_info(cfg['camera_info'])
+    scene_count = cfg['dataset'].getint('scene_count', fallback=cfg['dataset'].getint('image_count'))
+    view_count = cfg['dataset'].getint('view_count', fallback=1)
+
+    # all samples for which any file exists
+    stems = set()
+    for path, ext in ((dir_info['images']['rgb'], '.png'), (dir_info['annotations']['opencv'], '.json'),
+                      (dir_info['annotations']['opengl'], '.json')):
+        if os.path.isdir(path):
+            stems.update(f.name[:-len(ext)] for f in os.scandir(path) if f.name.endswith(ext))
+    stems = sorted(stems)
+    logger.info(f'Validating {len(stems)} samples in {root}')
+
+    results = dict()
+    report = open(report_file, 'w') if report_file is not None else None
+
+    def _report(stem, problems):
+        results[stem] = problems
+        logger.warn(f'{stem}: ' + '; '.join(problems))
+        if report is not None:
+            report.write(json.dumps({'sample': stem, 'problems': problems}) + '\n')
+            report.flush()
+
+    try:
+        missing, unexpected = find_missing_samples(stems, scene_count, view_count)
+        # same zero padding as used by the scenes
+        scn_width, view_width = int(ceil(log(scene_count, 10))), int(ceil(log(view_count, 10)))
+        for scene, view in missing:
+            _report(f's{scene:0{scn_width}}_v{view:0{view_width}}', ['missing sample'])
+        for stem in unexpected:
+            _report(stem, ['unexpected sample name'])
+
+        chunks = [stems[i:i + chunk_size] for i in range(0, len(stems), chunk_size)]
+        done = 0
+        with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker,
+                                 initargs=(dir_info, cam_info, check_masks)) as executor:
+            futures = [executor.submit(_validate_chunk, c) for c in chunks]
+            for future in as_completed(futures):
+                for stem, problems in future.result():
+                    if problems:
+                        _report(stem, problems)
+                done += chunk_size
+                logger.info(f'Validated {min(done, len(stems))}/{len(stems)} samples, '
+                            f'{len(results)} with problems')
+    finally:
+        if report is not None:
+            report.close()
+
+    if repair_list is not None:
+        scenes = sorted({parse_scene_view(stem)[0] for stem in results if parse_scene_view(stem) is not None})
+        write_repair_list(repair_list, scenes)
+    return results
+
+
+def write_repair_list(path: str, scenes):
+    """Write indexes of scenes to render again, one per line, see render_dataset --scene-list"""
+    with open(path, 'w') as f:
+        f.write('# scenes to render again, pass to render_dataset/abrgen via --scene-list\n')
+        for s in scenes:
+            f.write(f'{s}\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check the integrity of a dataset rendered with ABR')
+    parser.add_argument('root_path', type=str, help='(Absolute) Path to dataset root directory')
+    parser.add_argument('--workers', type=int, default=None, help='Number of processes. Default: cpu count')
+    parser.add_argument('--skip-mask-check', action='store_true',
+                        help='Do not compare 2D bounding boxes with masks, which requires to decode all masks')
+    parser.add_argument('--report', type=str, default=None,
+                        help='Write problems to this json lines file as soon as they are found')
+    parser.add_argument('--repair-list', type=str, default=None,
+                        help='Write indexes of scenes with problems to this file, see render_dataset --scene-list')
+    args = parser.parse_args(argv)
+
+    results = validate_dataset(args.root_path, num_workers=args.workers, check_masks=not args.skip_mask_check,
+                               report_file=args.report, repair_list=args.repair_list)
+    if results:
+        print(f'Found problems in {len(results)} samples')
+        return 1
+    print('Dataset is valid')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
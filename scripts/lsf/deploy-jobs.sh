@@ -25,4 +25,10 @@ echo ''
 for f in `ls ./$BASENAME*.sh`; do
     echo "Deploying batch job: $f"
     bsub <  $f
+    # array jobs come with a merge job, which waits for all shards (see its -w directive)
+    MERGE=${f%.sh}.merge
+    if [ -f "$MERGE" ]; then
+        echo "Deploying merge job: $MERGE"
+        bsub < $MERGE
+    fi
 done
@@ -19,6 +19,12 @@ One option to do this is by running
     python config/PhIRM/generate_config.py
 
 Please have a look at how this works before!
+
+If a measured rendering time per image is given (--seconds-per-image), each
+configuration is split into shards of scenes such that one shard can be
+rendered within the given walltime. Shards are rendered in an LSF array job,
+and a dependent merge job packs the results of all shards into a single tar
+ball. Use deploy-jobs.sh to submit the jobs.
 """
 
 # Example configuration to set up using command-line arguments.
@@ -35,8 +41,13 @@ Please have a look at how this works before!
 
 import argparse
 import os
+import sys
 from pathlib import Path
 
+# make amira_blender_rendering importable when running from within scripts/lsf
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src'))
+from amira_blender_rendering.cli.launcher import get_scene_count, get_images_per_scene, get_num_shards  # noqa
+
 
 def parse_args():
     """Parse input command-line arguments"""
@@ -80,6 +91,12 @@ def parse_args():
                         help='Name of dataset to store in tar ball. Default: PhIRM')
     parser.add_argument('--render-mode', type=str, dest='render_mode', default='default',
                         help='Define render mode [default, multiview]. Default: default')
+    parser.add_argument('--seconds-per-image', metavar='S', type=float, dest='seconds_per_image', default=0.0,
+                        help='Measured rendering time per image. If given, configs are split into shards that fit '
+                             'into the walltime (--hh, --mm) and rendered in an array job. Default: 0 (no shards)')
+    parser.add_argument('--walltime-margin', metavar='F', type=float, dest='walltime_margin', default=0.2,
+                        help='Fraction of the walltime reserved for setup and copying data when sizing shards. '
+                             'Default: 0.2')
 
     # parse
     args = parser.parse_args()
@@ -97,7 +114,9 @@ def get_scheduler_directives(job_name: str = 'BlenderRender',
                              cpu: int = 4,
                              ram: int = 8,
                              hh: int = 0,
-                             mm: int = 5):
+                             mm: int = 5,
+                             num_shards: int = 1,
+                             depends_on: str = None):
     """
     Set up slurm directives
 
@@ -109,18 +128,26 @@ def get_scheduler_directives(job_name: str = 'BlenderRender',
         ram(int): RAM (in GB) to allocate per job slot. Default: 8 GB
         hh(int): hours the job should live. Default: 0
         mm(int): minutes the job should live. Default: 5
+        num_shards(int): if > 1, set up an array job with one element per shard. Default: 1
+        depends_on(str): name of a job that has to be done before this job starts. Default: None
 
     Returns:
         formatted str with directives
     """
+    name = f'"{job_name}[1-{num_shards}]"' if num_shards > 1 else job_name
+    out = '%x.%J_%I' if num_shards > 1 else '%x.%j'
+    dependency = f"""
+# Start only after all elements of job {depends_on} are done
+#BSUB -w "done({depends_on})"
+#""" if depends_on is not None else ''
 
     return f"""# name of this batch job
-#BSUB -J {job_name}
+#BSUB -J {name}
 #
 # output configuration
-#BSUB -o /home/%u/lsf_out/%x.%j.out
-#BSUB -e /home/%u/lsf_out/%x.%j.err
-#
+#BSUB -o /home/%u/lsf_out/{out}.out
+#BSUB -e /home/%u/lsf_out/{out}.err
+#{dependency}
 # CPU, MEM, GPU, GPU type configuration
 #BSUB -n {cpu}
 #BSUB -M {ram*1024}
@@ -155,7 +182,8 @@ def gen_script(cfgfile: str,
                heavy_duty_dir: str = '$HOME/HDD/heavy_duty',
                out_dir: str = '/fs/scratch/rng_cr_bcai_dl/$USER/lsf_results',
                dataset_name: str = 'PhIRM',
-               render_mode: str = 'default'):
+               render_mode: str = 'default',
+               num_shards: int = 1):
     """Generate slurm batch script from configs
 
     Args:
@@ -178,17 +206,29 @@ def gen_script(cfgfile: str,
                       Default: /fs/scratch/rng_cr_bcai_dl/$USER/lsf_results
         dataset_name(str): Name of dataset to tar
         render_mode(str): define type of rendering mode ['default', 'multiview']
+        num_shards(int): if > 1, generate an array job in which each element renders one shard
+            of the dataset. The results of each shard are stored in a separate tar ball, see
+            gen_merge_script. Default: 1
 
     Returns:
         formatted string corresponding to slurm script
     """
+    if num_shards > 1:
+        # NOTE: LSF array indices start at 1
+        shard_args = f' --shard-index $((LSB_JOBINDEX - 1)) --num-shards {num_shards}'
+        tarball = f'$HDD/{job_name}-shards/shard-$LSB_JOBINDEX.tar'
+        mkdir = f'mkdir -p $HDD/{job_name}-shards && '
+    else:
+        shard_args = ''
+        tarball = f'$HDD/{job_name}-$LSB_JOBID.tar'
+        mkdir = ''
 
     return f"""#!/bin/bash
 #
 # For more information about the content of this file, see the files
 # in the directory $SLURMTEMPLATE on the RNG GPU cluster
 #
-{get_scheduler_directives(job_name, gpu, gpu_type, cpu, ram, hh, mm)}
+{get_scheduler_directives(job_name, gpu, gpu_type, cpu, ram, hh, mm, num_shards)}
 
 . /fs/applications/lsf/latest/conf/profile.lsf  # THIS LINE IS MANDATORY
 . /fs/applications/modules/current/init/bash    # THIS LINE IS MANDATORY
@@ -230,10 +270,10 @@ SSD_TMP=`mktemp -d -p $SSD`
 AMIRA_DATASETS=$SSD_TMP \\
 AMIRA_DATA_GFX=$DATA_STORAGE/amira_data_gfx \\
 DATA_STORAGE=$DATA_STORAGE \\
-    scripts/abrgen --abr-path {os.path.join(abr_path, 'src')} --config {cfgfile} --render-mode {render_mode}
+    scripts/abrgen --abr-path {os.path.join(abr_path, 'src')} --config {cfgfile} --render-mode {render_mode}{shard_args}
 
 # --- Step 3 --- copy results to user directory
-cd $SSD_TMP && tar cf $HDD/{job_name}-$LSB_JOBID.tar ./{dataset_name}
+{mkdir}cd $SSD_TMP && tar cf {tarball} ./{dataset_name}
 
 # --- Step 4 --- clean and finalize
 cd $HOME && rm -rf $SSD_TMP
@@ -241,6 +281,54 @@ set +e
 """
 
 
+def gen_merge_script(job_name: str = 'BlenderRender',
+                     hh: int = 1,
+                     mm: int = 0,
+                     out_dir: str = '/fs/scratch/rng_cr_bcai_dl/$USER/lsf_results'):
+    """Generate LSF batch script that merges the results of all shards of an array job.
+
+    The tar balls of all shards are extracted into the same directory, which
+    yields the complete dataset, since filenames are unique across shards.
+    The dataset is then packed into a single tar ball. The job starts only
+    after all elements of the array job are done.
+
+    Args:
+        job_name(str): job name of the array job
+        hh(int): hours the job should live. Default: 1
+        mm(int): minutes the job should live. Default: 0
+        out_dir(str): (absolute) path where the results of the shards are stored.
+                      Default: /fs/scratch/rng_cr_bcai_dl/$USER/lsf_results
+
+    Returns:
+        formatted string corresponding to LSF script
+    """
+
+    return f"""#!/bin/bash
+#
+{get_scheduler_directives(job_name + '-merge', 0, 'rb_basic', 1, 4, hh, mm, depends_on=job_name)}
+
+. /fs/applications/lsf/latest/conf/profile.lsf  # THIS LINE IS MANDATORY
+
+# exit on error
+set -e
+
+HDD={out_dir}
+
+# --- Step 1 --- extract results of all shards into one dataset
+MERGE_TMP=`mktemp -d -p $HDD`
+for f in $HDD/{job_name}-shards/shard-*.tar; do
+    tar -C $MERGE_TMP -xf $f
+done
+
+# --- Step 2 --- pack the dataset
+cd $MERGE_TMP && tar cf $HDD/{job_name}-$LSB_JOBID.tar .
+
+# --- Step 3 --- clean and finalize
+cd $HOME && rm -rf $MERGE_TMP $HDD/{job_name}-shards
+set +e
+"""
+
+
 if __name__ == "__main__":
     # parse arguments
     args = parse_args()
@@ -250,7 +338,15 @@ if __name__ == "__main__":
 
     # loop over config files
     for cfg in configs:
-        print(f"Generating LSF deployment script for configs {cfg}")
+        # determine the number of shards that fit into the walltime
+        num_shards = 1
+        if args.seconds_per_image > 0:
+            argv = ['--render-mode', args.render_mode]
+            walltime = (args.hh * 60 + args.mm) * 60 * (1 - args.walltime_margin)
+            num_shards = get_num_shards(get_scene_count(str(cfg), argv), get_images_per_scene(str(cfg), argv),
+                                        args.seconds_per_image, walltime)
+
+        print(f"Generating LSF deployment script for configs {cfg} with {num_shards} shard(s)")
         script = gen_script(cfgfile=cfg,
                             job_name=cfg.stem,
                             py_env_name=args.py_env_name,
@@ -267,9 +363,15 @@ if __name__ == "__main__":
                             heavy_duty_dir=args.heavy_duty_dir,
                             out_dir=args.out_dir,
                             dataset_name=args.dataset_name,
-                            render_mode=args.render_mode)
+                            render_mode=args.render_mode,
+                            num_shards=num_shards)
         # write out
         fname = f"tmp-lsfbatch-{cfg.stem}.sh"
 
         with open(fname, 'w') as f:
             f.write(script)
+
+        # merge job for array jobs. NOTE: deploy-jobs.sh submits it after the array job
+        if num_shards > 1:
+            with open(f"tmp-lsfbatch-{cfg.stem}.merge", 'w') as f:
+                f.write(gen_merge_script(job_name=cfg.stem, out_dir=args.out_dir))
@@ -24,5 +24,11 @@ BASENAME=${1?Error: no BASENAME for config and associated slurmbatch .sh script
 echo ''
 for f in `ls ./$BASENAME*.sh`; do
     echo "Deploying batch job: $f"
-    sbatch  $f
+    JOBID=`sbatch --parsable $f`
+    # array jobs come with a merge job, which has to wait for all shards
+    MERGE=${f%.sh}.merge
+    if [ -f "$MERGE" ]; then
+        echo "Deploying merge job: $MERGE (after job $JOBID)"
+        sbatch --dependency=afterok:$JOBID $MERGE
+    fi
 done
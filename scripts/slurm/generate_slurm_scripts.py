@@ -32,6 +32,12 @@ One option to do this is by running
     python config/PhIRM/generate_config.py
 
 Please have a look at how this works before!
+
+If a measured rendering time per image is given (--seconds-per-image), each
+configuration is split into shards of scenes such that one shard can be
+rendered within the given walltime. Shards are rendered in a slurm array job,
+and a dependent merge job packs the results of all shards into a single tar
+ball. Use deploy-jobs.sh to submit the jobs with the correct dependencies.
 """
 
 # Example configuration to set up using command-line arguments.
@@ -51,8 +57,13 @@ Please have a look at how this works before!
 
 import argparse
 import os
+import sys
 from pathlib import Path
 
+# make amira_blender_rendering importable when running from within scripts/slurm
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src'))
+from amira_blender_rendering.cli.launcher import get_scene_count, get_images_per_scene, get_num_shards  # noqa
+
 
 def parse_args():
     """Parse input command-line arguments"""
@@ -91,6 +102,13 @@ def parse_args():
         help='(Absolute) path where output data are moved to for storage. Default: /data/Employees/$USER/slurm_results')
     parser.add_argument('--dset-name', metavar='name', type=str, dest='dset_name', default='PhIRM',
                         help='Name of directory with dataset to pack')
+    parser.add_argument('--seconds-per-image', metavar='S', type=float, dest='seconds_per_image', default=0.0,
+                        help='Measured rendering time per image. If given, configs are split into shards that fit '
+                             'into the walltime (--dd, --hh, --mm) and rendered in an array job. '
+                             'Default: 0 (no shards)')
+    parser.add_argument('--walltime-margin', metavar='F', type=float, dest='walltime_margin', default=0.2,
+                        help='Fraction of the walltime reserved for setup and copying data when sizing shards. '
+                             'Default: 0.2')
 
     # parse
     args = parser.parse_args()
@@ -110,7 +128,8 @@ def get_slurm_directives(user: str,
                          ram: int = 16,
                          days: int = 0,
                          hh: int = 0,
-                         mm: int = 5):
+                         mm: int = 5,
+                         num_shards: int = 1):
     """
     Set up slurm directives
 
@@ -124,20 +143,26 @@ def get_slurm_directives(user: str,
         days(int): number of days the job should live. Default: 0
         hh(int): hours the job should live. Default: 0
         mm(int): minutes the job should live. Default: 5
+        num_shards(int): if > 1, set up an array job with one task per shard. Default: 1
 
     Returns:
         formatted str with directives
     """
+    array = f"""
+# array job with one task per shard
+#SBATCH --array=0-{num_shards - 1}
+""" if num_shards > 1 else ''
+    out = '%x.%A_%a' if num_shards > 1 else '%x.%j'
 
     return f"""# name of this batch job
 #SBATCH --job-name={job_name}
 
 # account to which the resources get accounted to
 #SBATCH --account=r31
-
+{array}
 # output configuration
-#SBATCH --output=/home/%u/slurm_out/%x.%j.out
-#SBATCH --error=/home/%u/slurm_out/%x.%j.err
+#SBATCH --output=/home/%u/slurm_out/{out}.out
+#SBATCH --error=/home/%u/slurm_out/{out}.err
 
 # GPU, CPU, MEM configuration
 #SBATCH --gres=gpu:{gpu},ssd:{ssd}G
@@ -169,7 +194,8 @@ def gen_script(user: str,
                amira_data: str = '$SSD/data',
                abr_path: str = '$HOME/amira_blender_rendering',
                out_path: str = '/data/Employees/$USER/slurm_results',
-               dset_name: str = 'PhIRM'):
+               dset_name: str = 'PhIRM',
+               num_shards: int = 1):
     """Generate slurm batch script from configs
 
     Args:
@@ -191,10 +217,21 @@ def gen_script(user: str,
         out_path(str): (absolute) path where data are moved to for storage after rendering.
                         Default: /data/Employees/$USER/slurm_results
         dset_name(str): name of directory with dataset to pack. Default: PhIRM
+        num_shards(int): if > 1, generate an array job in which each task renders one shard
+            of the dataset. The results of each shard are stored in a separate tar ball, see
+            gen_merge_script. Default: 1
 
     Returns:
         formatted string corresponding to slurm script
     """
+    if num_shards > 1:
+        shard_args = f' --shard-index $SLURM_ARRAY_TASK_ID --num-shards {num_shards}'
+        tarball = os.path.join(out_path, f'{job_name}-shards', 'shard-$SLURM_ARRAY_TASK_ID.tar')
+        mkdir = f'mkdir -p {os.path.join(out_path, f"{job_name}-shards")} && '
+    else:
+        shard_args = ''
+        tarball = f'{os.path.join(out_path, job_name)}-$SLURM_JOB_ID.tar'
+        mkdir = ''
 
     return f"""#!/bin/bash
 
@@ -204,7 +241,7 @@ def gen_script(user: str,
 # to run this as a batch job, delete the first # in front of the following
 # lines. Note that slurm commands are prefixed with #SBATCH (including the #)
 
-{get_slurm_directives(user, job_name, gpu, cpu, ssd, ram, days, hh, mm)}
+{get_slurm_directives(user, job_name, gpu, cpu, ssd, ram, days, hh, mm, num_shards)}
 
 # exit on error
 set -e
@@ -225,16 +262,66 @@ AMIRA_DATA=$AMIRA_DATA sh scripts/sh/setup_render_env_cluster.sh
 # --- Step 2 --- rendering
 AMIRA_DATASETS=$AMIRA_DATA \\
 AMIRA_DATA_GFX={os.path.join(amira_data, 'amira_data_gfx')} \\
-scripts/abrgen --abr-path {os.path.join(abr_path, 'src')} --config {cfgfile} {'--' + input_flag if input_flag else ''}
+scripts/abrgen --abr-path {os.path.join(abr_path, 'src')} --config {cfgfile} \\
+    {'--' + input_flag if input_flag else ''}{shard_args}
 
 # --- Step 3 --- copy results to user directory
-cd $AMIRA_DATA && tar -cf {os.path.join(out_path, job_name)}-$SLURM_JOB_ID.tar ./{dset_name}
+{mkdir}cd $AMIRA_DATA && tar -cf {tarball} ./{dset_name}
 
 # --- Step 4 --- finalize
 set +e
 """
 
 
+def gen_merge_script(user: str,
+                     job_name: str = 'BlenderRender',
+                     days: int = 0,
+                     hh: int = 1,
+                     mm: int = 0,
+                     out_path: str = '/data/Employees/$USER/slurm_results'):
+    """Generate slurm batch script that merges the results of all shards of an array job.
+
+    The tar balls of all shards are extracted into the same directory, which
+    yields the complete dataset, since filenames are unique across shards.
+    The dataset is then packed into a single tar ball. The job has to be
+    submitted with a dependency on the array job (see deploy-jobs.sh).
+
+    Args:
+        user(str): name.surname of user, to receive email
+        job_name(str): job name of the array job
+        days(int): number of days the job should live. Default: 0
+        hh(int): hours the job should live. Default: 1
+        mm(int): minutes the job should live. Default: 0
+        out_path(str): (absolute) path where the results of the shards are stored.
+                        Default: /data/Employees/$USER/slurm_results
+
+    Returns:
+        formatted string corresponding to slurm script
+    """
+    shards_path = os.path.join(out_path, f'{job_name}-shards')
+
+    return f"""#!/bin/bash
+
+{get_slurm_directives(user, job_name + '-merge', 0, 1, 0, 4, days, hh, mm)}
+
+# exit on error
+set -e
+
+# --- Step 1 --- extract results of all shards into one dataset
+MERGE_TMP=`mktemp -d -p {out_path}`
+for f in {shards_path}/shard-*.tar; do
+    tar -C $MERGE_TMP -xf $f
+done
+
+# --- Step 2 --- pack the dataset
+cd $MERGE_TMP && tar -cf {os.path.join(out_path, job_name)}-$SLURM_JOB_ID.tar .
+
+# --- Step 3 --- clean and finalize
+cd $HOME && rm -rf $MERGE_TMP {shards_path}
+set +e
+"""
+
+
 if __name__ == "__main__":
     # parse arguments
     args = parse_args()
@@ -244,7 +331,15 @@ if __name__ == "__main__":
 
     # loop over config files
     for cfg in configs:
-        print(f"Generating slurm deployment script for configs {cfg}")
+        # determine the number of shards that fit into the walltime
+        num_shards = 1
+        if args.seconds_per_image > 0:
+            argv = ('--' + args.input_flag).split() if args.input_flag else []
+            walltime = ((args.dd * 24 + args.hh) * 60 + args.mm) * 60 * (1 - args.walltime_margin)
+            num_shards = get_num_shards(get_scene_count(str(cfg), argv), get_images_per_scene(str(cfg), argv),
+                                        args.seconds_per_image, walltime)
+
+        print(f"Generating slurm deployment script for configs {cfg} with {num_shards} shard(s)")
         script = gen_script(user=args.user,
                             cfgfile=cfg,
                             job_name=cfg.stem,
@@ -259,9 +354,15 @@ if __name__ == "__main__":
                             mm=args.mm,
                             amira_data=args.amira_data,
                             out_path=args.out_path,
-                            dset_name=args.dset_name)
+                            dset_name=args.dset_name,
+                            num_shards=num_shards)
         # write out
         fname = f"tmp-slurmbatch-{cfg.stem}.sh"
 
         with open(fname, 'w') as f:
             f.write(script)
+
+        # merge job for array jobs. NOTE: deploy-jobs.sh submits it with a dependency on the array job
+        if num_shards > 1:
+            with open(f"tmp-slurmbatch-{cfg.stem}.merge", 'w') as f:
+                f.write(gen_merge_script(user=args.user, job_name=cfg.stem, out_path=args.out_path))
@@ -18,6 +18,8 @@
 
 import os
 import os.path as osp
+import json
+import hashlib
 import shutil
 import random
 import numpy as np
@@ -25,8 +27,172 @@ import numpy as np
 import bpy
 
 import amira_blender_rendering.utils.logging as log_utils
-from amira_blender_rendering.utils.blender import get_collection_item_names, find_new_items
-from amira_blender_rendering.utils.material import MetallicMaterialGenerator, set_viewport_shader
+from amira_blender_rendering.utils.io import get_cache_dir
+from amira_blender_rendering.utils.blender import get_collection_item_names, find_new_items, \
+    set_origin_to_center_of_mass, add_rigid_body, delete_object
+from amira_blender_rendering.utils.material import MetallicMaterialGenerator, MetallicMaterialPool, \
+    set_viewport_shader
+from amira_blender_rendering.utils.mesh import get_vertices, set_vertices
+
+
+# record of a binary STL file: normal, 3 vertices, attribute byte count
+_STL_RECORD = np.dtype([('normal', '<f4', (3,)), ('vertices', '<f4', (3, 3)), ('attr', '<u2')])
+
+
+def read_stl_statistics(filepath):
+    """Read mesh statistics from an (ASCII or binary) STL file without importing it into blender
+
+    Args:
+        filepath (str): fullpath to STL file
+
+    Returns:
+        dict with number of (unique) vertices, number of faces and bounding box dimensions,
+        or None if the file cannot be parsed
+    """
+    try:
+        file_size = osp.getsize(filepath)
+        with open(filepath, 'rb') as f:
+            header = f.read(84)
+            n_faces = int(np.frombuffer(header[80:84], dtype='<u4')[0]) if len(header) == 84 else -1
+            if file_size == 84 + n_faces * _STL_RECORD.itemsize:
+                vertices = np.fromfile(f, dtype=_STL_RECORD, count=n_faces)['vertices'].reshape(-1, 3)
+            elif header.lstrip().startswith(b'solid'):
+                f.seek(0)
+                tokens = np.array(f.read().split())
+                idx = np.flatnonzero(tokens == b'vertex')
+                vertices = tokens[idx[:, None] + np.arange(1, 4)].astype(np.float32)
+                n_faces = len(vertices) // 3
+            else:
+                return None
+    except (OSError, ValueError, IndexError):
+        return None
+
+    if not len(vertices):
+        return None
+    return dict(
+        n_vertices=int(np.unique(vertices, axis=0).shape[0]),
+        n_faces=int(n_faces),
+        dimensions=(vertices.max(axis=0) - vertices.min(axis=0)).tolist())
+
+
+def is_scalable(dimensions, lower_limit, upper_limit, epsilon=1e-6):
+    """Check if an object of given dimensions can be scaled to fit into size limits
+
+    See also STLImporter._random_rescale
+    """
+    dimensions = np.abs(dimensions)
+    if np.min(dimensions) < epsilon:
+        return False
+    return lower_limit / np.min(dimensions) <= upper_limit / np.max(dimensions)
+
+
+class ABCCatalog(object):
+    """Persistent catalog of STL files of the ABC dataset with precomputed mesh statistics
+
+    For each object type (i.e. subfolder), the catalog stores per STL file the
+    number of vertices and faces, the bounding box dimensions, and whether the
+    mesh can be scaled to the size limits of the object type. The catalog of an
+    object type is built once on first access, stored in the cache directory
+    (see utils.io.get_cache_dir), and rebuilt only if the modification time of
+    the STL directory changed.
+    """
+    def __init__(self, parent, object_types_map, catalog_path=None):
+        """Catalog for ABC dataset
+
+        Args:
+            parent (str): fullpath to ABC dataset parent directory
+            object_types_map (dict): object types with folder and size limits, see ABCDataLoader
+            catalog_path (str, optional): path to catalog file. Defaults to None (= file in cache directory)
+        """
+        self._logger = log_utils.get_logger()
+        self._parent = osp.realpath(parent)
+        self._object_types_map = object_types_map
+        if catalog_path is None:
+            digest = hashlib.sha1(self._parent.encode('utf-8')).hexdigest()
+            catalog_path = osp.join(get_cache_dir('abc'), f'{digest}.json')
+        self._catalog_path = catalog_path
+        self._catalog = None
+
+    def _load(self):
+        try:
+            with open(self._catalog_path, 'r') as f:
+                catalog = json.load(f)
+            if catalog.get('parent') == self._parent:
+                return catalog
+        except (OSError, ValueError):
+            pass
+        return dict(parent=self._parent, types=dict())
+
+    def _save(self):
+        # write atomically, several render jobs might share the same catalog
+        tmp_path = f'{self._catalog_path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self._catalog, f)
+            os.replace(tmp_path, self._catalog_path)
+        except OSError as err:
+            self._logger.warning(f"could not write ABC catalog {self._catalog_path}: {err}")
+
+    def _build(self, object_type, dir_path):
+        lower_limit = self._object_types_map[object_type]["lower_limit"]
+        upper_limit = self._object_types_map[object_type]["upper_limit"]
+        filenames = sorted(os.listdir(dir_path))
+        self._logger.info(f"building ABC catalog for {len(filenames)} files of type {object_type}")
+        entries = dict()
+        for filename in filenames:
+            stats = read_stl_statistics(osp.join(dir_path, filename))
+            if stats is None:
+                entries[filename] = [0, 0, [0.0, 0.0, 0.0], False]
+                continue
+            valid = is_scalable(stats["dimensions"], lower_limit, upper_limit)
+            entries[filename] = [stats["n_vertices"], stats["n_faces"], stats["dimensions"], bool(valid)]
+        return entries
+
+    def get_entries(self, object_type):
+        """Get catalog entries of an object type, building them if required
+
+        Args:
+            object_type (string): object type
+
+        Returns:
+            dict: filename -> [n_vertices, n_faces, dimensions, valid]
+        """
+        if self._catalog is None:
+            self._catalog = self._load()
+        dir_path = osp.join(self._parent, self._object_types_map[object_type]["folder"], "STL")
+        mtime = os.stat(dir_path).st_mtime
+        cat = self._catalog["types"].get(object_type)
+        if cat is None or cat["mtime"] != mtime:
+            cat = dict(mtime=mtime, entries=self._build(object_type, dir_path))
+            self._catalog["types"][object_type] = cat
+            self._save()
+        return cat["entries"]
+
+    def sample(self, object_type, max_faces=0, complexity_weighting=0.0):
+        """Sample a random valid STL file of an object type
+
+        Args:
+            object_type (string): object type
+            max_faces (int, optional): if > 0, only sample meshes with at most max_faces faces. Defaults to 0.
+            complexity_weighting (float, optional): sample meshes with probability proportional to
+                n_faces ** -complexity_weighting, i.e. prefer simple meshes if > 0. Defaults to 0.0 (= uniform).
+
+        Returns:
+            string: filename in object-type directory, or None if there is no valid file
+        """
+        entries = self.get_entries(object_type)
+        valid = [(fn, e[1]) for fn, e in entries.items() if e[3]]
+        if max_faces > 0:
+            filtered = [(fn, n) for fn, n in valid if n <= max_faces]
+            if not filtered and valid:
+                self._logger.warning(f"no {object_type} mesh with at most {max_faces} faces, ignoring limit")
+            valid = filtered or valid
+        if not valid:
+            return None
+        if complexity_weighting:
+            weights = [max(1, n) ** -complexity_weighting for _, n in valid]
+            return random.choices(valid, weights=weights)[0][0]
+        return random.choice(valid)[0]
 
 
 class ABCDataLoader(object):
@@ -34,16 +200,25 @@ class ABCDataLoader(object):
 
     Returns fullpath to stl file, and a size limits in [m]
     """
-    def __init__(self, data_dir=None):
+    def __init__(self, data_dir=None, use_catalog=True, max_faces=0, complexity_weighting=0.0):
         """Dataloader for ABC dataset
 
         Args:
             data_dir (str, optional): fullpath to ABC dataset parent directory. Defaults to None.
+            use_catalog (bool, optional): sample only valid files from a persistent ABCCatalog.
+                Defaults to True.
+            max_faces (int, optional): with catalog, only sample meshes with at most max_faces faces.
+                Defaults to 0 (= no limit).
+            complexity_weighting (float, optional): with catalog, weight meshes by n_faces ** -complexity_weighting.
+                Defaults to 0.0 (= uniform).
         """
         self._logger = log_utils.get_logger()
         log_utils.add_file_handler(self._logger)
         self._parent = self._get_abc_parent_dir(data_dir)
         self._object_types_map = self._get_object_types_map()
+        self._catalog = ABCCatalog(self._parent, self._object_types_map) if use_catalog else None
+        self._max_faces = max_faces
+        self._complexity_weighting = complexity_weighting
 
     @property
     def object_types(self):
@@ -167,6 +342,10 @@ class ABCDataLoader(object):
             object_type = random.sample(self.object_types, 1)[0]
         self._logger.debug(f"object_type={object_type}")
         dir_path = osp.join(self._parent, self._object_types_map[object_type]["folder"], "STL")
+        if filename is None and self._catalog is not None:
+            filename = self._catalog.sample(object_type, self._max_faces, self._complexity_weighting)
+            if filename is None:
+                self._logger.warning(f"no valid STL file for object type {object_type} in catalog")
         if filename is None:
             filename = random.sample(os.listdir(dir_path), 1)[0]
         self._logger.debug(f"filename={filename}")
@@ -241,19 +420,13 @@ class STLImporter(object):
         scale = min_scale + delta * np.random.rand(1)[0]
         self._logger.debug(f"obj {obj.name}, randomized scale = {scale}")
         # obj.scale *= scale  # scaling causes issues with physics
-        for ver in obj.data.vertices:
-            old = ver.co
-            for i in range(3):
-                ver.co[i] = old[i] * scale
+        set_vertices(obj.data, get_vertices(obj.data) * scale)
         return True
 
     @staticmethod
     def _set_origin_to_center(obj):
         """Set mesh origin (coordinate system) to geomtric center"""
-        bpy.ops.object.select_all(action='DESELECT')
-        obj.select_set(True)
-        bpy.ops.object.origin_set(type='ORIGIN_CENTER_OF_MASS')
-        obj.select_set(False)
+        set_origin_to_center_of_mass(obj)
 
     def _set_physical_properties(self, obj, scene=None, mass=None, collision_margin=None):
         """Set required phyisical properties
@@ -278,14 +451,7 @@ class STLImporter(object):
 
         _scene = bpy.data.scenes[scene]
 
-        bpy.ops.object.select_all(action='DESELECT')
-        obj.select_set(True)
-
-        if _scene.rigidbody_world is None:
-            self._logger.debug("adding a rigidbody_world to scene, i.e. a RigidBodyWorld collection")
-            bpy.ops.rigidbody.world_add()
-
-        bpy.ops.rigidbody.object_add()
+        add_rigid_body(obj, _scene)
         if obj.rigid_body is None:
             raise AssertionError("Failed to link object to rigidbody_world collection")
 
@@ -343,7 +509,7 @@ class STLImporter(object):
 
         self._set_origin_to_center(obj)
 
-        obj.active_material = self._mat_gen.get_material()
+        self._mat_gen.assign_material(obj)
 
         self._set_physical_properties(obj)
 
@@ -352,7 +518,8 @@ class STLImporter(object):
 
 class ABCImporter(object):
     """Import ABC STL into blender session and assign material and physical properties"""
-    def __init__(self, data_dir=None, n_materials=3, collision_margin=0.0001, density=8000):
+    def __init__(self, data_dir=None, n_materials=3, collision_margin=0.0001, density=8000,
+                 max_faces=0, complexity_weighting=0.0, material_pool=False):
         """Configuration
 
         Args:
@@ -361,12 +528,22 @@ class ABCImporter(object):
             density (float, optional): density in [kg/m^3]. Default to 8000, for Steel.
             collision_margin (float, optional): collision_margin in [m]. Defaults to 0.0001.
             Physics simulation params are necessary for randomized object placement.
+            max_faces (int, optional): only import meshes with at most max_faces faces. Defaults to 0 (= no limit).
+            complexity_weighting (float, optional): sample meshes with probability proportional to
+                n_faces ** -complexity_weighting. Defaults to 0.0 (= uniform).
+            material_pool (bool, optional): if True, use a single template material with per-object
+                randomized parameters (see MetallicMaterialPool) instead of n_materials separate
+                materials. Defaults to False.
         """
         self._logger = log_utils.get_logger()
         log_utils.add_file_handler(self._logger)
-        self._dataloader = ABCDataLoader(data_dir=data_dir)
-        material_generator = MetallicMaterialGenerator()
-        material_generator.make_random_material(n=n_materials)
+        self._dataloader = ABCDataLoader(
+            data_dir=data_dir, max_faces=max_faces, complexity_weighting=complexity_weighting)
+        if material_pool:
+            material_generator = MetallicMaterialPool()
+        else:
+            material_generator = MetallicMaterialGenerator()
+            material_generator.make_random_material(n=n_materials)
         self._stl_importer = STLImporter(
             material_generator, units="METERS", enable_physics=True, collision_margin=collision_margin, density=density)
 
@@ -397,10 +574,7 @@ class ABCImporter(object):
             stl_fullpath, name, size_limits=(lower_limit, upper_limit), mass=mass, collision_margin=collision_margin)
 
         if not rescale_success:
-            bpy.ops.object.select_all(action="DESELECT")
-            # bpy.context.scene.objects.active = None
-            obj_handle.select_set(True)
-            bpy.ops.object.delete()
+            delete_object(obj_handle)
             return None, None
 
         return obj_handle, object_type
@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 - for information on the respective copyright owner
+# see the NOTICE file and/or the repository
+# <https://github.com/boschresearch/amira-blender-rendering>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Run several blender processes with render_dataset in parallel on one machine.
+
+Each worker renders a contiguous, deterministic slice of the scenes of a
+dataset into the same output directories. Since filenames only depend on the
+scene and view index, the output of all workers forms a single dataset once
+all workers are done. The output of all workers is collected in one log file,
+and the overall progress is printed to the console. Workers that crash are
+restarted from the first scene they did not complete.
+
+The functions to split a dataset into shards are also used to render shards
+of a dataset in array jobs on a cluster (see scripts/slurm and scripts/lsf).
+
+NOTE: this module must not depend on bpy, because it is used from scripts/abrgen
+"""
+
+import os
+import re
+import time
+import threading
+import subprocess
+import configparser
+
+# message logged by the scenes after each completed scene
+_progress_pattern = re.compile(r'Completed scene (\d+)/(\d+)')
+# lines that are forwarded to the console in addition to progress information
+_console_pattern = re.compile(r'ERROR|CRITICAL|Traceback')
+
+
+def get_scene_count(config_file: str, argv: list = None):
+    """Determine the number of scenes of a dataset from a configuration file.
+
+    Only the relevant entries of the configuration are read, such that this
+    works without blender. Overrides on the command line (e.g.
+    --dataset.image_count 100) are taken into account.
+
+    Args:
+        config_file(str): path to configuration file
+        argv(list): command line arguments for render_dataset
+
+    Returns:
+        number of scenes to render
+    """
+    argv = [] if argv is None else argv
+
+    def _get_arg(name):
+        if name in argv and argv.index(name) < len(argv) - 1:
+            return argv[argv.index(name) + 1]
+        return None
+
+    cfg = configparser.ConfigParser(interpolation=None)
+    cfg.read(os.path.expanduser(os.path.expandvars(config_file)))
+    image_count = int(_get_arg('--dataset.image_count') or cfg.get('dataset', 'image_count', fallback=1))
+    scene_count = int(_get_arg('--dataset.scene_count') or cfg.get('dataset', 'scene_count', fallback=1))
+
+    # see postprocess_config of the scenes: in default mode, each image is one scene
+    if _get_arg('--render-mode') == 'multiview':
+        return max(1, scene_count)
+    return image_count
+
+
+def get_images_per_scene(config_file: str, argv: list = None):
+    """Determine the number of images that are rendered per scene from a configuration file.
+
+    Args:
+        config_file(str): path to configuration file
+        argv(list): command line arguments for render_dataset
+
+    Returns:
+        number of cameras times number of views per scene
+    """
+    argv = [] if argv is None else argv
+    cfg = configparser.ConfigParser(interpolation=None)
+    cfg.read(os.path.expanduser(os.path.expandvars(config_file)))
+    cameras = [c for c in cfg.get('scene_setup', 'cameras', fallback='').split(',') if c.strip()]
+    view_count = 1
+    if '--render-mode' in argv and argv[argv.index('--render-mode') + 1:][:1] == ['multiview']:
+        view_count = max(1, int(cfg.get('dataset', 'view_count', fallback=1)))
+    return max(1, len(cameras)) * view_count
+
+
+def get_shard_range(scene_count: int, shard_index: int, num_shards: int):
+    """Get the range of scenes of one shard, if scenes are split into contiguous shards of (almost) equal size.
+
+    Args:
+        scene_count(int): number of scenes
+        shard_index(int): index of the shard in [0, num_shards)
+        num_shards(int): number of shards
+
+    Returns:
+        tuple (start, stop) of scene indices. The range is empty if there are more shards than scenes
+    """
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(f'Invalid shard index {shard_index} for {num_shards} shards')
+    return shard_index * scene_count // num_shards, (shard_index + 1) * scene_count // num_shards
+
+
+def get_num_shards(scene_count: int, images_per_scene: int, seconds_per_image: float, walltime: float):
+    """Get the number of shards such that rendering one shard fits into a given walltime.
+
+    Args:
+        scene_count(int): number of scenes
+        images_per_scene(int): number of images rendered per scene
+        seconds_per_image(float): (measured) time to render one image
+        walltime(float): time available to render one shard, in seconds
+
+    Returns:
+        number of shards
+
+    Raises:
+        ValueError: if not even a single scene can be rendered within the walltime
+    """
+    scenes_per_shard = int(walltime // (seconds_per_image * images_per_scene))
+    if scenes_per_shard < 1:
+        raise ValueError(f'Walltime of {walltime}s too short to render a single scene with {images_per_scene} '
+                         f'images at {seconds_per_image}s per image')
+    return max(1, -(-scene_count // scenes_per_shard))
+
+
+def split_scenes(scene_count: int, num_workers: int, scene_start: int = 0):
+    """Split scenes into contiguous slices of (almost) equal size.
+
+    Args:
+        scene_count(int): number of scenes
+        num_workers(int): number of slices
+
+    Optional Args:
+        scene_start(int): index of the first scene, e.g. the start of a shard. Default: 0
+
+    Returns:
+        list of (start, stop) tuples. Empty slices are omitted
+    """
+    ranges = [get_shard_range(scene_count, k, num_workers) for k in range(num_workers)]
+    return [(scene_start + start, scene_start + stop) for start, stop in ranges if stop > start]
+
+
+def read_scene_list(path: str):
+    """Read indices of scenes from a file with one index per line, e.g. a repair list
+    written by abr_dataset_tools.validate. Empty lines and lines starting with # are ignored.
+
+    Args:
+        path(str): path to file
+
+    Returns:
+        list of scene indices
+    """
+    with open(os.path.expanduser(os.path.expandvars(path)), 'r') as f:
+        lines = [line.split('#', 1)[0].strip() for line in f]
+    return [int(line) for line in lines if line]
+
+
+def get_scene_ranges(scenes):
+    """Merge scene indices into contiguous ranges.
+
+    Args:
+        scenes(iterable): scene indices
+
+    Returns:
+        sorted list of (start, stop) tuples
+    """
+    ranges = list()
+    for s in sorted(set(scenes)):
+        if ranges and ranges[-1][1] == s:
+            ranges[-1] = (ranges[-1][0], s + 1)
+        else:
+            ranges.append((s, s + 1))
+    return ranges
+
+
+class Worker():
+    """A blender process that renders a slice of scenes"""
+
+    def __init__(self, index: int, scene_range: tuple, cmd: list, max_restarts: int = 3):
+        self.index = index
+        self.start, self.stop = scene_range
+        self.next_scene = self.start
+        self.cmd = cmd
+        self.restarts = 0
+        self.max_restarts = max_restarts
+        self.process = None
+        self._reader = None
+
+    @property
+    def completed(self):
+        return self.next_scene - self.start
+
+    @property
+    def done(self):
+        return self.next_scene >= self.stop
+
+    def launch(self, on_line):
+        """Start (or restart) the process from the first scene not completed yet
+
+        Args:
+            on_line(callable): called with (worker, line) for each line of output
+        """
+        cmd = self.cmd + ['--scene-start', str(self.next_scene), '--scene-stop', str(self.stop)]
+        self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                        universal_newlines=True, bufsize=1)
+        self._reader = threading.Thread(target=self._read, args=(self.process, on_line), daemon=True)
+        self._reader.start()
+
+    def _read(self, process, on_line):
+        for line in process.stdout:
+            match = _progress_pattern.search(line)
+            if match is not None:
+                # scenes are reported with 1-based indices
+                self.next_scene = max(self.next_scene, int(match.group(1)))
+            on_line(self, line.rstrip('\n'))
+
+    def poll(self):
+        """Return the exit code of the process, or None if it is still running"""
+        if self.process is None:
+            return None
+        returncode = self.process.poll()
+        if returncode is not None:
+            # make sure that all output was processed
+            self._reader.join()
+        return returncode
+
+    def terminate(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+
+
+class Launcher():
+    """Run and supervise several render_dataset workers.
+
+    Args:
+        cmd(list): blender command to run render_dataset, including all
+            arguments for render_dataset except the scene range
+        scene_count(int): number of scenes to render
+        num_workers(int): number of parallel workers
+
+    Optional Args:
+        scene_start(int): index of the first scene to render, e.g. the start of a shard. Default: 0
+        threads(int): number of render threads per worker. Default: cpu_count / num_workers
+        max_restarts(int): max number of restarts per crashed worker. Default: 3
+        log_file(str): file to which the output of all workers is written. Default: None
+    """
+
+    def __init__(self, cmd: list, scene_count: int, num_workers: int, scene_start: int = 0, threads: int = None,
+                 max_restarts: int = 3, log_file: str = None):
+        if threads is None:
+            threads = max(1, (os.cpu_count() or 1) // num_workers)
+        # blender arguments have to come before -P. By default, blender exits
+        # with code 0 even if the python script raised an exception
+        cmd = [cmd[0], '-t', str(threads), '--python-exit-code', '1'] + cmd[1:]
+        self.scene_count = scene_count
+        ranges = split_scenes(scene_count, num_workers, scene_start)
+        self.workers = [Worker(k, r, cmd, max_restarts) for k, r in enumerate(ranges)]
+        self.log_file = log_file
+        self._log = None
+        self._lock = threading.Lock()
+
+    def _on_line(self, worker, line):
+        with self._lock:
+            if self._log is not None:
+                self._log.write(f'[worker {worker.index}] {line}\n')
+                self._log.flush()
+            if _progress_pattern.search(line) is not None:
+                self.print_progress()
+            elif _console_pattern.search(line) is not None:
+                print(f'[worker {worker.index}] {line}', flush=True)
+
+    def print_progress(self):
+        completed = sum(w.completed for w in self.workers)
+        per_worker = ', '.join(f'{w.completed}/{w.stop - w.start}' for w in self.workers)
+        print(f'Progress: {completed}/{self.scene_count} scenes [{per_worker}]', flush=True)
+
+    def run(self, poll_interval: float = 1.0):
+        """Run all workers until they are done or failed too often.
+
+        Returns:
+            True if all scenes were rendered, False otherwise
+        """
+        if self.log_file is not None:
+            self._log = open(self.log_file, 'a')
+        running = list(self.workers)
+        failed = []
+        try:
+            for worker in running:
+                worker.launch(self._on_line)
+
+            while running:
+                time.sleep(poll_interval)
+                for worker in list(running):
+                    returncode = worker.poll()
+                    if returncode is None:
+                        continue
+                    if worker.done:
+                        running.remove(worker)
+                    elif worker.restarts < worker.max_restarts:
+                        worker.restarts += 1
+                        print(f'Worker {worker.index} exited with code {returncode} before completing its scenes. '
+                              f'Restarting from scene {worker.next_scene} '
+                              f'({worker.restarts}/{worker.max_restarts})', flush=True)
+                        worker.launch(self._on_line)
+                    else:
+                        print(f'Worker {worker.index} failed. Scenes {worker.next_scene} to {worker.stop - 1} '
+                              f'were not rendered', flush=True)
+                        running.remove(worker)
+                        failed.append(worker)
+        finally:
+            for worker in running:
+                worker.terminate()
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+        self.print_progress()
+        return len(failed) == 0
@@ -96,8 +96,8 @@ def get_cmd_argparser():
 
     parser.add_argument(
         '--config',
-        required=True,
-        help='Path to configuration file')
+        default=None,
+        help='Path to configuration file. Required unless --list-scenes or --help without a configuration is used')
 
     parser.add_argument(
         '--abr-path',
@@ -110,6 +110,41 @@ def get_cmd_argparser():
         help='Select render mode. Currently supported: default (ie single view), multiview (ie moving cameras) dataset',
         dest='render_mode')
 
+    parser.add_argument(
+        '--scene-start',
+        type=int,
+        default=0,
+        dest='scene_start',
+        help='Index of the first scene to render. Default: 0')
+
+    parser.add_argument(
+        '--scene-stop',
+        type=int,
+        default=None,
+        dest='scene_stop',
+        help='Index of the scene after the last one to render. Default: render until the last scene')
+
+    parser.add_argument(
+        '--shard-index',
+        type=int,
+        default=None,
+        dest='shard_index',
+        help='Render only the given shard of scenes, see --num-shards. Overrides --scene-start/--scene-stop')
+
+    parser.add_argument(
+        '--num-shards',
+        type=int,
+        default=1,
+        dest='num_shards',
+        help='Number of contiguous shards of (almost) equal size the scenes are split into. Default: 1')
+
+    parser.add_argument(
+        '--scene-list',
+        default=None,
+        dest='scene_list',
+        help='File with indices of scenes to render, one per line, e.g. a repair list written by '
+             'abr_dataset_tools.validate. Overrides --scene-start/--scene-stop and --shard-index')
+
     parser.add_argument(
         '--list-scenes',
         action='store_true',
@@ -137,9 +172,31 @@ def get_cmd_argparser():
     return parser
 
 
-def get_scene_types():
+def get_scene_names():
+    """Get the names of all available scenes without importing any of them"""
+    from amira_blender_rendering.scenes import get_scene_names as _get_scene_names
+    return _get_scene_names()
+
+
+def get_scene_type(scene_type_str: str):
+    """Get the scene and config classes of a scene, importing only the module of this scene.
+
+    Args:
+        scene_type_str(str): (case insensitive) name of the scene
+
+    Returns:
+        dict with entries 'scene' and 'config'
+
+    Raises:
+        RuntimeError: if the scene is unknown
+    """
     from amira_blender_rendering.scenes import get_registered
-    return get_registered()
+    # scene types in configuration files are case insensitive
+    names = dict((name.lower(), name) for name in get_scene_names())
+    try:
+        return get_registered(names.get(scene_type_str.lower(), scene_type_str))
+    except ValueError:
+        raise RuntimeError(f"Invalid configuration: Unknown scene_type {scene_type_str}")
 
 
 def determine_scene_type(config_file):
@@ -166,7 +223,7 @@ def main():
     # print help if requested
     # NOTE: we check for config since if config are given also all the avaliable config will be printed.
     # However, if no configs are given, calling --help will still work
-    if cmd_args.help and 'config' not in cmd_args:
+    if cmd_args.help and cmd_args.config is None:
         cmd_parser.print_help()
         sys.exit(0)
 
@@ -177,23 +234,21 @@ def main():
     logger = configure_logger(cmd_args.logging_level)
 
     # pretty print available scenarios?
-    scene_types = get_scene_types()
     if cmd_args.list_scenes:
         print("List of possible scenes:")
-        for k, _ in scene_types.items():
+        for k in get_scene_names():
             print(f"   {k}")
         sys.exit(0)
 
-    # change all keys to lower-case
-    scene_types = dict((k.lower(), v) for k, v in scene_types.items())
+    if cmd_args.config is None:
+        cmd_parser.error('the following arguments are required: --config')
 
-    # check scene_type in config
+    # check scene_type in config. Only the module of this scene will be imported
     scene_type_str = determine_scene_type(cmd_args.config)
-    if scene_type_str.lower() not in scene_types:
-        raise RuntimeError(f"Invalid configuration: Unknown scene_type {scene_type_str}")
+    scene_type = get_scene_type(scene_type_str)
 
     # instantiate configuration
-    config = scene_types[scene_type_str.lower()]['config']()
+    config = scene_type['config']()
 
     # combine parsers and parse command line arguments
     parser = argparse.ArgumentParser(
@@ -220,14 +275,26 @@ def main():
     #       to run the script twice, with two different configurations, to
     #       generate the split. This is significantly easier than internally
     #       maintaining split configurations.
-    scene = scene_types[scene_type_str.lower()]['scene'](config=config, render_mode=cmd_args.render_mode)
+    scene_range = (cmd_args.scene_start, cmd_args.scene_stop)
+    if cmd_args.shard_index is not None:
+        from amira_blender_rendering.cli.launcher import get_scene_count, get_shard_range
+        scene_range = get_shard_range(get_scene_count(configfile, argv), cmd_args.shard_index, cmd_args.num_shards)
+        logger.info(f"Rendering shard {cmd_args.shard_index}/{cmd_args.num_shards}: scenes {scene_range}")
+    scene_ranges = [scene_range]
+    if cmd_args.scene_list is not None:
+        from amira_blender_rendering.cli.launcher import read_scene_list, get_scene_ranges
+        scene_ranges = get_scene_ranges(read_scene_list(cmd_args.scene_list))
+        logger.info(f"Rendering scenes {scene_ranges} from {cmd_args.scene_list}")
+    scene = scene_type['scene'](config=config, render_mode=cmd_args.render_mode, scene_range=scene_range)
     # save the config early. In case something goes wrong during rendering, we
     # at least have the config + potentially some images
     scene.dump_config()
 
-    # generate the dataset
-    success = False
-    success = scene.generate_dataset()
+    # generate the dataset. A scene list is rendered as contiguous ranges
+    success = True
+    for r in scene_ranges:
+        scene.scene_range = r
+        success = scene.generate_dataset() and success
     if not success:
         logger.error("Error while generating dataset")
 
@@ -24,21 +24,33 @@ things to certain scenarios which has an impact on the generated dataset.
 import os
 # from math import ceil
 from amira_blender_rendering.utils.io import expandpath
+from amira_blender_rendering.utils.texture import TextureIndex
 from amira_blender_rendering.datastructures import DynamicStruct
 
 
-def get_environment_textures(base_path):
+def get_environment_textures(base_path, **kwargs):
     """Determine if the user wants to set specific environment texture, or
     randomly select from a directory
 
+    Directories are handled via a persistent, lazily loaded TextureIndex (see
+    utils.texture), i.e. the directory is not listed at every call and only
+    valid image files are returned.
+
     Args:
-        cfg(Configuration): config with render setup
+        base_path(str): path to single texture file or to directory with textures
+
+    Kwargs Args:
+        min_size(int): min size (in pixels) of the shorter image side
+        min_aspect(float): min aspect ratio (width / height). If 0, no limit
+        max_aspect(float): max aspect ratio (width / height). If 0, no limit
+
+    Returns:
+        sequence of texture filepaths
     """
     # this rise a KeyError if 'environment_texture' not in cfg
     environment_textures = expandpath(base_path)
     if os.path.isdir(environment_textures):
-        files = os.listdir(environment_textures)
-        environment_textures = [os.path.join(environment_textures, f) for f in files]
+        environment_textures = TextureIndex(environment_textures, **kwargs)
     else:
         environment_textures = [environment_textures]
 
@@ -24,9 +24,10 @@ In particular, it specifies how rendering results should be stored.
 import os
 import pathlib
 import bpy
+import numpy as np
 from math import ceil, log
 from amira_blender_rendering.datastructures import filter_state_keys
-from amira_blender_rendering.math.geometry import rotation_matrix_to_quaternion
+from amira_blender_rendering.math.geometry import rotation_matrices_to_quaternions
 from amira_blender_rendering.utils.logging import get_logger
 import amira_blender_rendering.utils.blender as blnd
 
@@ -75,12 +76,8 @@ def _save_camera_locations_to_blend(name: str, locations: list, filepath: str):
 
     tmp_cameras = []
     for location in locations:
-        blnd.select_object(name)
-        bpy.ops.object.duplicate()
-        # TODO: remove from original collection to avoid name clutter in .blend
-        tmp_cam_obj = bpy.context.object
+        tmp_cam_obj = blnd.duplicate_object(bpy.data.objects[name], linked=False, collections=[tmp_cam_coll])
         tmp_cam_obj.location = location
-        tmp_cam_coll.objects.link(tmp_cam_obj)
         tmp_cameras.append(tmp_cam_obj)
     bpy.context.evaluated_depsgraph_get().update()
 
@@ -88,12 +85,29 @@ def _save_camera_locations_to_blend(name: str, locations: list, filepath: str):
     bpy.ops.wm.save_as_mainfile(filepath=filepath)
 
     # clear objects and collection
-    bpy.ops.object.select_all(action='DESELECT')
+    blnd.deselect_all()
     for tmp_cam in tmp_cameras:
         bpy.data.objects.remove(tmp_cam)
     bpy.data.collections.remove(tmp_cam_coll)
 
 
+def get_scene_range(scene_range, scene_count: int):
+    """Get the range of scene indices to render.
+
+    Args:
+        scene_range(tuple): None, or (start, stop) of scenes to render, where
+            stop is exclusive and can be None to render until the last scene
+        scene_count(int): total number of scenes in the dataset
+
+    Returns:
+        tuple (start, stop) clamped to [0, scene_count]
+    """
+    start, stop = (0, None) if scene_range is None else scene_range
+    start = min(max(0, int(start or 0)), scene_count)
+    stop = scene_count if stop is None else min(max(start, int(stop)), scene_count)
+    return start, stop
+
+
 # TODO: derive scenes in abr.scenes from this class
 class ABRScene():
     """interface of functions that each sccene needs to adhere to"""
@@ -245,6 +259,254 @@ class ResultsCollection:
         return [r.state_dict(retain_keys) for r in self]
 
 
+class PoseResultsArrays:
+    """Columnar collection of pose render results, e.g. of all objects of one frame.
+
+    Ids, visibility, poses and boxes are stored in preallocated numpy arrays (one row per
+    object) instead of one PoseRenderResult per object. Results can be added in bulk
+    (add_batch), are converted to the json schema of PoseRenderResult.state_dict column by
+    column, and can be exported as arrays (to_arrays, save_npz) without going through python
+    objects. Optional fields (e.g. boxes of invisible objects) are tracked by a validity mask
+    per field and are None in the state dict.
+
+    The interface of ResultsCollection (add_result, get_results, state_dict, ...) is supported
+    for compatibility.
+
+    Optional Args:
+        capacity(int): number of rows to preallocate. Arrays grow if required. Default: 16
+    """
+
+    # name -> (shape of a row, dtype)
+    _fields = {
+        'object_class_id': ((), np.int64),
+        'object_id': ((), np.int64),
+        'visible': ((), np.bool_),
+        'q': ((4,), np.float64),
+        't': ((3,), np.float64),
+        'corners2d': ((2, 2), np.int64),
+        'corners3d': ((9, 2), np.float64),
+        'aabb': ((9, 3), np.float64),
+        'oobb': ((9, 3), np.float64),
+        'q_cam': ((4,), np.float64),
+        't_cam': ((3,), np.float64),
+    }
+    _str_fields = ('object_class_name', 'object_name', 'mask_name')
+
+    def __init__(self, capacity: int = 16):
+        capacity = max(1, capacity)
+        self._size = 0
+        self._arrays = {name: np.zeros((capacity,) + shape, dtype=dtype)
+                        for name, (shape, dtype) in self._fields.items()}
+        self._valid = {name: np.zeros(capacity, dtype=bool) for name in self._fields}
+        self._strings = {name: list() for name in self._str_fields}
+        self._dense_features = list()
+
+    def _reserve(self, count):
+        capacity = len(self._valid['q'])
+        if self._size + count <= capacity:
+            return
+        capacity = max(2 * capacity, self._size + count)
+        for name, array in self._arrays.items():
+            self._arrays[name] = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            self._arrays[name][:self._size] = array[:self._size]
+            valid = self._valid[name]
+            self._valid[name] = np.zeros(capacity, dtype=bool)
+            self._valid[name][:self._size] = valid[:self._size]
+
+    def _set(self, name, values, count):
+        """Set field of the last count rows. Values is None, an array of count rows, or a list with None entries"""
+        rows = slice(self._size - count, self._size)
+        if values is None:
+            self._valid[name][rows] = False
+        elif isinstance(values, (list, tuple)) and any(v is None for v in values):
+            for i, v in enumerate(values):
+                self._set_row(name, self._size - count + i, v)
+        else:
+            self._arrays[name][rows] = np.reshape(values, (count,) + self._fields[name][0])
+            self._valid[name][rows] = True
+
+    def _set_row(self, name, row, value):
+        if value is None:
+            self._valid[name][row] = False
+        else:
+            self._arrays[name][row] = np.reshape(value, self._fields[name][0])
+            self._valid[name][row] = True
+
+    @staticmethod
+    def _to_quaternions(rotations, count):
+        """Convert (count, 3, 3) matrices or (count, 4) quaternions (WXYZ) to quaternions"""
+        if rotations is None or (isinstance(rotations, (list, tuple)) and any(r is None for r in rotations)):
+            return None if rotations is None else [try_rotation_to_quaternion(r) for r in rotations]
+        rotations = np.asarray(rotations)
+        if rotations.shape == (count, 3, 3):
+            return rotation_matrices_to_quaternions(rotations)
+        if rotations.shape == (count, 4):
+            return rotations
+        raise ValueError('Rotations must be either (N,3,3) matrices or (N,4) quaternions (WXYZ)')
+
+    def add_batch(self, object_class_name, object_class_id, object_name, object_id, rotation, translation,
+                  corners2d=None, corners3d=None, aabb=None, oobb=None, mask_name=None, visible=None,
+                  camera_rotation=None, camera_translation=None):
+        """Add results of several objects at once.
+
+        Args:
+            object_class_name(list(str)): class names
+            object_class_id(array(N)): class ids
+            object_name(list(str)): instance names
+            object_id(array(N)): instance ids
+            rotation(array(N,3,3) or array(N,4)): rotations as matrices or quaternions (WXYZ)
+            translation(array(N,3)): translations
+
+        Optional Args:
+            corners2d(array(N,2,2)), corners3d(array(N,9,2)), aabb(array(N,9,3)), oobb(array(N,9,3)): boxes,
+                see PoseRenderResult. None, or list with None for missing boxes. Default: None
+            mask_name(list(str)): mask names. Default: None ('' for all)
+            visible(array(N)): visibility flags. Default: None
+            camera_rotation(array(N,3,3) or array(N,4)): camera rotations. Default: None
+            camera_translation(array(N,3)): camera translations. Default: None
+        """
+        count = len(object_class_name)
+        self._reserve(count)
+        self._size += count
+        self._strings['object_class_name'].extend(object_class_name)
+        self._strings['object_name'].extend(object_name)
+        self._strings['mask_name'].extend([''] * count if mask_name is None else mask_name)
+        self._dense_features.extend([None] * count)
+        columns = {
+            'object_class_id': object_class_id,
+            'object_id': object_id,
+            'visible': visible,
+            'q': self._to_quaternions(rotation, count),
+            't': translation,
+            'corners2d': corners2d,
+            'corners3d': corners3d,
+            'aabb': aabb,
+            'oobb': oobb,
+            'q_cam': self._to_quaternions(camera_rotation, count),
+            't_cam': camera_translation,
+        }
+        for name, values in columns.items():
+            self._set(name, values, count)
+
+    def add_result(self, r):
+        """add single result (PoseRenderResult)"""
+        self._reserve(1)
+        row = self._size
+        self._size += 1
+        for name in self._str_fields:
+            self._strings[name].append(getattr(r, name))
+        self._dense_features.append(r.dense_features)
+        for name in self._fields:
+            self._set_row(name, row, getattr(r, name))
+
+    def add_results(self, res):
+        """add results from a list"""
+        for r in res:
+            self.add_result(r)
+
+    def convert_units(self, unit_conversion):
+        """Convert translations and 3D boxes of all results, e.g. with math.conversions.bu_to_mm"""
+        if unit_conversion is None:
+            return
+        for name in ('t', 't_cam', 'aabb', 'oobb'):
+            self._arrays[name][:self._size] = unit_conversion(self._arrays[name][:self._size])
+
+    def _get(self, name, row):
+        return self._arrays[name][row] if self._valid[name][row] else None
+
+    def get_result(self, idx):
+        """Get result at given index as PoseRenderResult"""
+        idx = range(self._size)[idx]
+        # convert numpy scalars to python types
+        class_id, object_id, visible = [self._get(name, idx) for name in ('object_class_id', 'object_id', 'visible')]
+        return PoseRenderResult(
+            object_class_name=self._strings['object_class_name'][idx],
+            object_class_id=None if class_id is None else int(class_id),
+            object_name=self._strings['object_name'][idx],
+            object_id=None if object_id is None else int(object_id),
+            rgb_const=None, rgb_random=None, depth=None, mask=None,
+            rotation=self._get('q', idx), translation=self._get('t', idx),
+            corners2d=self._get('corners2d', idx), corners3d=self._get('corners3d', idx),
+            aabb=self._get('aabb', idx), oobb=self._get('oobb', idx),
+            dense_features=self._dense_features[idx],
+            mask_name=self._strings['mask_name'][idx],
+            visible=None if visible is None else bool(visible),
+            camera_rotation=self._get('q_cam', idx),
+            camera_translation=self._get('t_cam', idx))
+
+    def get_results(self):
+        return [self.get_result(i) for i in range(self._size)]
+
+    def __iter__(self):
+        for i in range(self._size):
+            yield self.get_result(i)
+
+    def __len__(self):
+        return self._size
+
+    def to_arrays(self):
+        """Get all results as dict of arrays with one row per result. For each numeric field,
+        the validity mask is given as {name}_valid. Strings are given as unicode arrays.
+        """
+        data = dict()
+        for name in self._fields:
+            data[name] = self._arrays[name][:self._size].copy()
+            data[f'{name}_valid'] = self._valid[name][:self._size].copy()
+        for name in self._str_fields:
+            data[name] = np.array(self._strings[name], dtype=str)
+        return data
+
+    def save_npz(self, path: str):
+        """Save all results as arrays to a (uncompressed) npz file, see to_arrays"""
+        np.savez(path, **self.to_arrays())
+
+    def state_dict(self, retain_keys: list = None):
+        """Make results serializable (for writing out), in the schema of PoseRenderResult.state_dict.
+        Filter result keys if desired.
+
+        Opt Args:
+            retain_keys([]): list of keys to retain when converting to state_dict
+        """
+        if retain_keys is None:
+            retain_keys = []
+        n = self._size
+        # convert each column to python lists at once, instead of each row separately
+        columns = {name: self._arrays[name][:n].tolist() for name in self._fields}
+        valid = {name: self._valid[name][:n].tolist() for name in self._fields}
+
+        def _get(name, i):
+            return columns[name][i] if valid[name][i] else None
+
+        data = list()
+        for i in range(n):
+            d = {
+                "object_class_name": self._strings['object_class_name'][i],
+                "object_class_id": _get('object_class_id', i),
+                "object_name": self._strings['object_name'][i],
+                "object_id": _get('object_id', i),
+                "mask_name": self._strings['mask_name'][i],
+                "visible": _get('visible', i),
+                "pose": {
+                    "q": _get('q', i),
+                    "t": _get('t', i),
+                },
+                "bbox": {
+                    "corners2d": _get('corners2d', i),
+                    "corners3d": _get('corners3d', i),
+                    "aabb": _get('aabb', i),
+                    "oobb": _get('oobb', i)
+                },
+                "camera_pose": {
+                    "q": _get('q_cam', i),
+                    "t": _get('t_cam', i)
+                }
+            }
+            if self._dense_features[i] is not None:
+                d['dense_features'] = try_to_list(self._dense_features[i])
+            data.append(filter_state_keys(d, retain_keys))
+        return data
+
+
 class PoseRenderResult:
 
     def __init__(self, object_class_name, object_class_id, object_name, object_id,
@@ -349,7 +611,7 @@ def try_rotation_to_quaternion(rotation):
         q = None
     else:
         if rotation.shape == (3, 3):
-            q = rotation_matrix_to_quaternion(rotation)
+            q = rotation_matrices_to_quaternions(rotation[None])[0]
         else:
             q = rotation.flatten()
             if q.shape != (4,):
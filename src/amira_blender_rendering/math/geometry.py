@@ -27,6 +27,7 @@ from math import pi
 from mathutils import Vector, Euler
 from mathutils.bvhtree import BVHTree
 from amira_blender_rendering.utils.logging import get_logger
+import amira_blender_rendering.utils.mesh as mesh_utils
 import numpy as np
 
 
@@ -94,6 +95,90 @@ def p2d_to_pixel_coords(p: Vector, render: bpy.types.RenderSettings = bpy.contex
                    (render.resolution_y - 1) * (p.y - 1.0) / -2.0))
 
 
+def get_projection_matrix(camera: bpy.types.Object = bpy.context.scene.camera,
+                          render: bpy.types.RenderSettings = bpy.context.scene.render):
+    """Get the matrix that maps homogeneous world coordinates to (homogeneous) normalized
+    device coordinates, i.e. the product of projection and model-view matrix used in project_p3d
+
+    Args:
+        camera (bpy.types.Object): blender camera to use for projection
+        render (bpy.types.RenderSettings): render settings used for computation
+
+    Returns:
+        np.array of shape (4, 4)
+    """
+    if camera.type != 'CAMERA':
+        raise Exception(f"Object {camera.name} is not a camera")
+
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    projection = camera.calc_matrix_camera(
+        depsgraph,
+        x=render.resolution_x,
+        y=render.resolution_y,
+        scale_x=render.pixel_aspect_x,
+        scale_y=render.pixel_aspect_y)
+    return np.array(projection @ camera.matrix_world.inverted())
+
+
+def project_points_to_pixels(points, projection_matrix, resolution_x: int, resolution_y: int):
+    """Project 3D points to pixel coordinates, vectorized version of project_p3d and p2d_to_pixel_coords
+
+    Args:
+        points (np.array): array of shape (..., 3) of points in world coordinates
+        projection_matrix (np.array): (4, 4) matrix, see get_projection_matrix
+        resolution_x (int): image width
+        resolution_y (int): image height
+
+    Returns:
+        np.array of shape (..., 2) with pixel coordinates. Points infinitely far away are nan
+    """
+    points = np.asarray(points, dtype=np.float64)
+    p_hom = points @ projection_matrix[:, :3].T + projection_matrix[:, 3]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        w = np.where(p_hom[..., 3:] == 0.0, np.nan, p_hom[..., 3:])
+        ndc = p_hom[..., :2] / w
+    return np.stack(((resolution_x - 1) * (ndc[..., 0] + 1.0) / +2.0,
+                     (resolution_y - 1) * (ndc[..., 1] - 1.0) / -2.0), axis=-1)
+
+
+def compute_3dbboxes(bound_boxes, matrices_world, projection_matrix, resolution_x: int, resolution_y: int,
+                     order=(1, 0, 2, 3, 5, 4, 6, 7)):
+    """Compute axis aligned and object oriented 3D bounding boxes, and the projected corners,
+    of several objects at once.
+
+    The layout is the same as in RenderManager.compute_3dbbox: the first row is the
+    centroid, followed by the 8 corners reordered from blender's bound_box order.
+
+    Args:
+        bound_boxes (np.array): (K, 8, 3) bounding boxes in object coordinates (obj.bound_box)
+        matrices_world (np.array): (K, 4, 4) object world matrices (obj.matrix_world)
+        projection_matrix (np.array): (4, 4) matrix, see get_projection_matrix
+        resolution_x (int): image width
+        resolution_y (int): image height
+
+    Optional Args:
+        order (tuple): permutation of the corners
+
+    Returns:
+        tuple of np.arrays aabb (K, 9, 3), oobb (K, 9, 3), corners3d (K, 9, 2)
+    """
+    bound_boxes = np.asarray(bound_boxes, dtype=np.float64).reshape(-1, 8, 3)
+    matrices_world = np.asarray(matrices_world, dtype=np.float64).reshape(-1, 4, 4)
+    order = list(order)
+
+    # axis aligned (no object rotation)
+    aa_centroid = bound_boxes[:, 0] + (bound_boxes[:, 6] - bound_boxes[:, 0]) / 2.0
+    aabb = np.concatenate((aa_centroid[:, None], bound_boxes[:, order]), axis=1)
+
+    # object aligned (that is, including object rotation)
+    oobb = np.einsum('kij,knj->kni', matrices_world[:, :3, :3], bound_boxes) + matrices_world[:, None, :3, 3]
+    oo_centroid = oobb[:, 0] + (oobb[:, 6] - oobb[:, 0]) / 2.0
+    oobb = np.concatenate((oo_centroid[:, None], oobb[:, order]), axis=1)
+
+    corners3d = project_points_to_pixels(oobb, projection_matrix, resolution_x, resolution_y)
+    return aabb, oobb, corners3d
+
+
 def get_relative_rotation(obj1: bpy.types.Object, obj2: bpy.types.Object = bpy.context.scene.camera) -> Euler:
     """Get the relative rotation between two objects in terms of the second
     object's coordinate system. Note that the second object will be default
@@ -199,6 +284,43 @@ def get_relative_transform(obj1: bpy.types.Object, obj2: bpy.types.Object = bpy.
     return t, r
 
 
+def get_relative_poses(matrices_world, camera_matrix_world, zeroing=(90, 0, 0)):
+    """Get the poses of several objects relative to a camera at once, in OpenGL and OpenCV convention.
+
+    This is the vectorized version of get_relative_translation and
+    get_relative_rotation_to_cam_deg followed by gl2cv. Object scales are
+    removed by normalizing the columns of the rotation part of the world
+    matrices, and the camera matrix is inverted only once.
+
+    Args:
+        matrices_world (np.array): (K, 4, 4) object world matrices (obj.matrix_world)
+        camera_matrix_world (np.array): (4, 4) camera world matrix (cam.matrix_world)
+
+    Optional Args:
+        zeroing (tuple): camera zeroing angles (in degrees), see get_relative_rotation_to_cam_rad.
+            Default: (90, 0, 0)
+
+    Returns:
+        tuple of np.arrays R_gl (K, 3, 3), t_gl (K, 3), R_cv (K, 3, 3), t_cv (K, 3)
+    """
+    matrices_world = np.asarray(matrices_world, dtype=np.float64).reshape(-1, 4, 4)
+    camera_matrix_world = np.asarray(camera_matrix_world, dtype=np.float64)
+
+    obj_m = matrices_world[:, :3, :3]
+    obj_m = obj_m / np.linalg.norm(obj_m, axis=1, keepdims=True)
+    cam_m = camera_matrix_world[:3, :3]
+    cam_m_inv = np.linalg.inv(cam_m / np.linalg.norm(cam_m, axis=0, keepdims=True))
+
+    # zeroing rotation, XYZ euler angles
+    zeroing = np.asarray(zeroing, dtype=np.float64) * pi / 180
+    cam_rot = euler_z_to_matrix(zeroing[2]) @ euler_y_to_matrix(zeroing[1]) @ euler_x_to_matrix(zeroing[0])
+
+    R_gl = (cam_rot @ cam_m_inv) @ obj_m
+    t_gl = (matrices_world[:, :3, 3] - camera_matrix_world[:3, 3]) @ cam_m_inv.T
+    R_cv, t_cv = gl2cv(R_gl, t_gl)
+    return R_gl, t_gl, R_cv, t_cv
+
+
 def test_visibility(obj, cam, width, height, require_all=True):
     """Test if an object is visible from a camera by projecting the bounding box
     of the object and testing if the vertices are visible from the camera or not.
@@ -229,6 +351,26 @@ def test_visibility(obj, cam, width, height, require_all=True):
         return all(oks) if require_all else any(oks)
 
 
+def _scene_ray_cast(scene, layer, origin, direction, distance=1.70141e+38):
+    """Cast a ray into the scene, independent of the blender version.
+
+    Args:
+        scene: the scene in which to cast the ray
+        layer: view layer to use for ray casting, e.g. scene.view_layers['View Layer']
+        origin(Vector): origin of the ray
+        direction(Vector): direction of the ray
+        distance(float): maximum distance of the ray
+
+    Returns:
+        hit record (hit, location, normal, index, object, matrix) as returned by scene.ray_cast
+    """
+    # scene.ray_cast has changed its interface in blender 2.91
+    try:
+        return scene.ray_cast(layer, origin, direction, distance=distance)
+    except TypeError:
+        return scene.ray_cast(layer.depsgraph, origin, direction, distance=distance)
+
+
 def test_occlusion(scene, layer, cam, obj, width, height, require_all=True, origin_offset=0.01):
     """Test if an object is visible or occluded by another object by checking its vertices.
     Note that this also tests if an object is visible.
@@ -261,51 +403,55 @@ def test_occlusion(scene, layer, cam, obj, width, height, require_all=True, orig
     # world matrix
     mesh = obj.evaluated_get(dg).to_mesh()
     origin = cam.matrix_world.to_translation()
-    vs = [obj.matrix_world @ v.co for v in mesh.vertices]
+    vs = mesh_utils.get_world_vertices(obj, mesh)
     obj.to_mesh_clear()
 
-    # compute projected vertices
-    ps = [project_p3d(v, cam, render=render) for v in vs]
-    if None in ps:
+    # project all vertices at once (see project_p3d and p2d_to_pixel_coords)
+    modelview = cam.matrix_world.inverted()
+    projection = cam.calc_matrix_camera(
+        dg,
+        x=render.resolution_x,
+        y=render.resolution_y,
+        scale_x=render.pixel_aspect_x,
+        scale_y=render.pixel_aspect_y)
+    ps_hom = mesh_utils.transform_points(projection @ modelview, vs, homogeneous=True)
+    if np.any(ps_hom[:, 3] == 0.0):
         return True
-
-    # compute pixel coordinates for each vertex
-    pxs = [p2d_to_pixel_coords(p, render=render) for p in ps]
+    ps = ps_hom[:, :2] / ps_hom[:, 3:]
+    pxs_x = (render.resolution_x - 1) * (ps[:, 0] + 1.0) / +2.0
+    pxs_y = (render.resolution_y - 1) * (ps[:, 1] - 1.0) / -2.0
 
     # keep track of what is going on
-    vs_visible = [px[0] >= 0 and px[0] < width and px[1] >= 0 and px[1] < height for px in pxs]
-    vs_occluded = [False] * len(vs)
+    vs_visible = (pxs_x >= 0) & (pxs_x < width) & (pxs_y >= 0) & (pxs_y < height)
+    if require_all and not np.all(vs_visible):
+        return True
 
-    for i, v in enumerate(vs):
+    # cast rays only where the result can still change
+    for v in (vs if require_all else vs[vs_visible]):
         # compute direction of ray from camera to this vertex and perform cast
-        direction = v - origin
+        direction = Vector(v) - origin
         direction.normalize()
         # 'repair' the origin by walking along the ray by a little offset
         local_origin = origin + origin_offset * direction
-        # scene.ray_cast has changed its interface in blender 2.91
-        try:
-            hit_record = scene.ray_cast(layer, local_origin, direction)
-        except TypeError:
-            hit_record = scene.ray_cast(layer.depsgraph, local_origin, direction)
+        hit_record = _scene_ray_cast(scene, layer, local_origin, direction)
         hit = hit_record[0]
         # hit_location = hit_record[1]
         hit_obj = hit_record[4]
 
         # assume hit
-        if hit and not (hit_obj.type == 'CAMERA') and not (hit_obj == obj):
-            vs_occluded[i] = True
+        occluded = hit and not (hit_obj.type == 'CAMERA') and not (hit_obj == obj)
+        if require_all and occluded:
+            # one vertex is occluded
+            return True
+        if not require_all and not occluded:
+            # one vertex is visible and not occluded
+            return False
 
-    if require_all:
-        return not (all(vs_visible) and all([not oc for oc in vs_occluded]))
-    else:
-        for i in range(len(vs_visible)):
-            if vs_visible[i] and not vs_occluded[i]:
-                return False
-        return True
+    return not require_all
 
 
-def _get_bvh(obj):
-    """Get the BVH for an object
+def get_bvh(obj):
+    """Get the BVH for an object in world coordinates
 
     Args:
         obj (variant): object to get the BVH for
@@ -313,10 +459,9 @@ def _get_bvh(obj):
     Returns:
         BVH for obj
     """
-    mat = obj.matrix_world
-    vs = [mat @ v.co for v in obj.data.vertices]
-    ps = [p.vertices for p in obj.data.polygons]
-    return BVHTree.FromPolygons(vs, ps)
+    vs = mesh_utils.get_world_vertices(obj)
+    ps = mesh_utils.get_polygons(obj.data)
+    return BVHTree.FromPolygons(vs.tolist(), [p.tolist() for p in ps])
 
 
 def test_intersection(obj1, obj2):
@@ -324,14 +469,92 @@ def test_intersection(obj1, obj2):
 
     Returns true if objects intersect, false if not.
     """
-    bvh1 = _get_bvh(obj1)
-    bvh2 = _get_bvh(obj2)
+    bvh1 = get_bvh(obj1)
+    bvh2 = get_bvh(obj2)
     if bvh1.overlap(bvh2):
         return True
     else:
         return False
 
 
+def get_bounding_sphere(obj):
+    """Get a sphere enclosing the bounding box of an object in world coordinates
+
+    Args:
+        obj (bpy.types.Object): object to get the bounding sphere for
+
+    Returns:
+        tuple containing the center (Vector) and the radius (float) of the sphere
+    """
+    vs = [obj.matrix_world @ Vector(v) for v in obj.bound_box]
+    center = sum(vs, Vector((0, 0, 0))) / len(vs)
+    radius = max([(v - center).length for v in vs])
+    return center, radius
+
+
+def test_bounding_sphere_intersection(obj1, obj2):
+    """Test if the bounding spheres of two objects intersect each other.
+
+    This is a cheap, conservative test. That is, if the bounding spheres do not
+    intersect, the objects do not intersect either. The opposite is not true.
+    Use test_intersection to get an exact result.
+
+    Returns true if the bounding spheres intersect, false if not.
+    """
+    c1, r1 = get_bounding_sphere(obj1)
+    c2, r2 = get_bounding_sphere(obj2)
+    return (c1 - c2).length <= r1 + r2
+
+
+def drop_to_support(scene, layer, obj, clearance=1e-4, max_distance=10.0):
+    """Move an object downwards (along -Z) until it rests on the surface below it.
+
+    The support surface is determined by casting rays downwards from the
+    lowest vertex of the object, from below its centroid, and from the four
+    bottom corners of its (world space) bounding box. All rays start at the
+    height of the lowest vertex. The object is then moved down by the shortest
+    of the hit distances, i.e. until it touches the highest point of the
+    support below it, offset by a small clearance. This keeps objects from
+    sinking into uneven or sloped surfaces, at the cost of objects possibly
+    resting slightly above the surface. Note that this does not perform any
+    physics simulation, i.e. the object might not be in a physically stable
+    resting position afterwards.
+
+    Args:
+        scene: the scene for which to drop the object
+        layer: view layer to use for ray casting, e.g. scene.view_layers['View Layer']
+        obj (bpy.types.Object): object to move
+        clearance (float): distance to keep between the object and the support surface
+        max_distance (float): maximum distance the object is allowed to drop
+
+    Returns:
+        True if a support surface was found and the object was moved, False otherwise
+    """
+    vs = mesh_utils.get_world_vertices(obj)
+    if not len(vs):
+        return False
+
+    # start rays slightly below the object to not hit the object itself
+    v_low = vs[np.argmin(vs[:, 2])]
+    centroid = vs.mean(axis=0)
+    v_min, v_max = vs[:, :2].min(axis=0), vs[:, :2].max(axis=0)
+    z = v_low[2] - clearance
+    origins = [Vector((v_low[0], v_low[1], z)), Vector((centroid[0], centroid[1], z))]
+    origins += [Vector((x, y, z)) for x in (v_min[0], v_max[0]) for y in (v_min[1], v_max[1])]
+
+    distances = []
+    direction = Vector((0, 0, -1))
+    for origin in origins:
+        hit, location, _, _, _, _ = _scene_ray_cast(scene, layer, origin, direction, distance=max_distance)
+        if hit:
+            distances.append(origin.z - location.z)
+    if not distances:
+        return False
+
+    obj.location.z -= min(distances)
+    return True
+
+
 def get_world_to_object_transform(cam2obj_pose: dict, camera: bpy.types.Object = bpy.context.scene.camera):
     """
     Transform a pose {'R', 't'} expressed in camera coordinates to world coordinates
@@ -375,19 +598,15 @@ def gl2cv(R, t):
     """Convert transform from OpenGL to OpenCV
 
     Args:
-        R(np.array(3,3): rotation matrix
-        t(np.array(3,): translation vector
+        R(np.array(3,3) or np.array(N,3,3)): rotation matrix (or matrices)
+        t(np.array(3,) or np.array(N,3)): translation vector (or vectors)
     Returns:
         R_cv
         t_cv
     """
-    M_gl = np.eye(4)
-    M_gl[:3, :3] = R
-    M_gl[:3, 3] = t
-    Ccv_Cgl = np.array([[1, 0, 0, 0], [0, -1, 0, 0], [0, 0, -1, 0], [0, 0, 0, 1]])
-    Cgl_W = Ccv_Cgl @ M_gl
-    # return as R and t, as expected by the docstring
-    return Cgl_W[:3, :3], Cgl_W[:3, 3]
+    # left multiplication with diag(1, -1, -1), i.e. a rotation of pi around x
+    Ccv_Cgl = np.array([1., -1., -1.])
+    return Ccv_Cgl[:, None] * np.asarray(R), Ccv_Cgl * np.asarray(t)
 
 
 def euler_x_to_matrix(angle):
@@ -530,3 +749,42 @@ def rotation_matrix_to_quaternion(rot_mat, isprecise=False):
     if q[0] < 0.0:
         np.negative(q, q)
     return q
+
+
+def rotation_matrices_to_quaternions(rot_mats):
+    """
+    Computes the quaternions (with convention WXYZ) of a batch of rotation matrices, vectorized.
+
+    Uses the closed form method of Shepperd: for each matrix, the component with the
+    largest magnitude (w, x, y or z) is computed from the diagonal, the others from
+    sums and differences of off-diagonal elements, which is numerically stable
+    for all rotations. As in rotation_matrix_to_quaternion, the sign is chosen such
+    that w >= 0.
+
+    Args:
+        rot_mats(np.array): rotation matrices of shape (N, 3, 3)
+
+    Returns:
+        np.array of shape (N, 4), quaternions (WXYZ)
+    """
+    R = np.asarray(rot_mats, dtype=np.float64).reshape(-1, 3, 3)
+    trace = R[:, 0, 0] + R[:, 1, 1] + R[:, 2, 2]
+    case = np.argmax(np.stack((trace, R[:, 0, 0], R[:, 1, 1], R[:, 2, 2]), axis=1), axis=1)
+
+    # differences and sums of off-diagonal elements
+    d = np.stack((R[:, 2, 1] - R[:, 1, 2], R[:, 0, 2] - R[:, 2, 0], R[:, 1, 0] - R[:, 0, 1]), axis=1)
+    s = np.stack((R[:, 1, 0] + R[:, 0, 1], R[:, 0, 2] + R[:, 2, 0], R[:, 1, 2] + R[:, 2, 1]), axis=1)
+
+    q = np.empty((len(R), 4))
+    c = case == 0  # w largest
+    q[c] = np.column_stack((1 + trace[c], d[c]))
+    c = case == 1  # x largest
+    q[c] = np.column_stack((d[c, 0], 1 + 2 * R[c, 0, 0] - trace[c], s[c, 0], s[c, 1]))
+    c = case == 2  # y largest
+    q[c] = np.column_stack((d[c, 1], s[c, 0], 1 + 2 * R[c, 1, 1] - trace[c], s[c, 2]))
+    c = case == 3  # z largest
+    q[c] = np.column_stack((d[c, 2], s[c, 1], s[c, 2], 1 + 2 * R[c, 2, 2] - trace[c]))
+
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    q[q[:, 0] < 0] *= -1
+    return q
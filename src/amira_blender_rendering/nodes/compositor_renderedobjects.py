@@ -170,6 +170,7 @@ class CompositorNodesOutputRenderedObjects():
             s_obj_mask.use_node_format = True
             tree.links.new(n_id_mask.outputs['Alpha'], n_output_file.inputs[mask_name])
             self.sockets[f"s_obj_mask{obj['id_mask']}"] = s_obj_mask
+            self.nodes[f"n_obj_mask{obj['id_mask']}"] = n_id_mask
 
         return self.sockets
 
@@ -215,8 +216,32 @@ class CompositorNodesOutputRenderedObjects():
         for obj in objs:
             self.sockets[f's_obj_mask{obj["id_mask"]}'].path = os.path.join(
                 self.path_mask, f'{self.base_filename}{obj["id_mask"]}.png####')
+        self.__update_mask_links()
         return self.sockets
 
+    def __update_mask_links(self):
+        """Connect the mask output slots of all objects in self.objs and disconnect all others.
+
+        Unconnected slots are not written by the file output node. This allows to
+        render only a subset of the objects passed to setup_nodes (e.g. in object
+        pool mode) without leaving stale mask files from previous paths behind.
+        """
+        tree = self.scene.node_tree
+        n_output_file = tree.nodes['RenderObjectsFileOutputNode']
+        slots = list(n_output_file.file_slots)
+        active = set(obj['id_mask'] for obj in self.objs)
+        for key, n_id_mask in self.nodes.items():
+            if not key.startswith('n_obj_mask'):
+                continue
+            id_mask = key[len('n_obj_mask'):]
+            # file slots and input sockets of the file output node share the same index
+            socket = n_output_file.inputs[slots.index(self.sockets[f's_obj_mask{id_mask}'])]
+            if id_mask in active and not socket.is_linked:
+                tree.links.new(n_id_mask.outputs['Alpha'], socket)
+            elif id_mask not in active and socket.is_linked:
+                for link in socket.links:
+                    tree.links.remove(link)
+
     def postprocess(self):
         """Postprocessing: Repair all filenames and make mask filenames accessible to
         each corresponding object.
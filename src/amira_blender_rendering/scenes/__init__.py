@@ -23,16 +23,42 @@ from .basescenemanager import BaseSceneManager  # noqa
 from .baseconfiguration import BaseConfiguration  # noqa
 from .threepointlighting import ThreePointLighting  # noqa
 
-# composition classes, if inheritance should or cannot be used
-from .rendermanager import RenderManager  # noqa
-
-# concrete scenes are autoimported later at the end of the file
+# concrete scenes are imported lazily, see get_registered
 import os
+import importlib
 from functools import partial
 from amira_blender_rendering.cli import _auto_import
 
+# composition classes, if inheritance should or cannot be used. They are
+# imported on first access (see __getattr__), because they depend on
+# amira_blender_rendering.math.geometry, which is not required to list scenes
+_lazy_attributes = {
+    'RenderManager': 'rendermanager',
+}
+
+
+def __getattr__(name: str):
+    """Import composition classes such as RenderManager on first access"""
+    if name in _lazy_attributes:
+        value = getattr(importlib.import_module(f'.{_lazy_attributes[name]}', __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f'module {__name__} has no attribute {name}')
+
+
 _available_scenes = {}
 
+# manifest of all scenes that ship with abr, mapping scene names to the module
+# in which the scene and its configuration are registered. This allows to list
+# scenes and to import only the module of a requested scene. Scenes that are
+# not listed here are still found, at the cost of importing all scene modules.
+_scene_manifest = {
+    'PandaTable': 'pandatable',
+    'SimpleObject': 'simpleobject',
+    'StaticScene': 'static',
+    'WorkstationScenarios': 'workstationscenarios',
+}
+
 
 def register(name: str, type: str = None):
     """Register a class/function to the specified available type.
@@ -70,18 +96,38 @@ def register(name: str, type: str = None):
     return partial(_register, name=name, obj_type=type)
 
 
+def _import_all():
+    """Import all scene modules, such that all scenes get registered"""
+    _auto_import(pkgname=__name__, dirname=os.path.dirname(__file__), subdirs=[''])
+
+
+def get_scene_names():
+    """Return the names of all known scenes without importing any scene module.
+
+    Returns:
+        list of names from the scene manifest and of all scenes registered so far
+    """
+    return sorted(set(_scene_manifest.keys()) | set(_available_scenes.keys()))
+
+
 def get_registered(name: str = None):
     """
     Return dictionary of available classes/function type registered via register(name, type)
 
+    If a name is given, only the module that implements the scene is imported
+    (see _scene_manifest). Otherwise, all scene modules are imported.
+
     Args:
         name(str): name of registered object to query
     """
     if name is None:
+        _import_all()
         return _available_scenes
+    if name not in _available_scenes:
+        if name in _scene_manifest:
+            importlib.import_module(f'.{_scene_manifest[name]}', __name__)
+        else:
+            _import_all()
     if name not in _available_scenes:
         raise ValueError(f'Queried type "{name}" not among availables: {list(_available_scenes.keys())}')
     return _available_scenes[name]
-
-
-_auto_import(pkgname=__name__, dirname=os.path.dirname(__file__), subdirs=[''])
@@ -66,6 +66,19 @@ class BaseConfiguration(Configuration):
         self.add_param('render_setup.motion_blur', False,
                        'If True, toggle motion blur during rendering.'
                        ' Motion blur specific config must be set directly in the .blend blnderer scene')
+        self.add_param('render_setup.texture_cache_mb', 1024,
+                       'Memory budget (MB) for environment textures kept loaded in blender. Default: 1024')
+        self.add_param('render_setup.texture_prefetch', 4,
+                       'Number of randomly chosen environment textures to prefetch in the background.'
+                       ' If 0, disable prefetching. Default: 4')
+        self.add_param('render_setup.texture_downscale', False,
+                       'If True, downscale environment textures to the resolution required by the camera FOV')
+        self.add_param('render_setup.texture_min_size', 0,
+                       'Use only environment textures whose shorter side has at least this many pixels. Default: 0')
+        self.add_param('render_setup.texture_min_aspect', 0.0,
+                       'Use only environment textures with at least this aspect ratio (width / height). 0: no limit')
+        self.add_param('render_setup.texture_max_aspect', 0.0,
+                       'Use only environment textures with at most this aspect ratio (width / height). 0: no limit')
 
         # debug
         self.add_param('debug.enabled', False, 'If True, enable debugging. For specifc flags refer to single scenes')
@@ -54,15 +54,22 @@ class BaseSceneManager():
             self.logger.error(f"Path {filepath} to environment texture does not exist.")
             return
 
+        # retrieve image object and set
+        img = blnd.load_img(filepath)
+        self.set_environment_image(img)
+
+    def set_environment_image(self, img):
+        """Set an already loaded image as environment texture for the scene
+
+        Args:
+            img(bpy.types.Image): image datablock to use as environment texture
+        """
         # add new environment texture node if required
         tree = bpy.context.scene.world.node_tree
         nodes = tree.nodes
         if 'Environment Texture' not in nodes:
             nodes.new('ShaderNodeTexEnvironment')
         n_envtex = nodes['Environment Texture']
-
-        # retrieve image object and set
-        img = blnd.load_img(filepath)
         n_envtex.image = img
 
         # setup link (doesn't matter if already exists, won't duplicate)
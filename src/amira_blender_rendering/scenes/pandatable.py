@@ -33,6 +33,7 @@ from math import ceil, log
 from amira_blender_rendering.utils import camera as camera_utils
 from amira_blender_rendering.utils.io import expandpath
 from amira_blender_rendering.utils.logging import get_logger
+from amira_blender_rendering.utils.texture import EnvironmentTextureManager
 from amira_blender_rendering.dataset import get_environment_textures, build_directory_info, dump_config
 import amira_blender_rendering.scenes as abr_scenes
 import amira_blender_rendering.math.geometry as abr_geom
@@ -68,6 +69,8 @@ class PandaTableConfiguration(abr_scenes.BaseConfiguration):
         self.add_param('scenario_setup.distractor_objects', [],
                        'List of objects to drop in the scene for which info are NOT stored'
                        'List of objects visible in the scene but of which infos are not stored')
+        self.add_param('scenario_setup.linked_instances', False,
+                       'If True, all instances of an object share the same mesh data (linked duplicates)')
         self.add_param('scenario_setup.textured_objects', [],
                        'List of objects whose texture is randomized during rendering')
         self.add_param('scenario_setup.objects_textures', '', 'Path to images for object textures')
@@ -106,6 +109,9 @@ class PandaTable(interfaces.ABRScene):
 
         # determine if we are rendering in multiview mode
         self.render_mode = kwargs.get('render_mode', 'default')
+
+        # range (start, stop) of scene indices to render, e.g. when running several workers in parallel
+        self.scene_range = kwargs.get('scene_range', None)
         if self.render_mode not in ['default', 'multiview']:
             self.logger.warn(f'render mode "{self.render_mode}" not supported. Falling back to "default"')
             self.render_mode = 'default'
@@ -298,6 +304,7 @@ class PandaTable(interfaces.ABRScene):
         # let's start with an empty list
         objs = []
         obk = ObjectBookkeeper()
+        linked_instances = self.config.scenario_setup.linked_instances
 
         # first reset the render pass index for all panda model objects (links,
         # hand, etc)
@@ -326,17 +333,20 @@ class PandaTable(interfaces.ABRScene):
                 # split off the prefix for all files that we load from blender
                 class_name = class_name[6:]
 
-            # TODO: file loading happens only very late in this loop. This might
-            #       be an issue for large object counts and could be changed to
-            #       load-once copy-often.
+            # in linked instancing mode, objects are loaded once and all further
+            # instances are linked duplicates that share the same mesh data
+            prototype = None
             for j in range(int(obj_count)):
-                # First, deselect everything
-                bpy.ops.object.select_all(action='DESELECT')
-                if is_proto_object:
+                if linked_instances and is_proto_object:
+                    # linked duplicate of proto-object
+                    new_obj = blnd.duplicate_object(bpy.data.objects[class_name], linked=True)
+                elif linked_instances and prototype is not None:
+                    # linked duplicate of the first instance loaded from file
+                    new_obj = blnd.duplicate_object(prototype, linked=True)
+                    new_obj.name = f'{class_name}.{j:03d}'
+                elif is_proto_object:
                     # duplicate proto-object
-                    blnd.select_object(class_name)
-                    bpy.ops.object.duplicate()
-                    new_obj = bpy.context.object
+                    new_obj = blnd.duplicate_object(bpy.data.objects[class_name], linked=False)
                 else:
                     # we need to load this object from file. This could be
                     # either a blender file, or a PLY file
@@ -359,8 +369,7 @@ class PandaTable(interfaces.ABRScene):
                         new_obj.name = f'{class_name}.{j:03d}'
                         # try to rescale object according to its blend_scale if given in the config
                         try:
-                            new_obj.scale = Vector(self.config.parts.blend_scale[class_name])
-                            bpy.ops.object.transform_apply(location=False, rotation=False, scale=True, properties=False)
+                            blnd.apply_scale(new_obj, self.config.parts.blend_scale[class_name])
                         except KeyError:
                             # log and keep going
                             self.logger.info(f'No blend_scale for obj {class_name} given. Skipping!')
@@ -374,12 +383,14 @@ class PandaTable(interfaces.ABRScene):
                         new_obj.name = f'{class_name}.{j:03d}'
                         # try to rescale object according to its ply_scale if given in the config
                         try:
-                            new_obj.scale = Vector(self.config.parts.ply_scale[class_name])
-                            bpy.ops.object.transform_apply(location=False, rotation=False, scale=True, properties=False)
+                            blnd.apply_scale(new_obj, self.config.parts.ply_scale[class_name])
                         except KeyError:
                             # log and keep going
                             self.logger.info(f'No ply_scale for obj {class_name} given. Skipping!')
 
+                if prototype is None:
+                    prototype = new_obj
+
                 # move object to collection: in case of debugging
                 try:
                     collection = bpy.data.collections[bpy_collection]
@@ -418,7 +429,16 @@ class PandaTable(interfaces.ABRScene):
 
     def setup_environment_textures(self):
         # get list of environment textures
-        self.environment_textures = get_environment_textures(self.config.scene_setup.environment_textures)
+        self.environment_textures = get_environment_textures(
+            self.config.scene_setup.environment_textures,
+            min_size=self.config.render_setup.texture_min_size,
+            min_aspect=self.config.render_setup.texture_min_aspect,
+            max_aspect=self.config.render_setup.texture_max_aspect)
+        self.texture_manager = EnvironmentTextureManager(
+            self.environment_textures,
+            capacity_mb=self.config.render_setup.texture_cache_mb,
+            prefetch=self.config.render_setup.texture_prefetch,
+            downscale=self.config.render_setup.texture_downscale)
 
     def setup_textured_objects(self):
         # get list of textures
@@ -472,8 +492,9 @@ class PandaTable(interfaces.ABRScene):
 
     def randomize_environment_texture(self):
         # set some environment texture, randomize, and render
-        env_txt_filepath = expandpath(random.choice(self.environment_textures))
-        self.renderman.set_environment_texture(env_txt_filepath)
+        img = self.texture_manager.sample()
+        if img is not None:
+            self.renderman.set_environment_image(img)
 
     def randomize_textured_objects_textures(self):
         for obj_name in self.config.scenario_setup.textured_objects:
@@ -499,9 +520,7 @@ class PandaTable(interfaces.ABRScene):
             name(str): camera name
             location(array-like): camera location
         """
-        # select camera
-        blnd.select_object(name)
-        # set pose
+        # set pose. NOTE: selecting the camera is not required here
         bpy.data.objects[name].location = location
 
     def get_camera_name(self, cam_str):
@@ -619,8 +638,8 @@ class PandaTable(interfaces.ABRScene):
                         basefilename='robottable_camera_locations')
 
         # control loop for the number of static scenes to render
-        scn_counter = 0
-        while scn_counter < self.config.dataset.scene_count:
+        scn_counter, scn_stop = interfaces.get_scene_range(self.scene_range, self.config.dataset.scene_count)
+        while scn_counter < scn_stop:
 
             # randomize scene: move objects at random locations, and forward simulate physics
             self.randomize_environment_texture()
@@ -735,6 +754,8 @@ class PandaTable(interfaces.ABRScene):
 
             # update scene counter
             if not repeat_frame:
+                # NOTE: this message is used by the parallel launcher to track progress
+                self.logger.info(f"Completed scene {scn_counter + 1}/{self.config.dataset.scene_count}")
                 scn_counter = scn_counter + 1
 
         return True
@@ -750,5 +771,5 @@ class PandaTable(interfaces.ABRScene):
 
     def teardown(self):
         """Tear down the scene"""
-        # nothing to do
-        pass
+        # stop prefetching of environment textures
+        self.texture_manager.close()
@@ -20,7 +20,6 @@
 intermediate steps."""
 
 import bpy
-from mathutils import Vector
 
 import os
 import numpy as np
@@ -38,7 +37,7 @@ import amira_blender_rendering.math.geometry as abr_geom
 from amira_blender_rendering.math.conversions import bu_to_mm
 
 # import things from AMIRA Perception Subsystem that are required
-from amira_blender_rendering.interfaces import PoseRenderResult, ResultsCollection
+from amira_blender_rendering.interfaces import ResultsCollection, PoseResultsArrays
 from amira_blender_rendering.postprocessing import boundingbox_from_mask
 from amira_blender_rendering.utils.logging import get_logger
 from amira_blender_rendering.utils.io import read_numpy_image_buffer
@@ -130,19 +129,8 @@ class RenderManager(abr_scenes.BaseSceneManager):
                                                            scale=postprocess_config.depth_scale)
 
         # compute bounding boxes and save annotations
-        results_gl = ResultsCollection()
-        results_cv = ResultsCollection()
-        for obj in objs:
-            render_result_gl, render_result_cv = self.build_render_result(
-                obj, camera, zeroing, postprocess_config.visibility_from_mask)
-            if obj['visible']:
-                results_gl.add_result(render_result_gl)
-                results_cv.add_result(render_result_cv)
-        # if there's no visible object, add single instance results to have general scene information annotated
-        if len(results_gl) == 0:
-            results_gl.add_result(render_result_gl)
-        if len(results_cv) == 0:
-            results_cv.add_result(render_result_cv)
+        results_gl, results_cv = self.build_render_results(
+            objs, camera, zeroing, postprocess_config.visibility_from_mask)
         self.save_annotations(dirinfo, base_filename, results_gl, results_cv)
 
     def setup_renderer(self, integrator: str, enable_denoising: bool, samples: int, motion_blur: bool):
@@ -204,12 +192,17 @@ class RenderManager(abr_scenes.BaseSceneManager):
 
         return result
 
-    def build_render_result(self, obj, camera, zeroing, visibility_from_mask: bool = False):
-        """Create render result.
+    def build_render_results(self, objs: list, camera, zeroing, visibility_from_mask: bool = False):
+        """Create the render results of all objects of a frame at once.
+
+        Poses, camera poses and boxes are computed as arrays for all objects,
+        and added to the results with a single PoseResultsArrays.add_batch per
+        convention.
 
         Args:
-            obj(dict): object dictionary to operate on
+            objs(list): list of object dictionaries to operate on
             camera: blender camera object
+            zeroing(np.array): camera zeroing angles (in degrees)
 
         Opt Args:
             visibility_from_mask(bool): if True, if mask is found empty even if object
@@ -217,96 +210,95 @@ class RenderManager(abr_scenes.BaseSceneManager):
                             set to false
 
         Returns:
-            PoseRenderResult
-            """
-
-        # create a pose render result. leave image fields empty, they will
-        # currenlty not go to the state dict. this is only here to make sure
-        # that we actually get the state dict defined in pose render result
-        t = np.asarray(abr_geom.get_relative_translation(obj['bpy'], camera))
-        R = np.asarray(abr_geom.get_relative_rotation_to_cam_deg(obj['bpy'], camera, Vector(zeroing)).to_matrix())
-
-        # camera world coordinate transformation
-        t_cam = np.asarray(camera.matrix_world.to_translation())
-        R_cam = np.asarray(camera.matrix_world.to_3x3().normalized())
-
-        # compute bounding boxes
-        corners2d, corners3d, aabb, oobb = None, None, None, None
-        if obj['visible']:
-            # this rises a ValueError if mask info is not correct
-            corners2d = self.compute_2dbbox(obj['fname_mask'])
-            if corners2d is not None:
-                aabb, oobb, corners3d = self.compute_3dbbox(obj['bpy'])
-            elif visibility_from_mask:
+            tuple of PoseResultsArrays in OpenGL and OpenCV convention. Results contain
+            all visible objects. If no object is visible, the result of the last object
+            is given to have general scene information annotated
+        """
+        # compute 2D bounding boxes. This rises a ValueError if mask info is not correct
+        corners2d = dict()
+        for k, obj in enumerate(objs):
+            if not obj['visible']:
+                continue
+            corners2d[k] = self.compute_2dbbox(obj['fname_mask'])
+            if corners2d[k] is not None:
+                continue
+            if visibility_from_mask:
                 logger.warn(f'Given mask found empty. '
                             f'Overwriting visibility information for obj {obj["object_class_name"]}:{obj["object_id"]}')
                 obj['visible'] = False
             else:
                 self.logger.error('Invalid mask given')
                 raise ValueError('Invalid mask given')
-
-        render_result_gl = PoseRenderResult(
-            object_class_name=obj['object_class_name'],
-            object_class_id=obj['object_class_id'],
-            object_name=obj['bpy'].name,
-            object_id=obj['object_id'],
-            rgb_const=None,
-            rgb_random=None,
-            depth=None,
-            mask=None,
-            rotation=R,
-            translation=t,
-            corners2d=corners2d,
-            corners3d=corners3d,
-            aabb=aabb,
-            oobb=oobb,
-            mask_name=obj['id_mask'],
-            visible=obj['visible'],
-            camera_rotation=R_cam,
-            camera_translation=t_cam)
-
-        # build results in OpenCV format
-        R_cv, t_cv = abr_geom.gl2cv(R, t)
-
+        rows = [k for k, obj in enumerate(objs) if obj['visible']]
+        has_boxes = len(rows) > 0
+        if not has_boxes:
+            rows = list(range(len(objs)))[-1:]
+        count = len(rows)
+        sel = [objs[k] for k in rows]
+
+        # poses of all objects relative to the camera, and camera world pose
+        R, t, R_cv, t_cv = self.compute_relative_poses([obj['bpy'] for obj in objs], camera, zeroing)
+        R_cam = np.asarray(camera.matrix_world.to_3x3().normalized())
+        t_cam = np.tile(np.asarray(camera.matrix_world.to_translation()), (count, 1))
         # for the camera we only need to update the rotation. That is because in OpenCV
         # format it is assumed the camera looks towards positive z (rotation of pi around x)
         # Thus to express the rotation in world coordinate we post-multiply the rotation matrix.
         # However, its position/location wrt to the world coordinate system does not change.
         R_cam_cv = R_cam.dot(abr_geom.euler_x_to_matrix(np.pi))
-        t_cam_cv = t_cam
-
-        render_result_cv = PoseRenderResult(
-            object_class_name=obj['object_class_name'],
-            object_class_id=obj['object_class_id'],
-            object_name=obj['bpy'].name,
-            object_id=obj['object_id'],
-            rgb_const=None,
-            rgb_random=None,
-            depth=None,
-            mask=None,
-            rotation=R_cv,
-            translation=t_cv,
-            corners2d=corners2d,
-            corners3d=corners3d,
-            aabb=aabb,
-            oobb=oobb,
-            mask_name=obj['id_mask'],
-            visible=obj['visible'],
-            camera_rotation=R_cam_cv,
-            camera_translation=t_cam_cv)
-
-        # convert to desired units
-        render_result_gl = self.convert_units(render_result_gl)
-        render_result_cv = self.convert_units(render_result_cv)
-        return render_result_gl, render_result_cv
+        q_cam, q_cam_cv = abr_geom.rotation_matrices_to_quaternions(np.stack((R_cam, R_cam_cv)))
+
+        # 3D boxes of all visible objects at once
+        boxes = dict(corners2d=None, corners3d=None, aabb=None, oobb=None)
+        if has_boxes:
+            aabb, oobb, corners3d = self.compute_3dbboxes([obj['bpy'] for obj in sel])
+            boxes = dict(corners2d=np.array([corners2d[k] for k in rows]), corners3d=corners3d, aabb=aabb, oobb=oobb)
+
+        results = list()
+        for rotation, translation, camera_rotation in ((R, t, q_cam), (R_cv, t_cv, q_cam_cv)):
+            result = PoseResultsArrays(capacity=count)
+            result.add_batch(
+                object_class_name=[obj['object_class_name'] for obj in sel],
+                object_class_id=[obj['object_class_id'] for obj in sel],
+                object_name=[obj['bpy'].name for obj in sel],
+                object_id=[obj['object_id'] for obj in sel],
+                rotation=rotation[rows],
+                translation=translation[rows],
+                mask_name=[obj['id_mask'] for obj in sel],
+                visible=[obj['visible'] for obj in sel],
+                camera_rotation=np.tile(camera_rotation, (count, 1)),
+                camera_translation=t_cam,
+                **boxes)
+            # convert to desired units
+            result.convert_units(self.unit_conversion)
+            results.append(result)
+        return tuple(results)
+
+    def build_render_result(self, obj, camera, zeroing, visibility_from_mask: bool = False):
+        """Create render result of a single object, see build_render_results.
+
+        Args:
+            obj(dict): object dictionary to operate on
+            camera: blender camera object
+            zeroing(np.array): camera zeroing angles (in degrees)
+
+        Opt Args:
+            visibility_from_mask(bool): if True, if mask is found empty even if object
+                            is visible, visibility info are overwritten and
+                            set to false
+
+        Returns:
+            tuple of PoseRenderResult in OpenGL and OpenCV convention
+        """
+        results_gl, results_cv = self.build_render_results([obj], camera, zeroing, visibility_from_mask)
+        return results_gl.get_result(0), results_cv.get_result(0)
 
     def save_annotations(self, dirinfo, base_filename, results_gl: ResultsCollection, results_cv: ResultsCollection):
         """
         Save annotations of Render Results given in ResultsCollection
 
         Args:
-            results_gl(ResultsCollection): collection of <PoseRenderResult> in OpenGL convetion
-            results_cv(ResultsCollection): collection of <PoseRenderResult> in OpenCV convetion
+            results_gl(ResultsCollection or PoseResultsArrays): collection of <PoseRenderResult> in OpenGL convetion
+            results_cv(ResultsCollection or PoseResultsArrays): collection of <PoseRenderResult> in OpenCV convetion
         """
         # check if directory structure is already there
         for k in dirinfo.annotations:
@@ -382,57 +374,43 @@ class RenderManager(abr_scenes.BaseSceneManager):
         This differs from the order of the bounding box as it was used in
         OpenGL. Ignoring the first item (centroid), the following re-indexing is
         required to get it into the correct order: [1, 0, 2, 3, 5, 4, 6, 7].
-        This will be done after getting the aabb from blender, using function
-        reorder_bbox.
+        This is done in math.geometry.compute_3dbboxes.
 
-        TODO: probably, using numpy is not at all required, we could directly
-              store to lists. have to decide if we want this or not
+        Returns:
+            tuple of np.arrays aabb (9, 3), oobb (9, 3), corners3d (9, 2), where
+            the first row is the centroid
         """
+        aabb, oobb, corners3d = self.compute_3dbboxes([obj])
+        return aabb[0], oobb[0], corners3d[0]
 
-        # 0. storage for numpy arrays.
-        np_aabb = np.zeros((9, 3))
-        np_oobb = np.zeros((9, 3))
-        np_corners3d = np.zeros((9, 2))
-
-        # 1. get centroid and bounding box of object in world coordinates by
-        # applying the objects rotation matrix to the bounding box of the object
-
-        # axis aligned (no object rotation)
-        aabb = [Vector(v) for v in obj.bound_box]
-        # compute centroid
-        aa_centroid = aabb[0] + (aabb[6] - aabb[0]) / 2.0
-        # copy aabb before reordering to have access to it later
-        aabb_orig = aabb
-        # fix order of aabb for RenderedObjects
-        aabb = self.reorder_bbox(aabb)
-        # convert to numpy
-        np_aabb[0, :] = np.array((aa_centroid[0], aa_centroid[1], aa_centroid[2]))
-        for i in range(8):
-            np_aabb[i + 1, :] = np.array((aabb[i][0], aabb[i][1], aabb[i][2]))
+    def compute_relative_poses(self, objs: list, camera, zeroing):
+        """Compute the poses of several objects relative to a camera at once.
 
-        # object aligned (that is, including object rotation)
-        oobb = [obj.matrix_world @ v for v in aabb_orig]
-        # compute oo centroid
-        oo_centroid = oobb[0] + (oobb[6] - oobb[0]) / 2.0
-        # fix order for rendered objects
-        oobb = self.reorder_bbox(oobb)
+        Args:
+            objs(list): list of bpy.types.Object
+            camera(bpy.types.Object): camera
+            zeroing(np.array): camera zeroing angles (in degrees)
 
-        # convert to numpy
-        np_oobb[0, :] = np.array((oo_centroid[0], oo_centroid[1], oo_centroid[2]))
-        for i in range(8):
-            np_oobb[i + 1, :] = np.array((oobb[i][0], oobb[i][1], oobb[i][2]))
-
-        # project centroid+vertices and convert to pixel coordinates
-        corners3d = []
-        prj = abr_geom.project_p3d(oo_centroid, bpy.context.scene.camera)
-        pix = abr_geom.p2d_to_pixel_coords(prj)
-        corners3d.append(pix)
-        np_corners3d[0, :] = np.array((corners3d[-1][0], corners3d[-1][1]))
-
-        for i, v in enumerate(oobb):
-            prj = abr_geom.project_p3d(v, bpy.context.scene.camera)
-            pix = abr_geom.p2d_to_pixel_coords(prj)
-            corners3d.append(pix)
-            np_corners3d[i + 1, :] = np.array((corners3d[-1][0], corners3d[-1][1]))
-
-        return np_aabb, np_oobb, np_corners3d
+        Returns:
+            tuple of np.arrays R_gl (K, 3, 3), t_gl (K, 3), R_cv (K, 3, 3), t_cv (K, 3)
+        """
+        matrices_world = np.array([np.array(obj.matrix_world) for obj in objs]).reshape(-1, 4, 4)
+        return abr_geom.get_relative_poses(matrices_world, np.array(camera.matrix_world), zeroing)
+
+    def compute_3dbboxes(self, objs: list):
+        """Compute all 3D bounding boxes of several objects at once, see compute_3dbbox.
+
+        Corners are projected with the active camera of the scene.
+
+        Args:
+            objs(list): list of bpy.types.Object
+
+        Returns:
+            tuple of np.arrays aabb (K, 9, 3), oobb (K, 9, 3), corners3d (K, 9, 2)
+        """
+        render = bpy.context.scene.render
+        bound_boxes = np.array([[tuple(v) for v in obj.bound_box] for obj in objs]).reshape(-1, 8, 3)
+        matrices_world = np.array([np.array(obj.matrix_world) for obj in objs]).reshape(-1, 4, 4)
+        projection_matrix = abr_geom.get_projection_matrix(bpy.context.scene.camera, render)
+        return abr_geom.compute_3dbboxes(bound_boxes, matrices_world, projection_matrix,
+                                         render.resolution_x, render.resolution_y)
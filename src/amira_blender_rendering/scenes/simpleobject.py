@@ -22,12 +22,12 @@ import os
 from mathutils import Vector, Matrix
 import pathlib
 from math import ceil, log
-import random
 import numpy as np
 
 from amira_blender_rendering.utils import camera as camera_utils
 from amira_blender_rendering.utils.io import expandpath
 from amira_blender_rendering.utils.logging import get_logger
+from amira_blender_rendering.utils.texture import EnvironmentTextureManager
 from amira_blender_rendering.dataset import get_environment_textures, build_directory_info, dump_config
 import amira_blender_rendering.utils.blender as blnd
 import amira_blender_rendering.nodes as abr_nodes
@@ -73,6 +73,9 @@ class SimpleObject(interfaces.ABRScene):
             self.logger.warn(f'{self.__class__} scene supports only "default" render mode. Falling back to "default"')
             self.render_mode = 'default'
 
+        # range (start, stop) of scene indices to render, e.g. when running several workers in parallel
+        self.scene_range = kwargs.get('scene_range', None)
+
         # we might have to post-process the configuration
         self.postprocess_config()
 
@@ -233,19 +236,27 @@ class SimpleObject(interfaces.ABRScene):
 
     def setup_environment_textures(self):
         # get list of environment textures
-        self.environment_textures = get_environment_textures(self.config.scene_setup.environment_textures)
+        self.environment_textures = get_environment_textures(
+            self.config.scene_setup.environment_textures,
+            min_size=self.config.render_setup.texture_min_size,
+            min_aspect=self.config.render_setup.texture_min_aspect,
+            max_aspect=self.config.render_setup.texture_max_aspect)
+        self.texture_manager = EnvironmentTextureManager(
+            self.environment_textures,
+            capacity_mb=self.config.render_setup.texture_cache_mb,
+            prefetch=self.config.render_setup.texture_prefetch,
+            downscale=self.config.render_setup.texture_downscale)
 
     def _rescale_object(self, scale):
         try:
-            self.obj.scale = Vector(self.config.parts[scale][self.config.scenario_setup.target_object])
-            bpy.ops.object.transform_apply(location=False, rotation=False, scale=True, properties=False)
+            blnd.apply_scale(self.obj, self.config.parts[scale][self.config.scenario_setup.target_object])
         except KeyError:
             # log and keep going
             self.logger.info(f'No scale for obj {self.obj.name} given. Skipping!')
 
     def _import_object(self):
         """Import the mesh of the cap from a ply file."""
-        bpy.ops.object.select_all(action='DESELECT')
+        blnd.deselect_all()
         class_name = expandpath(self.config.scenario_setup.target_object)
         blendfile = expandpath(self.config.parts[class_name], check_file=False)
         # try blender file
@@ -312,8 +323,9 @@ class SimpleObject(interfaces.ABRScene):
 
     def randomize_environment_texture(self):
         # set some environment texture, randomize, and render
-        env_txt_filepath = expandpath(random.choice(self.environment_textures))
-        self.renderman.set_environment_texture(env_txt_filepath)
+        img = self.texture_manager.sample()
+        if img is not None:
+            self.renderman.set_environment_image(img)
 
     def set_pose(self, pose):
         """
@@ -369,8 +381,8 @@ class SimpleObject(interfaces.ABRScene):
             return False
         format_width = int(ceil(log(image_count, 10)))
 
-        i = 0
-        while i < self.config.dataset.image_count:
+        i, i_stop = interfaces.get_scene_range(self.scene_range, image_count)
+        while i < i_stop:
             # generate render filename: adhere to naming convention
             base_filename = f"s{i:0{format_width}}_v0"
 
@@ -397,9 +409,13 @@ class SimpleObject(interfaces.ABRScene):
             except ValueError:
                 self.logger.warn("ValueError during post-processing, re-generating image index {i}")
             else:
+                # NOTE: this message is used by the parallel launcher to track progress
+                self.logger.info(f"Completed scene {i + 1}/{image_count}")
                 i = i + 1
 
         return True
 
     def teardown(self):
-        pass
+        """Tear down the scene"""
+        # stop prefetching of environment textures
+        self.texture_manager.close()
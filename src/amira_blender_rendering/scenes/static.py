@@ -35,6 +35,7 @@ from math import ceil, log
 from amira_blender_rendering.utils import camera as camera_utils
 from amira_blender_rendering.utils.io import expandpath
 from amira_blender_rendering.utils.logging import get_logger
+from amira_blender_rendering.utils.texture import EnvironmentTextureManager
 from amira_blender_rendering.dataset import get_environment_textures, build_directory_info, dump_config
 import amira_blender_rendering.scenes as abr_scenes
 import amira_blender_rendering.math.geometry as abr_geom
@@ -105,6 +106,9 @@ class StaticScene(interfaces.ABRScene):
 
         # determine if we are rendering in multiview mode
         self.render_mode = kwargs.get('render_mode', 'default')
+
+        # range (start, stop) of scene indices to render, e.g. when running several workers in parallel
+        self.scene_range = kwargs.get('scene_range', None)
         if self.render_mode not in ['default', 'multiview']:
             self.logger.warn(f'render mode "{self.render_mode}" not supported. Falling back to "default"')
             self.render_mode = 'default'
@@ -314,14 +318,10 @@ class StaticScene(interfaces.ABRScene):
 
             # go over the object instances
             for j in range(int(obj_count)):
-                # First, deselect everything
-                bpy.ops.object.select_all(action='DESELECT')
-
                 # retrieve object name. We assume object instances follow the standard convention
                 # class_name.xxx where xxx is an increasing number starting at 000.
                 bpy_obj_name = f'{class_name}.{j:03d}'
-                blnd.select_object(bpy_obj_name)
-                new_obj = bpy.context.object
+                new_obj = bpy.data.objects[bpy_obj_name]
 
                 # bookkeep instance
                 obk.add(class_name)
@@ -351,7 +351,16 @@ class StaticScene(interfaces.ABRScene):
 
     def setup_environment_textures(self):
         # get list of environment textures
-        self.environment_textures = get_environment_textures(self.config.scene_setup.environment_textures)
+        self.environment_textures = get_environment_textures(
+            self.config.scene_setup.environment_textures,
+            min_size=self.config.render_setup.texture_min_size,
+            min_aspect=self.config.render_setup.texture_min_aspect,
+            max_aspect=self.config.render_setup.texture_max_aspect)
+        self.texture_manager = EnvironmentTextureManager(
+            self.environment_textures,
+            capacity_mb=self.config.render_setup.texture_cache_mb,
+            prefetch=self.config.render_setup.texture_prefetch,
+            downscale=self.config.render_setup.texture_downscale)
 
     def setup_textured_objects(self):
         # get list of textures
@@ -364,8 +373,9 @@ class StaticScene(interfaces.ABRScene):
 
     def randomize_environment_texture(self):
         # set some environment texture, randomize, and render
-        env_txt_filepath = expandpath(random.choice(self.environment_textures))
-        self.renderman.set_environment_texture(env_txt_filepath)
+        img = self.texture_manager.sample()
+        if img is not None:
+            self.renderman.set_environment_image(img)
 
     def randomize_textured_objects_textures(self):
         for obj_name in self.config.scenario_setup.textured_objects:
@@ -504,10 +514,10 @@ class StaticScene(interfaces.ABRScene):
                         basefilename='robottable_camera_locations')
 
         # control loop for the number of static scenes to render
-        scn_counter = 0
+        scn_counter, scn_stop = interfaces.get_scene_range(self.scene_range, self.config.dataset.scene_count)
         retry = 0
         MAX_RETRY = 5
-        while scn_counter < self.config.dataset.scene_count:
+        while scn_counter < scn_stop:
 
             # randomize scene: move objects at random locations, and forward simulate physics
             self.randomize_environment_texture()
@@ -625,6 +635,8 @@ class StaticScene(interfaces.ABRScene):
 
             # update scene counter
             if not repeat_frame:
+                # NOTE: this message is used by the parallel launcher to track progress
+                self.logger.info(f"Completed scene {scn_counter + 1}/{self.config.dataset.scene_count}")
                 scn_counter = scn_counter + 1
 
         return True
@@ -640,5 +652,5 @@ class StaticScene(interfaces.ABRScene):
 
     def teardown(self):
         """Tear down the scene"""
-        # nothing to do
-        pass
+        # stop prefetching of environment textures
+        self.texture_manager.close()
@@ -27,12 +27,12 @@ import os
 import pathlib
 from mathutils import Vector
 import numpy as np
-import random
 from math import ceil, log
 
 from amira_blender_rendering.utils import camera as camera_utils
 from amira_blender_rendering.utils.io import expandpath
 from amira_blender_rendering.utils.logging import get_logger, add_file_handler
+from amira_blender_rendering.utils.texture import EnvironmentTextureManager
 from amira_blender_rendering.datastructures import Configuration
 from amira_blender_rendering.dataset import get_environment_textures, build_directory_info, dump_config
 import amira_blender_rendering.scenes as abr_scenes
@@ -59,6 +59,11 @@ class WorkstationScenariosConfiguration(abr_scenes.BaseConfiguration):
                        'Path to background images / environment textures')
         self.add_param('scene_setup.cameras', ['CameraLeft', 'Camera', 'CameraRight'], 'Cameras to render')
         self.add_param('scene_setup.forward_frames', 15, 'Number of frames in physics forward-simulation')
+        self.add_param('scene_setup.placement_mode', 'physics',
+                       'How to place objects: physics (forward-simulate rigid bodies) or fast (sample '
+                       'non-intersecting poses and drop objects onto the surface below, without physics)')
+        self.add_param('scene_setup.placement_trials', 50,
+                       'Max number of pose samples per object before giving up in fast placement mode')
 
         # specific parts configuration. This is just a dummy entry for purposes
         # of demonstration and help message generation
@@ -81,8 +86,22 @@ class WorkstationScenariosConfiguration(abr_scenes.BaseConfiguration):
                        'List of objects to drop in the scene for which annotated info are stored')
         self.add_param('scenario_setup.distractor_objects', [],
                        'List of objects to drop in the scene for which info are NOT stored')
+        self.add_param('scenario_setup.linked_instances', False,
+                       'If True, all instances of an object share the same mesh data (linked duplicates)')
+        self.add_param('scenario_setup.object_pool', False,
+                       'If True, object numbers (ObjectType:Number) are maximum numbers. All objects are set up '
+                       'once, and each scene uses a random subset of them')
+        self.add_param('scenario_setup.object_pool_min', 0,
+                       'In object pool mode, minimum number of instances per object type used in each scene')
         self.add_param('scenario_setup.abc_objects', [], 'List of all ABC-Dataset objects to drop in environment')
         self.add_param('scenario_setup.num_abc_colors', 3, 'Number of random metallic materials to generate')
+        self.add_param('scenario_setup.abc_max_faces', 0,
+                       'Only use ABC-Dataset objects with at most this number of faces. 0: no limit')
+        self.add_param('scenario_setup.abc_complexity_weighting', 0.0,
+                       'Sample ABC-Dataset objects with probability proportional to n_faces^-w. 0: uniform')
+        self.add_param('scenario_setup.abc_material_pool', False,
+                       'If True, ABC-Dataset objects share one template material with per-object random '
+                       'parameters instead of num_abc_colors separate materials')
 
         # multiview configuration (if implemented)
         self.add_param('multiview_setup.mode', '',
@@ -121,6 +140,9 @@ class WorkstationScenarios(interfaces.ABRScene):
 
         # determine if we are rendering in multiview mode
         self.render_mode = kwargs.get('render_mode', 'default')
+
+        # range (start, stop) of scene indices to render, e.g. when running several workers in parallel
+        self.scene_range = kwargs.get('scene_range', None)
         if self.render_mode not in ['default', 'multiview']:
             self.logger.warn(f'render mode "{self.render_mode}" not supported. Falling back to "default"')
             self.render_mode = 'default'
@@ -156,6 +178,8 @@ class WorkstationScenarios(interfaces.ABRScene):
                                        abc_bpy_collection='ABCObjects')
         self.distractors = self.setup_objects(self.config.scenario_setup.distractor_objects,
                                               bpy_collection='DistractorObjects')
+        # static meshes of the environment, see get_environment
+        self._environment = None
 
         # finally, setup the compositor
         self.setup_compositor()
@@ -203,6 +227,13 @@ class WorkstationScenarios(interfaces.ABRScene):
         _convert_scaling('ply_scale', self.config.parts)
         _convert_scaling('blend_scale', self.config.parts)
 
+        # check selected object placement mode
+        self.config.scene_setup.placement_mode = self.config.scene_setup.placement_mode.lower()
+        if self.config.scene_setup.placement_mode not in ['physics', 'fast']:
+            self.logger.error(f'placement mode {self.config.scene_setup.placement_mode} currently not supported')
+            raise ValueError(f'placement mode {self.config.scene_setup.placement_mode} currently not supported')
+        self.config.scene_setup.placement_trials = max(1, int(self.config.scene_setup.placement_trials))
+
     def setup_dirinfo(self):
         """Setup directory information for all cameras.
 
@@ -317,6 +348,7 @@ class WorkstationScenarios(interfaces.ABRScene):
         # let's start with an empty list
         objs = []
         obk = ObjectBookkeeper()
+        linked_instances = self.config.scenario_setup.linked_instances
 
         # extract all objects from the configuration. An object has a certain
         # type, as well as an own id. this information is storeed in the objs
@@ -326,6 +358,7 @@ class WorkstationScenarios(interfaces.ABRScene):
         #       object_class_id     model type ID (simply incremental numbers)
         #       object_id           instance ID of the object
         #       bpy                 blender object reference
+        #       active              if the object is used in the current scene (see activate_random_objects)
         for class_id, obj_spec in enumerate(objects):
             class_name, obj_count = obj_spec.split(':')
 
@@ -336,17 +369,20 @@ class WorkstationScenarios(interfaces.ABRScene):
                 # split off the prefix for all files that we load from blender
                 class_name = class_name[6:]
 
-            # TODO: file loading happens only very late in this loop. This might
-            #       be an issue for large object counts and could be changed to
-            #       load-once copy-often.
+            # in linked instancing mode, objects are loaded once and all further
+            # instances are linked duplicates that share the same mesh data
+            prototype = None
             for j in range(int(obj_count)):
-                # First, deselect everything
-                bpy.ops.object.select_all(action='DESELECT')
-                if is_proto_object:
+                if linked_instances and is_proto_object:
+                    # linked duplicate of proto-object
+                    new_obj = blnd.duplicate_object(bpy.data.objects[class_name], linked=True)
+                elif linked_instances and prototype is not None:
+                    # linked duplicate of the first instance loaded from file
+                    new_obj = blnd.duplicate_object(prototype, linked=True)
+                    new_obj.name = f'{class_name}.{j:03d}'
+                elif is_proto_object:
                     # duplicate proto-object
-                    blnd.select_object(class_name)
-                    bpy.ops.object.duplicate()
-                    new_obj = bpy.context.object
+                    new_obj = blnd.duplicate_object(bpy.data.objects[class_name], linked=False)
                 else:
                     # we need to load this object from file. This could be
                     # either a blender file, or a PLY file
@@ -369,8 +405,7 @@ class WorkstationScenarios(interfaces.ABRScene):
                         new_obj.name = f'{class_name}.{j:03d}'
                         # try to rescale object according to its blend_scale if given in the config
                         try:
-                            new_obj.scale = Vector(self.config.parts.blend_scale[class_name])
-                            bpy.ops.object.transform_apply(location=False, rotation=False, scale=True, properties=False)
+                            blnd.apply_scale(new_obj, self.config.parts.blend_scale[class_name])
                         except KeyError:
                             # log and keep going
                             self.logger.info(f'No blend_scale for obj {class_name} given. Skipping!')
@@ -384,12 +419,14 @@ class WorkstationScenarios(interfaces.ABRScene):
                         new_obj.name = f'{class_name}.{j:03d}'
                         # try to rescale object according to its ply_scale if given in the config
                         try:
-                            new_obj.scale = Vector(self.config.parts.ply_scale[class_name])
-                            bpy.ops.object.transform_apply(location=False, rotation=False, scale=True, properties=False)
+                            blnd.apply_scale(new_obj, self.config.parts.ply_scale[class_name])
                         except KeyError:
                             # log and keep going
                             self.logger.info(f'No ply_scale for obj {class_name} given. Skipping!')
 
+                if prototype is None:
+                    prototype = new_obj
+
                 # move object to collection: in case of debugging
                 try:
                     collection = bpy.data.collections[bpy_collection]
@@ -411,6 +448,7 @@ class WorkstationScenarios(interfaces.ABRScene):
                     'object_id': j,
                     'bpy': new_obj,
                     'visible': None,
+                    'active': True,
                     'dimensions': rgb_shape  # TODO: this is not implemented yet
                 })
 
@@ -419,15 +457,20 @@ class WorkstationScenarios(interfaces.ABRScene):
             self.logger.info("Config file does NOT include ABC-Dataset objects")
         else:
             n_materials = int(self.config.scenario_setup.num_abc_colors)
-            self.logger.info(f"making {n_materials} random metallic materials")
-            abc_importer = ABCImporter(n_materials=n_materials)
+            if self.config.scenario_setup.abc_material_pool:
+                self.logger.info("using a pool of per-object randomized metallic materials")
+            else:
+                self.logger.info(f"making {n_materials} random metallic materials")
+            abc_importer = ABCImporter(
+                n_materials=n_materials,
+                max_faces=self.config.scenario_setup.abc_max_faces,
+                complexity_weighting=self.config.scenario_setup.abc_complexity_weighting,
+                material_pool=self.config.scenario_setup.abc_material_pool)
 
             for class_id, obj_spec in enumerate(abc_objects):
                 _class_name, obj_count = obj_spec.split(':')
 
                 for j in range(int(obj_count)):
-                    bpy.ops.object.select_all(action='DESELECT')
-
                     obj_handle, class_name = abc_importer.import_object(_class_name)
 
                     if obj_handle is None:
@@ -454,6 +497,7 @@ class WorkstationScenarios(interfaces.ABRScene):
                         'object_id': obk[class_name]["instances"] - 1,
                         'bpy': obj_handle,
                         'visible': None,
+                        'active': True,
                         'dimensions': rgb_shape  # TODO: not implemented yet
                     })
 
@@ -472,17 +516,87 @@ class WorkstationScenarios(interfaces.ABRScene):
 
     def setup_environment_textures(self):
         # get list of environment textures
-        self.environment_textures = get_environment_textures(self.config.scene_setup.environment_textures)
+        self.environment_textures = get_environment_textures(
+            self.config.scene_setup.environment_textures,
+            min_size=self.config.render_setup.texture_min_size,
+            min_aspect=self.config.render_setup.texture_min_aspect,
+            max_aspect=self.config.render_setup.texture_max_aspect)
+        self.texture_manager = EnvironmentTextureManager(
+            self.environment_textures,
+            capacity_mb=self.config.render_setup.texture_cache_mb,
+            prefetch=self.config.render_setup.texture_prefetch,
+            downscale=self.config.render_setup.texture_downscale)
+
+    def get_active_objects(self, objs: list):
+        """Get all objects of the given list that are used in the current scene"""
+        return [obj for obj in objs if obj['active']]
+
+    def activate_random_objects(self, objs: list, ensure_any: bool = False):
+        """Activate a random subset of the given objects for the next scene.
+
+        In object pool mode, the number of objects per object type that was
+        specified in the configuration is the maximum number of instances. For
+        each object type, a random number of instances between
+        scenario_setup.object_pool_min and this maximum is activated. All other
+        instances are hidden from rendering, excluded from the rigid body
+        simulation, and parked far away from the scene such that they neither
+        collide with nor occlude active objects. This allows to render scenes
+        with a varying number of objects without setting up the scene again.
+
+        Args:
+            objs(list): list of objects to choose from
+
+        Optional Args:
+            ensure_any(bool): if True, at least one object will be activated. Default: False
+
+        NOTE: the list must be mutable since we directly modify the objects w/o returning them
+        """
+        objs = [obj for obj in objs if obj['bpy'] is not None]
+
+        # group instances by object type
+        classes = dict()
+        for obj in objs:
+            classes.setdefault(obj['object_class_name'], []).append(obj)
+
+        active = set()
+        for class_objs in classes.values():
+            n_min = min(max(0, int(self.config.scenario_setup.object_pool_min)), len(class_objs))
+            n_active = np.random.randint(n_min, len(class_objs) + 1)
+            for i in np.random.permutation(len(class_objs))[:n_active]:
+                active.add(id(class_objs[i]))
+        if ensure_any and not active and objs:
+            active.add(id(objs[np.random.randint(len(objs))]))
+
+        for i, obj in enumerate(objs):
+            obj['active'] = id(obj) in active
+            bpy_obj = obj['bpy']
+            bpy_obj.hide_render = not obj['active']
+            bpy_obj.hide_viewport = not obj['active']
+            if bpy_obj.rigid_body is not None:
+                bpy_obj.rigid_body.enabled = obj['active']
+            if not obj['active']:
+                bpy_obj.location = Vector((0, 0, -2e4 - 10 * i))
+                obj['visible'] = False
+
+        self.logger.info(f"Using {len(active)}/{len(objs)} objects from the object pool")
+        bpy.context.scene.view_layers['View Layer'].update()
 
     def randomize_object_transforms(self, objs: list):
         """move all objects to random locations within their scenario dropzone,
         and rotate them.
 
+        Depending on scene_setup.placement_mode, objects are either placed at
+        random (and later on forward simulated), or placed without intersections
+        directly on top of the surface below them (see place_objects_without_physics).
+
         Args:
             objs(list): list of objects whose pose is randomized
 
         NOTE: the list must be mutable since we directly modify the objects w/o returning them
         """
+        if self.config.scene_setup.placement_mode == 'fast':
+            self.place_objects_without_physics(objs)
+            return
 
         # we need #objects * (3 + 3)  many random numbers, so let's just grab them all
         # at once
@@ -515,10 +629,127 @@ class WorkstationScenarios(interfaces.ABRScene):
         dg = bpy.context.evaluated_depsgraph_get()
         dg.update()
 
+    def place_objects_without_physics(self, objs: list):
+        """Place all objects at random, non-intersecting poses within their
+        scenario dropzone, without running a physics simulation.
+
+        Objects are placed one after the other. For each object, a pose is
+        sampled uniformly in the dropbox, and the object is dropped onto the
+        surface below it. The candidate is rejected if it intersects any
+        already placed object or the static environment (e.g. bin walls, see
+        get_environment), using a cheap bounding sphere test first and an
+        exact BVH overlap test afterwards. If no valid pose is found within
+        scene_setup.placement_trials samples, the last candidate is kept.
+
+        Args:
+            objs(list): list of objects whose pose is randomized
+
+        NOTE: the list must be mutable since we directly modify the objects w/o returning them
+        """
+        scene = bpy.context.scene
+        layer = scene.view_layers['View Layer']
+
+        # make sure that the rigid body world (if any) does not alter the poses
+        # set below, i.e. go to the start frame of the simulation
+        scene.frame_set(scene.frame_start)
+
+        dropbox = f"Dropbox.{self.config.scenario_setup.scenario:03}"
+        drop_location = bpy.data.objects[dropbox].location
+        drop_scale = bpy.data.objects[dropbox].scale
+
+        # park all objects far away, such that objects which are not yet placed
+        # are neither hit during ray casting nor tested for intersections
+        objs = [obj for obj in objs if obj['bpy'] is not None]
+        for i, obj in enumerate(objs):
+            obj['bpy'].location = Vector((0, 0, -1e4 - 10 * i))
+        layer.update()
+
+        environment = self.get_environment()
+        placed = []
+        for obj in objs:
+            for trial in range(self.config.scene_setup.placement_trials):
+                rnd = np.random.uniform(size=3)
+                rnd_rot = np.random.rand(3)
+                obj['bpy'].location.x = drop_location.x + (rnd[0] - .5) * 2.0 * drop_scale[0]
+                obj['bpy'].location.y = drop_location.y + (rnd[1] - .5) * 2.0 * drop_scale[1]
+                obj['bpy'].location.z = drop_location.z + (rnd[2] - .5) * 2.0 * drop_scale[2]
+                obj['bpy'].rotation_euler = Vector((rnd_rot * np.pi))
+                layer.update()
+
+                # drop to the surface below. If there is none, try again
+                if not abr_geom.drop_to_support(scene, layer, obj['bpy']):
+                    continue
+                layer.update()
+
+                # test against the environment and all objects placed so far.
+                # The bounding sphere test is cheap and discards most of the pairs
+                intersects = self.test_environment_intersection(obj['bpy'], environment)
+                for other in ([] if intersects else placed):
+                    if abr_geom.test_bounding_sphere_intersection(obj['bpy'], other['bpy']) and \
+                            abr_geom.test_intersection(obj['bpy'], other['bpy']):
+                        intersects = True
+                        break
+                if not intersects:
+                    break
+            else:
+                self.logger.warn(f"Could not find non-intersecting pose for object {obj['object_class_name']} "
+                                 f"within {self.config.scene_setup.placement_trials} trials. Keeping last pose")
+
+            placed.append(obj)
+            self.logger.info(f"Object {obj['object_class_name']}: {obj['bpy'].location}, {obj['bpy'].rotation_euler}")
+
+        dg = bpy.context.evaluated_depsgraph_get()
+        dg.update()
+
+    def get_environment(self):
+        """Get the static meshes of the scene, i.e. all rendered meshes except
+        for target and distractor objects and the dropboxes.
+
+        The bounding spheres are computed once, BVHs are built on first use
+        (see test_environment_intersection).
+
+        Returns:
+            list of dict with keys 'bpy', 'center', 'radius', 'bvh'
+        """
+        if self._environment is None:
+            names = set(obj['bpy'].name for obj in self.objs + self.distractors if obj['bpy'] is not None)
+            self._environment = []
+            for bpy_obj in bpy.context.scene.objects:
+                if bpy_obj.type != 'MESH' or bpy_obj.hide_render or bpy_obj.name in names or \
+                        bpy_obj.name.startswith('Dropbox'):
+                    continue
+                center, radius = abr_geom.get_bounding_sphere(bpy_obj)
+                self._environment.append({'bpy': bpy_obj, 'center': center, 'radius': radius, 'bvh': None})
+        return self._environment
+
+    def test_environment_intersection(self, obj, environment: list):
+        """Test if an object intersects any static mesh of the environment.
+
+        Args:
+            obj(bpy.types.Object): object to test
+            environment(list): static meshes, see get_environment
+
+        Returns:
+            True if the object intersects the environment, False otherwise
+        """
+        center, radius = abr_geom.get_bounding_sphere(obj)
+        bvh = None
+        for env in environment:
+            if (center - env['center']).length > radius + env['radius']:
+                continue
+            if env['bvh'] is None:
+                env['bvh'] = abr_geom.get_bvh(env['bpy'])
+            if bvh is None:
+                bvh = abr_geom.get_bvh(obj)
+            if bvh.overlap(env['bvh']):
+                return True
+        return False
+
     def randomize_environment_texture(self):
         # set some environment texture, randomize, and render
-        env_txt_filepath = expandpath(random.choice(self.environment_textures))
-        self.renderman.set_environment_texture(env_txt_filepath)
+        img = self.texture_manager.sample()
+        if img is not None:
+            self.renderman.set_environment_image(img)
 
     def forward_simulate(self):
         self.logger.info(f"forward simulation of {self.config.scene_setup.forward_frames} frames")
@@ -542,10 +773,7 @@ class WorkstationScenarios(interfaces.ABRScene):
             cam_name(str): actual name of selected bpy camera object
             location(array): camera location
         """
-        # select the camera. Blender often operates on the active object, to
-        # make sure that this happens here, we select it
-        blnd.select_object(cam_name)
-        # set camera location
+        # set camera location. NOTE: selecting the camera is not required here
         bpy.data.objects[cam_name].location = location
 
     def get_camera_name(self, cam_str):
@@ -574,7 +802,7 @@ class WorkstationScenarios(interfaces.ABRScene):
             camera.location = location
 
             any_not_visible_or_occluded = False
-            for obj in self.objs:
+            for obj in self.get_active_objects(self.objs):
                 not_visible_or_occluded = abr_geom.test_occlusion(
                     bpy.context.scene,
                     bpy.context.scene.view_layers['View Layer'],
@@ -664,13 +892,20 @@ class WorkstationScenarios(interfaces.ABRScene):
                         basefilename='workstationscenario_camera_locations')
 
         # control loop for the number of static scenes to render
-        scn_counter = 0
-        while scn_counter < self.config.dataset.scene_count:
+        scn_counter, scn_stop = interfaces.get_scene_range(self.scene_range, self.config.dataset.scene_count)
+        while scn_counter < scn_stop:
+
+            # in object pool mode, select the objects that are used in this scene
+            if self.config.scenario_setup.object_pool:
+                self.activate_random_objects(self.objs, ensure_any=True)
+                self.activate_random_objects(self.distractors)
+            active_objs = self.get_active_objects(self.objs)
 
             # randomize scene: move objects at random locations, and forward simulate physics
             self.randomize_environment_texture()
-            self.randomize_object_transforms(self.objs + self.distractors)
-            self.forward_simulate()
+            self.randomize_object_transforms(active_objs + self.get_active_objects(self.distractors))
+            if self.config.scene_setup.placement_mode == 'physics':
+                self.forward_simulate()
 
             # check visibility
             repeat_frame = False
@@ -734,7 +969,8 @@ class WorkstationScenarios(interfaces.ABRScene):
                                 basefilename='workstationscenario_visibility')
 
                     # update path information in compositor
-                    self.renderman.setup_pathspec(self.dirinfos[i_cam], base_filename, self.objs)
+                    # NOTE: mask outputs of inactive objects are disabled
+                    self.renderman.setup_pathspec(self.dirinfos[i_cam], base_filename, active_objs)
 
                     # finally, render
                     self.renderman.render()
@@ -746,7 +982,7 @@ class WorkstationScenarios(interfaces.ABRScene):
                             self.dirinfos[i_cam],
                             base_filename,
                             bpy.context.scene.camera,
-                            self.objs,
+                            active_objs,
                             self.config.camera_info.zeroing,
                             postprocess_config=self.config.postprocess)
 
@@ -780,6 +1016,8 @@ class WorkstationScenarios(interfaces.ABRScene):
 
             # update scene counter
             if not repeat_frame:
+                # NOTE: this message is used by the parallel launcher to track progress
+                self.logger.info(f"Completed scene {scn_counter + 1}/{self.config.dataset.scene_count}")
                 scn_counter = scn_counter + 1
 
         return True
@@ -795,5 +1033,5 @@ class WorkstationScenarios(interfaces.ABRScene):
 
     def teardown(self):
         """Tear down the scene"""
-        # nothing to do
-        pass
+        # stop prefetching of environment textures
+        self.texture_manager.close()
@@ -17,9 +17,11 @@
 # limitations under the License.
 
 import bpy
-from mathutils import Vector
+import numpy as np
+from mathutils import Matrix, Vector
 
 from amira_blender_rendering.utils.logging import get_logger
+import amira_blender_rendering.utils.mesh as mesh_utils
 
 
 def get_collection_item_names(bpy_collection):
@@ -131,6 +133,18 @@ def clear_orphaned_materials():
         bpy.data.materials.remove(mat)
 
 
+def deselect_all(view_layer: bpy.types.ViewLayer = None):
+    """Deselect all objects of a view layer without using operators.
+
+    Args:
+        view_layer (bpy.types.ViewLayer): view layer to operate on. Default: bpy.context.view_layer
+    """
+    if view_layer is None:
+        view_layer = bpy.context.view_layer
+    for obj in list(view_layer.objects.selected):
+        obj.select_set(False, view_layer=view_layer)
+
+
 def select_object(obj_name: str):
     """Select and activate an object given its name"""
     if obj_name not in bpy.data.objects:
@@ -138,12 +152,126 @@ def select_object(obj_name: str):
         return
 
     # we first deselect all, then select and activate the target object
-    bpy.ops.object.select_all(action='DESELECT')
+    deselect_all()
     obj = bpy.data.objects[obj_name]
     obj.select_set(True)
     bpy.context.view_layer.objects.active = obj
 
 
+def apply_scale(obj: bpy.types.Object, scale=None):
+    """Apply the scale of an object to its mesh data without using operators.
+
+    This is the equivalent of bpy.ops.object.transform_apply(location=False,
+    rotation=False, scale=True) for a single object. Note that all users of
+    the mesh are affected.
+
+    Args:
+        obj (bpy.types.Object): object to operate on
+
+    Optional Args:
+        scale (Vector): scale to set before applying it. Default: obj.scale
+    """
+    if scale is not None:
+        obj.scale = Vector(scale)
+    if obj.data is not None:
+        obj.data.transform(Matrix.Diagonal(obj.scale).to_4x4())
+        obj.data.update()
+    obj.scale = Vector((1.0, 1.0, 1.0))
+
+
+def set_origin_to_center_of_mass(obj: bpy.types.Object):
+    """Move the origin of an object to the center of mass of its surface without using operators.
+
+    This is the equivalent of bpy.ops.object.origin_set(type='ORIGIN_CENTER_OF_MASS'),
+    i.e. the center is the area weighted mean of all polygon centers. The
+    world location of the mesh does not change.
+
+    Args:
+        obj (bpy.types.Object): object to operate on
+    """
+    centers, areas = mesh_utils.get_polygon_centers_and_areas(obj.data)
+    if len(areas) == 0:
+        return
+    if areas.sum() > 0:
+        center = Vector((areas @ centers / areas.sum()).tolist())
+    else:
+        center = Vector(np.mean(centers, axis=0).tolist())
+
+    obj.data.transform(Matrix.Translation(-center))
+    obj.data.update()
+    obj.matrix_world = obj.matrix_world @ Matrix.Translation(center)
+
+
+def add_rigid_body(obj: bpy.types.Object, scene: bpy.types.Scene = None):
+    """Add an object to the rigid body world of a scene.
+
+    The object is linked to the rigid body world collection directly, which
+    lets blender create the rigid body settings. Operators are only used to
+    create the rigid body world if it does not exist yet, and as a fallback
+    for blender versions that do not create rigid body settings on linking.
+
+    Args:
+        obj (bpy.types.Object): object to add
+
+    Optional Args:
+        scene (bpy.types.Scene): scene to operate on. Default: bpy.context.scene
+
+    Returns:
+        bpy.types.RigidBodyObject: rigid body settings of the object
+    """
+    if scene is None:
+        scene = bpy.context.scene
+
+    if scene.rigidbody_world is None:
+        get_logger().debug("adding a rigidbody_world to scene, i.e. a RigidBodyWorld collection")
+        bpy.ops.rigidbody.world_add()
+    rbw = scene.rigidbody_world
+    if rbw.collection is None:
+        rbw.collection = bpy.data.collections.new('RigidBodyWorld')
+
+    if obj.name not in rbw.collection.objects:
+        rbw.collection.objects.link(obj)
+    if obj.rigid_body is None:
+        select_object(obj.name)
+        bpy.ops.rigidbody.object_add()
+    return obj.rigid_body
+
+
+def duplicate_object(obj: bpy.types.Object, linked: bool = True, collections: list = None) -> bpy.types.Object:
+    """Duplicate an object without using operators.
+
+    The copy is linked to the same collections as the original object (or to
+    the given ones), and is added to the scene's rigid body world if the
+    original object is a rigid body.
+
+    Args:
+        obj (bpy.types.Object): object to duplicate
+        linked (bool): if True, the copy shares the object data (e.g. mesh) with
+            the original object, i.e. it is a linked duplicate. Otherwise, the data
+            is copied as well. Default: True
+        collections (list): collections to link the copy to. Default: collections of obj
+
+    Returns:
+        bpy.types.Object: the copy
+    """
+    new_obj = obj.copy()
+    if not linked and obj.data is not None:
+        new_obj.data = obj.data.copy()
+
+    if collections is None:
+        collections = obj.users_collection
+    for collection in collections:
+        collection.objects.link(new_obj)
+
+    # make sure that the copy takes part in the physics simulation
+    rbw = bpy.context.scene.rigidbody_world
+    if (obj.rigid_body is not None) and (rbw is not None) and (rbw.collection is not None) \
+            and (new_obj.name not in rbw.collection.objects):
+        rbw.collection.objects.link(new_obj)
+
+    return new_obj
+
+
 def add_default_material(obj: bpy.types.Object = bpy.context.object,
                          name: str = 'DefaultMaterial') -> bpy.types.Material:
 
@@ -228,17 +356,12 @@ def delete_object(object_name):
         logger.warning(f"Could not find object {object_name}")
         return
 
-    select_object(object_name)
-    meshes_to_remove = list()
-    for ob in bpy.context.selected_objects:
-        meshes_to_remove.append(ob.data)
-
-    bpy.ops.object.delete()
-    for mesh in meshes_to_remove:
-        try:  # might data be a non-mesh ?
-            bpy.data.meshes.remove(mesh)
-        except Exception as err:
-            logger.error(str(err))
+    obj = bpy.data.objects[object_name]
+    mesh = obj.data
+    bpy.data.objects.remove(obj, do_unlink=True)
+    # keep meshes that are still in use, e.g. by linked duplicates
+    if isinstance(mesh, bpy.types.Mesh) and mesh.users == 0:
+        bpy.data.meshes.remove(mesh)
 
 
 def load_img(filepath):
@@ -275,17 +398,12 @@ def get_mesh_bounding_box(mesh):
     """Returns Bounding-Box of Mesh-Object at zero position (Edit mode)"""
 
     try:
-        xyz = mesh.data.vertices[0].co
+        xyz = mesh_utils.get_vertices(mesh.data)
     except AttributeError as err:
         get_logger().error('expecting a mesh object, but no data.vertices attribute in object {}'.format(mesh))
         raise err
 
-    bb = [[xyz[0], xyz[0]], [xyz[1], xyz[1]], [xyz[2], xyz[2]]]
-    for v in mesh.data.vertices:
-        xyz = v.co
-        for i in range(3):
-            bb[i][0] = min(bb[i][0], xyz[i])
-            bb[i][1] = max(bb[i][1], xyz[i])
-
-    bounding_box = BoundingBox3D(bb[0][0], bb[0][1], bb[1][0], bb[1][1], bb[2][0], bb[2][1])
+    bb_min = xyz.min(axis=0).tolist()
+    bb_max = xyz.max(axis=0).tolist()
+    bounding_box = BoundingBox3D(bb_min[0], bb_max[0], bb_min[1], bb_max[1], bb_min[2], bb_max[2])
     return bounding_box
@@ -18,16 +18,38 @@
 
 import os
 import json
+import configparser
 import xml.etree.ElementTree as ET
 
 
-def to_PASCAL_VOC(fpath_json):
+def _get_image_size(fpath_json, data_json):
+    """Get (width, height, depth) of the image of an annotation file.
+
+    Old annotations store the size in the field 'dimensions'. Otherwise, the
+    size is read from Dataset.cfg of the dataset the annotation file belongs to
+    (i.e. two levels above Annotations/<convention>/).
+    """
+    if data_json and 'dimensions' in data_json[0]:
+        return data_json[0]['dimensions'][1], data_json[0]['dimensions'][0], data_json[0]['dimensions'][2]
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(fpath_json))))
+    cfg = configparser.ConfigParser(interpolation=None)
+    if not cfg.read(os.path.join(root, 'Dataset.cfg')):
+        raise RuntimeError(f'Image size of {fpath_json} unknown: pass width and height explicitly')
+    return int(float(cfg['camera_info']['width'])), int(float(cfg['camera_info']['height'])), 3
+
+
+def to_PASCAL_VOC(fpath_json, width=None, height=None, depth=3):
     """
     Converts data annotations from json to xml according to PASCAL VOC format
     https://towardsdatascience.com/coco-data-format-for-object-detection-a4c5eaf518c5
 
+    For COCO and BOP formats, see abr_dataset_tools.export in ABR_Datasets_API.
+
     Args: fpath_json - path to json annotation file to convert
 
+    Optional Args:
+        width, height, depth - size of the image. Default: None, i.e. read from the
+        annotations (old datasets) or from Dataset.cfg of the dataset
     """
     # manage directories
     json_folder = os.path.split(fpath_json)[0]
@@ -41,6 +63,8 @@ def to_PASCAL_VOC(fpath_json):
     # read json file
     with open(fpath_json) as json_file:
         data_json = json.load(json_file)
+    if width is None or height is None:
+        width, height, depth = _get_image_size(fpath_json, data_json)
 
     # create the file structure
     root = ET.Element('annotation')
@@ -67,15 +91,15 @@ def to_PASCAL_VOC(fpath_json):
 
     size = ET.SubElement(root, 'size')
     size.text = '\n' + 2 * space
-    width = ET.SubElement(size, 'width')
-    width.text = str(data_json[0]['dimensions'][1])
-    width.tail = '\n' + 2 * space
-    height = ET.SubElement(size, 'height')
-    height.text = str(data_json[0]['dimensions'][0])
-    height.tail = '\n' + 2 * space
-    depth = ET.SubElement(size, 'depth')
-    depth.text = str(data_json[0]['dimensions'][2])
-    depth.tail = '\n' + space
+    width_el = ET.SubElement(size, 'width')
+    width_el.text = str(width)
+    width_el.tail = '\n' + 2 * space
+    height_el = ET.SubElement(size, 'height')
+    height_el.text = str(height)
+    height_el.tail = '\n' + 2 * space
+    depth_el = ET.SubElement(size, 'depth')
+    depth_el.text = str(depth)
+    depth_el.tail = '\n' + space
     size.tail = '\n' + space
 
     segmented = ET.SubElement(root, 'segmented')
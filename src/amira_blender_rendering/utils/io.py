@@ -45,6 +45,24 @@ def expandpath(path, check_file=False):
         return [expandpath(p) for p in path]
 
 
+def get_cache_dir(name: str = ''):
+    """Get (and create if required) the directory to store cached data in.
+
+    The cache is located at $HOME/.amira_blender_rendering/cache, unless the
+    environment variable ABR_CACHE_DIR is set.
+
+    Args:
+        name (str): optional subdirectory within the cache directory
+
+    Returns:
+        Path to the cache directory
+    """
+    cache_dir = os.environ.get('ABR_CACHE_DIR', os.path.join('~', '.amira_blender_rendering', 'cache'))
+    cache_dir = os.path.join(expandpath(cache_dir), name)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
 def get_my_dir(my_path):
     fullpath = osp.abspath(osp.realpath(my_path))
     if osp.isfile(fullpath):
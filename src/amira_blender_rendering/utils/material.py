@@ -17,6 +17,7 @@
 # limitations under the License.
 
 from abc import ABC, abstractmethod
+import os
 import random
 
 import numpy as np
@@ -24,6 +25,7 @@ import bpy
 
 from amira_blender_rendering.utils.logging import get_logger
 from amira_blender_rendering.utils.blender import get_collection_item_names, find_new_items
+from amira_blender_rendering.utils.io import get_cache_dir
 
 logger = get_logger()
 
@@ -93,6 +95,14 @@ class BaseMaterialGenerator(ABC):
     def get_material(self):
         return NotImplemented
 
+    def assign_material(self, obj):
+        """Assign a material to an object
+
+        Args:
+            obj (bpy.types.Object): object to assign a material to
+        """
+        obj.active_material = self.get_material()
+
 
 class MetallicMaterialGenerator(BaseMaterialGenerator):
     """Generate randomized metallic materials"""
@@ -121,15 +131,11 @@ class MetallicMaterialGenerator(BaseMaterialGenerator):
             material_name = self._make_random_material(desired_name)
             self._materials.append(material_name)
 
-    def _make_random_material(self, desired_name):
-        """Generate a randomized node-tree for a metallic material
-
-        Args:
-            desired_name (string) : the desired name for the new material
+    def _random_parameters(self):
+        """Sample random material parameters
 
-        Returns
-            actual_name (string) : the actual exact material name
-            Might differ from desired-name, due to blenders automatic conflict resolution (appending ".001" etc.)
+        Returns:
+            tuple: color (RGBA), roughness, texture scale, texture detail, texture distortion
         """
         roughness, texture_scale, texture_detail, texture_distortion = np.random.rand(4)
         roughness *= self._max_roughness
@@ -143,6 +149,19 @@ class MetallicMaterialGenerator(BaseMaterialGenerator):
             limit = self._rgb_lower_limits[i]
             color[i] = limit + (1.0 - limit) * (1.0 - color[i] ** self._shift_to_white)
         logger.debug("color: {}".format(color))
+        return color, roughness, texture_scale, texture_detail, texture_distortion
+
+    def _make_random_material(self, desired_name):
+        """Generate a randomized node-tree for a metallic material
+
+        Args:
+            desired_name (string) : the desired name for the new material
+
+        Returns
+            actual_name (string) : the actual exact material name
+            Might differ from desired-name, due to blenders automatic conflict resolution (appending ".001" etc.)
+        """
+        color, roughness, texture_scale, texture_detail, texture_distortion = self._random_parameters()
 
         old_names = get_collection_item_names(bpy.data.materials)
         mat = bpy.data.materials.new(desired_name)
@@ -197,3 +216,150 @@ class MetallicMaterialGenerator(BaseMaterialGenerator):
         """
         material_name = random.sample(self._materials, 1)[0]
         return bpy.data.materials[material_name]
+
+
+class MetallicMaterialPool(MetallicMaterialGenerator):
+    """Randomized metallic materials that share a single template material
+
+    Instead of building a separate node tree per material, all objects use the
+    same template material. Color and material parameters are randomized per
+    object: the color is stored in the object color (read via an Object Info
+    node), roughness and noise parameters are stored as custom object
+    properties (read via Attribute nodes of type OBJECT). This way, Cycles
+    compiles a single shader, independent of the number of colors. For blender
+    versions that do not support object attributes (< 2.92), the parameters are
+    derived from the per-object random value instead. To decorrelate them, each
+    parameter uses a separately hashed channel fract(random * k_i) of it.
+
+    The template is stored in a .blend library in the cache directory and
+    loaded from there in subsequent runs.
+    """
+    template_name = "abr_metallic_template"
+
+    # custom object properties that drive the template material
+    _parameters = ("abr_roughness", "abr_texture_scale", "abr_texture_detail", "abr_texture_distortion")
+    # multipliers that hash the per-object random value into one channel per
+    # parameter if object attributes are not supported, see _make_template
+    _random_hash = (1.0, 37.0, 421.0, 3571.0)
+
+    def __init__(self, library_path=None):
+        """Initialize pool and load (or build) the template material
+
+        Args:
+            library_path (str, optional): .blend file to store the template in. Defaults to None
+                (= file in cache directory, one per blender version)
+        """
+        super(MetallicMaterialPool, self).__init__()
+        self._use_object_attributes = bpy.app.version >= (2, 92, 0)
+        if library_path is None:
+            version = "{}.{}".format(*bpy.app.version[:2])
+            library_path = os.path.join(get_cache_dir('materials'), f"metallic_material_pool_v2_{version}.blend")
+        self._library_path = library_path
+        self._material = self._load_template()
+
+    def _load_template(self):
+        """Get the template material from the current session, the library, or build it"""
+        if self.template_name in bpy.data.materials:
+            return bpy.data.materials[self.template_name]
+
+        if os.path.exists(self._library_path):
+            try:
+                with bpy.data.libraries.load(self._library_path, link=False) as (data_from, data_to):
+                    if self.template_name in data_from.materials:
+                        data_to.materials = [self.template_name]
+                if self.template_name in bpy.data.materials:
+                    logger.debug(f"loaded material template from {self._library_path}")
+                    return bpy.data.materials[self.template_name]
+            except OSError as err:
+                logger.warn(f"could not load material library {self._library_path}: {err}")
+
+        mat = self._make_template()
+        try:
+            bpy.data.libraries.write(self._library_path, {mat}, fake_user=True)
+        except (OSError, RuntimeError) as err:
+            logger.warn(f"could not write material library {self._library_path}: {err}")
+        return mat
+
+    def _make_template(self):
+        """Build the template node tree. See also MetallicMaterialGenerator._make_random_material"""
+        mat = bpy.data.materials.new(self.template_name)
+        mat.use_nodes = True
+        self._clear_node_tree(mat)
+        nodes = mat.node_tree.nodes
+        links = mat.node_tree.links
+
+        out_node = nodes.new("ShaderNodeOutputMaterial")
+        out_node.location = (0, 0)
+        glossy_node = nodes.new("ShaderNodeBsdfGlossy")
+        glossy_node.location = (-200, 100)
+        bump_node = nodes.new("ShaderNodeBump")
+        bump_node.location = (-200, -100)
+        noise_node = nodes.new("ShaderNodeTexNoise")
+        noise_node.location = (-400, -100)
+        noise_node.noise_dimensions = "3D"
+        links.new(out_node.inputs["Surface"], glossy_node.outputs["BSDF"])
+        links.new(out_node.inputs["Displacement"], bump_node.outputs["Normal"])
+        links.new(bump_node.inputs["Normal"], noise_node.outputs["Fac"])
+
+        # per-object color
+        info_node = nodes.new("ShaderNodeObjectInfo")
+        info_node.location = (-600, 200)
+        links.new(glossy_node.inputs["Color"], info_node.outputs["Color"])
+
+        # per-object parameters
+        targets = (
+            (glossy_node.inputs["Roughness"], self._max_roughness),
+            (noise_node.inputs["Scale"], self._max_texture_scale),
+            (noise_node.inputs["Detail"], self._max_texture_detail),
+            (noise_node.inputs["Distortion"], self._max_texture_distortion),
+        )
+        for i, (name, (socket, max_value), k) in enumerate(zip(self._parameters, targets, self._random_hash)):
+            if self._use_object_attributes:
+                attr_node = nodes.new("ShaderNodeAttribute")
+                attr_node.attribute_type = "OBJECT"
+                attr_node.attribute_name = name
+                attr_node.location = (-800, -100 - 150 * i)
+                links.new(socket, attr_node.outputs["Fac"])
+            else:
+                # fract(random * k) * max_value
+                hash_node = nodes.new("ShaderNodeMath")
+                hash_node.operation = "MULTIPLY"
+                hash_node.inputs[1].default_value = k
+                hash_node.location = (-1200, -100 - 150 * i)
+                fract_node = nodes.new("ShaderNodeMath")
+                fract_node.operation = "MODULO"
+                fract_node.inputs[1].default_value = 1.0
+                fract_node.location = (-1000, -100 - 150 * i)
+                math_node = nodes.new("ShaderNodeMath")
+                math_node.operation = "MULTIPLY"
+                math_node.inputs[1].default_value = max_value
+                math_node.location = (-800, -100 - 150 * i)
+                links.new(hash_node.inputs[0], info_node.outputs["Random"])
+                links.new(fract_node.inputs[0], hash_node.outputs["Value"])
+                links.new(math_node.inputs[0], fract_node.outputs["Value"])
+                links.new(socket, math_node.outputs["Value"])
+        return mat
+
+    def make_random_material(self, n=1):
+        """Nothing to do, parameters are randomized per object in assign_material"""
+        pass
+
+    def get_material(self):
+        """Return handle to the template material
+
+        Returns:
+            bpy.types.Material: template material. Use assign_material to randomize per object
+        """
+        return self._material
+
+    def assign_material(self, obj):
+        """Assign the template material to an object and randomize its parameters
+
+        Args:
+            obj (bpy.types.Object): object to assign the material to
+        """
+        obj.active_material = self._material
+        color, *parameters = self._random_parameters()
+        obj.color = color
+        for name, value in zip(self._parameters, parameters):
+            obj[name] = float(value)
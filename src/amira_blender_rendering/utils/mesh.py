@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 - for information on the respective copyright owner
+# see the NOTICE file and/or the repository
+# <https://github.com/boschresearch/amira-blender-rendering>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Bulk accessors to mesh data as numpy arrays.
+
+Accessing vertices one at a time from python is slow for large meshes. The
+functions in this module use foreach_get / foreach_set to read and write mesh
+data in one go.
+"""
+
+import numpy as np
+
+
+def get_vertices(mesh) -> np.ndarray:
+    """Get the (local) coordinates of all vertices of a mesh
+
+    Args:
+        mesh (bpy.types.Mesh): mesh to read from
+
+    Returns:
+        np.array(N, 3) of vertex coordinates
+    """
+    co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get('co', co)
+    return co.reshape(-1, 3)
+
+
+def set_vertices(mesh, vertices: np.ndarray):
+    """Set the (local) coordinates of all vertices of a mesh
+
+    Args:
+        mesh (bpy.types.Mesh): mesh to write to
+        vertices (np.array(N, 3)): new vertex coordinates. N must match the number of vertices in the mesh
+    """
+    vertices = np.ascontiguousarray(vertices, dtype=np.float32).ravel()
+    if len(vertices) != len(mesh.vertices) * 3:
+        raise ValueError(f'Expected {len(mesh.vertices)} vertices, got {len(vertices) // 3}')
+    mesh.vertices.foreach_set('co', vertices)
+    mesh.update()
+
+
+def get_polygons(mesh) -> list:
+    """Get the vertex indices of all polygons of a mesh
+
+    Args:
+        mesh (bpy.types.Mesh): mesh to read from
+
+    Returns:
+        list of np.array with the vertex indices of each polygon
+    """
+    loop_vertices = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get('vertex_index', loop_vertices)
+    loop_starts = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get('loop_start', loop_starts)
+    return np.split(loop_vertices, loop_starts[1:])
+
+
+def get_polygon_centers_and_areas(mesh):
+    """Get center and area of all polygons of a mesh (in local coordinates)
+
+    Args:
+        mesh (bpy.types.Mesh): mesh to read from
+
+    Returns:
+        tuple of np.array(N, 3) with polygon centers and np.array(N,) with polygon areas
+    """
+    centers = np.empty(len(mesh.polygons) * 3, dtype=np.float32)
+    mesh.polygons.foreach_get('center', centers)
+    areas = np.empty(len(mesh.polygons), dtype=np.float32)
+    mesh.polygons.foreach_get('area', areas)
+    return centers.reshape(-1, 3), areas
+
+
+def to_numpy(matrix) -> np.ndarray:
+    """Convert a mathutils.Matrix to a numpy array"""
+    return np.array(matrix, dtype=np.float64)
+
+
+def transform_points(matrix, points: np.ndarray, homogeneous: bool = False) -> np.ndarray:
+    """Apply a 4x4 transformation to a set of 3D points
+
+    Args:
+        matrix (mathutils.Matrix or np.array(4, 4)): transformation to apply
+        points (np.array(N, 3)): points to transform
+
+    Optional Args:
+        homogeneous (bool): if True, return homogeneous coordinates (N, 4) without normalization.
+            Otherwise return (N, 3). Default: False
+
+    Returns:
+        np.array with transformed points
+    """
+    matrix = to_numpy(matrix)
+    points = np.asarray(points, dtype=np.float64)
+    p_hom = points @ matrix[:3, :3].T + matrix[:3, 3]
+    if homogeneous:
+        w = points @ matrix[3, :3] + matrix[3, 3]
+        return np.hstack((p_hom, w[:, None]))
+    return p_hom
+
+
+def get_world_vertices(obj, mesh=None) -> np.ndarray:
+    """Get the world coordinates of all vertices of an object
+
+    Args:
+        obj (bpy.types.Object): object whose world transform is used
+
+    Optional Args:
+        mesh (bpy.types.Mesh): mesh to read vertices from, e.g. an evaluated mesh. Default: obj.data
+
+    Returns:
+        np.array(N, 3) of vertex world coordinates
+    """
+    mesh = obj.data if mesh is None else mesh
+    return transform_points(obj.matrix_world, get_vertices(mesh))
@@ -0,0 +1,465 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 - for information on the respective copyright owner
+# see the NOTICE file and/or the repository
+# <https://github.com/boschresearch/amira-blender-rendering>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Utilities to handle (environment) textures during rendering"""
+
+import os
+import json
+import random
+import shutil
+import struct
+import hashlib
+import tempfile
+from collections import OrderedDict, deque
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from math import ceil, pi
+import bpy
+from amira_blender_rendering.utils.io import expandpath, get_cache_dir
+from amira_blender_rendering.utils.logging import get_logger
+
+logger = get_logger()
+
+
+def get_required_environment_width(scene=None):
+    """Get the width (in pixels) an environment texture needs to have such that
+    it is not undersampled by the camera of the scene.
+
+    An environment texture covers 360 degrees horizontally, while the camera
+    covers only its horizontal field of view with the render resolution.
+
+    Args:
+        scene: scene for which to compute the width. Default: bpy.context.scene
+
+    Returns:
+        int: required width in pixels, or 0 if the scene has no camera
+    """
+    scene = bpy.context.scene if scene is None else scene
+    if scene.camera is None:
+        return 0
+    render = scene.render
+    res_x = render.resolution_x * render.resolution_percentage / 100
+    return int(ceil(res_x * 2 * pi / scene.camera.data.angle_x))
+
+
+def get_image_size_bytes(img):
+    """Estimate the memory (in bytes) blender requires to keep an image in memory.
+
+    Blender internally stores images as RGBA buffer, either using bytes or floats.
+    """
+    return img.size[0] * img.size[1] * 4 * (4 if img.is_float else 1)
+
+
+class EnvironmentTextureManager():
+    """Manage environment textures that are randomly sampled during rendering.
+
+    Loaded images are kept in a LRU pool of blender image datablocks that is
+    bounded by a memory budget. Least recently used images are removed from
+    blender once the budget is exceeded. In addition, the next randomly chosen
+    textures are prefetched in a background thread, i.e. copied from their
+    (possibly remote) location to a local temporary directory, such that loading
+    them within blender does not stall rendering. Decoding happens within blender
+    itself, because bpy is not thread-safe. Optionally, images are downscaled to
+    the resolution that is actually required by the camera.
+
+    Example:
+        manager = EnvironmentTextureManager(filepaths, capacity_mb=1024, prefetch=4)
+        img = manager.sample()
+    """
+
+    def __init__(self, filepaths, capacity_mb: float = 1024, prefetch: int = 4, downscale: bool = False):
+        """Initialize the manager.
+
+        Args:
+            filepaths(sequence): filepaths of all textures to sample from
+
+        Optional Args:
+            capacity_mb(float): memory budget in MB for loaded images. If <= 0, at most
+                one image is kept in memory. Default: 1024
+            prefetch(int): number of upcoming textures to prefetch in the background.
+                If 0, disable prefetching. Default: 4
+            downscale(bool): if True, downscale images to the width required by the
+                active camera of the scene. Default: False
+        """
+        self.filepaths = filepaths
+        self.capacity = int(capacity_mb * 1024 * 1024)
+        self.prefetch = max(0, int(prefetch))
+        self.downscale = downscale
+
+        # filepath -> (image name, size in bytes, local filepath)
+        self._images = OrderedDict()
+        self._size = 0
+
+        # upcoming random choices and their prefetch futures
+        self._upcoming = deque()
+        self._futures = dict()
+        self._executor = None
+        self._tmpdir = None
+        self._empty_logged = False
+        if self.prefetch > 0:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+            self._tmpdir = tempfile.mkdtemp(prefix='abr_textures_')
+
+    def __len__(self):
+        return len(self._images)
+
+    @property
+    def size_bytes(self):
+        """Estimated memory of all images in the pool"""
+        return self._size
+
+    def _fetch(self, filepath):
+        """Copy a file to the local temporary directory. Runs in the background thread"""
+        try:
+            dst = os.path.join(self._tmpdir, f'{abs(hash(filepath)):x}_{os.path.basename(filepath)}')
+            shutil.copyfile(filepath, dst)
+            return dst
+        except OSError as err:
+            logger.warn(f'Could not prefetch texture {filepath}: {err}')
+            return filepath
+
+    def _schedule(self):
+        """Draw the next random textures and submit them for prefetching"""
+        while len(self._upcoming) < self.prefetch + 1:
+            filepath = expandpath(random.choice(self.filepaths))
+            self._upcoming.append(filepath)
+            if self._executor is not None and filepath not in self._images and filepath not in self._futures:
+                self._futures[filepath] = self._executor.submit(self._fetch, filepath)
+
+    def _release(self, filepath):
+        """Remove an image from the pool, from blender, and from the local directory"""
+        name, nbytes, localpath = self._images.pop(filepath)
+        self._size -= nbytes
+        if name in bpy.data.images:
+            bpy.data.images.remove(bpy.data.images[name])
+        if localpath != filepath and filepath not in self._futures:
+            try:
+                os.remove(localpath)
+            except OSError:
+                pass
+
+    def _evict(self):
+        """Evict least recently used images until the pool fits the memory budget.
+        The most recently used image is never evicted."""
+        while self._size > self.capacity and len(self._images) > 1:
+            self._release(next(iter(self._images)))
+
+    def get(self, filepath: str):
+        """Get the blender image for a texture, loading it if required.
+
+        Args:
+            filepath(str): path to the texture
+
+        Returns:
+            bpy.types.Image
+        """
+        filepath = expandpath(filepath)
+        if filepath in self._images:
+            name = self._images[filepath][0]
+            if name in bpy.data.images:
+                self._images.move_to_end(filepath)
+                return bpy.data.images[name]
+            # image was removed from elsewhere
+            self._release(filepath)
+
+        localpath = filepath
+        future = self._futures.pop(filepath, None)
+        if future is not None:
+            localpath = future.result()
+
+        img = bpy.data.images.load(localpath, check_existing=False)
+        if self.downscale:
+            width = get_required_environment_width()
+            if 0 < width < img.size[0]:
+                height = max(1, int(img.size[1] * width / img.size[0]))
+                logger.info(f'Downscaling texture {filepath} from {img.size[0]}x{img.size[1]} to {width}x{height}')
+                img.scale(width, height)
+
+        nbytes = get_image_size_bytes(img)
+        self._images[filepath] = (img.name, nbytes, localpath)
+        self._size += nbytes
+        self._evict()
+        return img
+
+    def sample(self):
+        """Randomly choose a texture and return its blender image.
+
+        Returns:
+            bpy.types.Image or None if the texture could not be loaded, or if
+            there is no texture to choose from (e.g. all were removed by the
+            filters of a TextureIndex)
+        """
+        if len(self.filepaths) == 0:
+            if not self._empty_logged:
+                logger.error(f'No environment textures to sample from in {self.filepaths}. '
+                             'Check the texture filters (texture_min_size, texture_min_aspect, texture_max_aspect)')
+                self._empty_logged = True
+            return None
+        self._schedule()
+        filepath = self._upcoming.popleft()
+        try:
+            img = self.get(filepath)
+        except RuntimeError as err:
+            logger.error(f'Could not load environment texture {filepath}: {err}')
+            img = None
+        # keep the prefetch queue filled while rendering
+        self._schedule()
+        return img
+
+    def clear(self):
+        """Remove all images of the pool from blender"""
+        for filepath in list(self._images.keys()):
+            self._release(filepath)
+
+    def close(self):
+        """Stop prefetching and remove all temporary files"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._futures.clear()
+        self._upcoming.clear()
+        if self._tmpdir is not None:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+            self._tmpdir = None
+
+
+# image formats for which read_image_size can extract the dimensions from the header
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# image formats that blender can load, but for which we do not parse the header
+_OTHER_IMAGE_EXTENSIONS = {'.bmp', '.tga', '.tif', '.tiff', '.exr', '.hdr', '.webp'}
+
+
+def _read_jpeg_size(f):
+    """Walk the JPEG segments until a start-of-frame segment is found"""
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        # skip (padding) bytes until the next marker
+        while byte and byte != b'\xff':
+            byte = f.read(1)
+        while byte == b'\xff':
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        # standalone markers without payload
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+            continue
+        if marker == 0xD9:
+            return None
+        header = f.read(2)
+        if len(header) != 2:
+            return None
+        length = struct.unpack('>H', header)[0]
+        if marker in _JPEG_SOF_MARKERS:
+            data = f.read(5)
+            if len(data) != 5:
+                return None
+            height, width = struct.unpack('>HH', data[1:])
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def read_image_size(filepath: str):
+    """Read the size of an image from its file header, without decoding it.
+
+    PNG and JPEG headers are parsed. For other image formats that blender can
+    load, the size is unknown and (0, 0) is returned.
+
+    Args:
+        filepath(str): path to the image
+
+    Returns:
+        tuple (width, height), (0, 0) if the size is unknown, or None if the
+        file is not a (valid) image
+    """
+    try:
+        with open(filepath, 'rb') as f:
+            head = f.read(24)
+            if head.startswith(_PNG_SIGNATURE):
+                if len(head) < 24 or head[12:16] != b'IHDR':
+                    return None
+                return struct.unpack('>II', head[16:24])
+            if head.startswith(b'\xff\xd8'):
+                return _read_jpeg_size(f)
+    except (OSError, struct.error):
+        return None
+    if len(head) and os.path.splitext(filepath)[1].lower() in _OTHER_IMAGE_EXTENSIONS:
+        return 0, 0
+    return None
+
+
+class TextureIndex(Sequence):
+    """Lazily loaded, persistent index of all images within a texture directory.
+
+    Listing directories with hundreds of thousands of files (e.g. on network
+    filesystems) is slow, and such directories might contain non-image or
+    broken files. The index stores name, file size, dimensions and validity of
+    each file, and is written once to the cache directory (see
+    utils.io.get_cache_dir). Afterwards, it is only re-validated against the
+    modification time of the directory, i.e. the directory is listed again only
+    if files were added, removed or renamed. A checksum of the directory
+    listing allows to reuse the index if the listing did not change.
+
+    The index behaves like a (read-only) list of filepaths of all valid
+    images that pass the given filters, and can be directly used with e.g.
+    random.choice.
+
+    Note that the directory is not read before the index is first accessed.
+    """
+
+    def __init__(self, directory: str, min_size: int = 0, min_aspect: float = 0.0, max_aspect: float = 0.0,
+                 index_path: str = None):
+        """Initialize the index.
+
+        Args:
+            directory(str): directory containing texture images
+
+        Optional Args:
+            min_size(int): min size (in pixels) of the shorter image side. Default: 0
+            min_aspect(float): min aspect ratio (width / height). If 0, no limit. Default: 0.0
+            max_aspect(float): max aspect ratio (width / height). If 0, no limit. Default: 0.0
+            index_path(str): path to the index file. Default: file in cache dir, named after directory
+        """
+        self.directory = os.path.realpath(expandpath(directory))
+        self.min_size = min_size
+        self.min_aspect = min_aspect
+        self.max_aspect = max_aspect
+        if index_path is None:
+            digest = hashlib.sha1(self.directory.encode('utf-8')).hexdigest()
+            index_path = os.path.join(get_cache_dir('textures'), f'{digest}.json')
+        self.index_path = index_path
+        self._filepaths = None
+
+    @staticmethod
+    def _checksum(names):
+        return hashlib.sha1('\n'.join(sorted(names)).encode('utf-8')).hexdigest()
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if index.get('directory') != self.directory:
+            return None
+        return index
+
+    def _write_index(self, index):
+        # write atomically, several render jobs might share the same index
+        tmp_path = f'{self.index_path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(index, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as err:
+            logger.warn(f'Could not write texture index {self.index_path}: {err}')
+
+    def build(self, index: dict = None):
+        """(Re-)build the index by listing the directory.
+
+        Entries of an existing index are reused for files which did not change.
+
+        Args:
+            index(dict): existing index, if any
+
+        Returns:
+            dict with the index
+        """
+        mtime = os.stat(self.directory).st_mtime
+        entries = {} if index is None else index['entries']
+        names = sorted([e.name for e in os.scandir(self.directory) if e.is_file()])
+        checksum = self._checksum(names)
+        if index is not None and index['checksum'] == checksum:
+            logger.info(f'Directory listing of {self.directory} unchanged, reusing texture index')
+        else:
+            logger.info(f'Building texture index of {len(names)} files in {self.directory}')
+            new_entries = {}
+            for name in names:
+                filepath = os.path.join(self.directory, name)
+                size = os.path.getsize(filepath)
+                entry = entries.get(name)
+                if entry is None or entry[0] != size:
+                    dims = read_image_size(filepath)
+                    valid = dims is not None and size > 0
+                    width, height = dims if valid else (0, 0)
+                    entry = [size, width, height, valid]
+                new_entries[name] = entry
+            entries = new_entries
+
+        index = {
+            'directory': self.directory,
+            'mtime': mtime,
+            'checksum': checksum,
+            # name -> [file size, width, height, valid]
+            'entries': entries,
+        }
+        self._write_index(index)
+        return index
+
+    def load(self):
+        """Load the index, (re-)building it if it is missing or stale"""
+        index = self._read_index()
+        if index is None or index['mtime'] != os.stat(self.directory).st_mtime:
+            index = self.build(index)
+
+        self._filepaths = []
+        n_invalid = 0
+        for name, (size, width, height, valid) in sorted(index['entries'].items()):
+            if not valid:
+                n_invalid += 1
+                continue
+            if not self._accept(width, height):
+                continue
+            self._filepaths.append(os.path.join(self.directory, name))
+        if n_invalid:
+            logger.info(f'Ignoring {n_invalid} invalid files in {self.directory}')
+        if not self._filepaths:
+            logger.warn(f'No valid textures in {self.directory} for the given filters')
+
+    def _accept(self, width, height):
+        """Check if an image with given size passes the filters. Images of unknown size only pass without filters"""
+        if not (self.min_size or self.min_aspect or self.max_aspect):
+            return True
+        if width <= 0 or height <= 0:
+            return False
+        aspect = width / height
+        if min(width, height) < self.min_size:
+            return False
+        if self.min_aspect and aspect < self.min_aspect:
+            return False
+        if self.max_aspect and aspect > self.max_aspect:
+            return False
+        return True
+
+    @property
+    def filepaths(self):
+        if self._filepaths is None:
+            self.load()
+        return self._filepaths
+
+    def __len__(self):
+        return len(self.filepaths)
+
+    def __getitem__(self, idx):
+        return self.filepaths[idx]
+
+    def __repr__(self):
+        return (f'TextureIndex({self.directory}, min_size={self.min_size}, min_aspect={self.min_aspect}, '
+                f'max_aspect={self.max_aspect})')
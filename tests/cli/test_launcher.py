@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 - for information on the respective copyright owner
+# see the NOTICE file and/or the repository
+# <https://github.com/boschresearch/amira-blender-rendering>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import unittest
+from amira_blender_rendering.cli import launcher
+import tests
+
+"""Test file for scene splitting in amira_blender_rendering.cli.launcher"""
+
+
+@tests.register(name='test_cli')
+class TestLauncher(unittest.TestCase):
+
+    def test_split_scenes(self):
+        self.assertEqual(launcher.split_scenes(10, 3), [(0, 3), (3, 6), (6, 10)])
+        self.assertEqual(launcher.split_scenes(2, 4), [(0, 1), (1, 2)])
+        # workers rendering a shard
+        self.assertEqual(launcher.split_scenes(5, 3, scene_start=20), [(20, 21), (21, 23), (23, 25)])
+        ranges = [launcher.get_shard_range(101, k, 7) for k in range(7)]
+        self.assertEqual(sum(stop - start for start, stop in ranges), 101)
+        with self.assertRaises(ValueError):
+            launcher.get_shard_range(10, 3, 3)
+
+    def test_scene_list(self):
+        fd, path = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(fd, 'w') as f:
+            f.write('# scenes to render again\n7\n3\n\n4  # comment\n12\n3\n')
+        try:
+            scenes = launcher.read_scene_list(path)
+        finally:
+            os.remove(path)
+        self.assertEqual(scenes, [7, 3, 4, 12, 3])
+        self.assertEqual(launcher.get_scene_ranges(scenes), [(3, 5), (7, 8), (12, 13)])
+        self.assertEqual(launcher.get_scene_ranges([]), [])
+
+
+def main():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestLauncher))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
+
+
+if __name__ == '__main__':
+    main()
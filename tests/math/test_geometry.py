@@ -87,6 +87,60 @@ class TestGeometry(unittest.TestCase):
         self.assertTrue(geometry.test_occlusion(scene, layer, self._cam, self._obj_non_visible, self._w, self._h),
                         'Non visible object appears visible')
 
+    def test_test_intersection(self):
+        # move second object on top of the first one
+        self._obj2.location = self._obj1.location.copy()
+        bpy.context.view_layer.update()
+        self.assertTrue(geometry.test_bounding_sphere_intersection(self._obj1, self._obj2),
+                        'Bounding spheres of overlapping objects do not intersect')
+        self.assertTrue(geometry.test_intersection(self._obj1, self._obj2),
+                        'Overlapping objects do not intersect')
+
+        # move second object far away
+        self._obj2.location = self._obj1.location + Vector((100, 0, 0))
+        bpy.context.view_layer.update()
+        self.assertFalse(geometry.test_bounding_sphere_intersection(self._obj1, self._obj2),
+                         'Bounding spheres of distant objects intersect')
+        self.assertFalse(geometry.test_intersection(self._obj1, self._obj2),
+                         'Distant objects intersect')
+
+    def test_drop_to_support(self):
+        scene = bpy.context.scene
+        layer = scene.view_layers['View Layer']
+
+        # add a support plane below the object
+        support_z = min([(self._obj1.matrix_world @ v.co).z for v in self._obj1.data.vertices]) - 2
+        bpy.ops.mesh.primitive_plane_add(size=100, location=(self._obj1.location.x, self._obj1.location.y, support_z))
+        layer.update()
+
+        self.assertTrue(geometry.drop_to_support(scene, layer, self._obj1, clearance=0),
+                        'Support surface not found')
+        layer.update()
+        lowest_z = min([(self._obj1.matrix_world @ v.co).z for v in self._obj1.data.vertices])
+        self.assertAlmostEqual(support_z, lowest_z, places=4, msg='Object not dropped onto support surface')
+
+    def test_drop_to_sloped_support(self):
+        scene = bpy.context.scene
+        layer = scene.view_layers['View Layer']
+
+        # add a sloped support plane below the object
+        alpha = np.pi / 9
+        x0, y0 = self._obj1.location.x, self._obj1.location.y
+        support_z = min([(self._obj1.matrix_world @ v.co).z for v in self._obj1.data.vertices]) - 2
+        bpy.ops.mesh.primitive_plane_add(size=100, location=(x0, y0, support_z), rotation=(alpha, 0, 0))
+        plane = bpy.context.active_object
+        layer.update()
+
+        self.assertTrue(geometry.drop_to_support(scene, layer, self._obj1, clearance=1e-4),
+                        'Support surface not found')
+        layer.update()
+        # no vertex must sink into the plane
+        for v in self._obj1.data.vertices:
+            p = self._obj1.matrix_world @ v.co
+            self.assertGreaterEqual(p.z, support_z + np.tan(alpha) * (p.y - y0) - 1e-4,
+                                    'Object sinks into sloped support surface')
+        self.assertFalse(geometry.test_intersection(self._obj1, plane), 'Object intersects sloped support surface')
+
     def test_get_world_to_object_transform(self):
         R = np.eye(3)
         c2o_pose = {'R': R, 't': np.array([0, 0, -20])}
@@ -95,6 +149,42 @@ class TestGeometry(unittest.TestCase):
         npt.assert_almost_equal(np.array([0, 0, 0]), w_pose['t'], err_msg='World translation in incorrect')
         npt.assert_almost_equal(np.eye(3), w_pose['R'], err_msg='World rotation is incorrect')
     
+    def test_compute_3dbboxes(self):
+        objs = [self._obj1, self._obj2]
+        render = bpy.context.scene.render
+        bound_boxes = np.array([[tuple(v) for v in obj.bound_box] for obj in objs])
+        matrices_world = np.array([np.array(obj.matrix_world) for obj in objs])
+        aabb, oobb, corners3d = geometry.compute_3dbboxes(
+            bound_boxes, matrices_world, geometry.get_projection_matrix(self._cam, render), self._w, self._h)
+        self.assertEqual((aabb.shape, oobb.shape, corners3d.shape), ((2, 9, 3), (2, 9, 3), (2, 9, 2)))
+
+        order = [1, 0, 2, 3, 5, 4, 6, 7]
+        for k, obj in enumerate(objs):
+            bbox = [Vector(v) for v in obj.bound_box]
+            npt.assert_almost_equal(aabb[k, 0], bbox[0] + (bbox[6] - bbox[0]) / 2.0, decimal=5)
+            npt.assert_almost_equal(aabb[k, 1:], [bbox[i] for i in order], decimal=5)
+            oobb_ref = [obj.matrix_world @ bbox[i] for i in order]
+            npt.assert_almost_equal(oobb[k, 1:], oobb_ref, decimal=5)
+            for p, pix in zip(oobb_ref, corners3d[k, 1:]):
+                pix_ref = geometry.p2d_to_pixel_coords(geometry.project_p3d(p, self._cam, render), render)
+                npt.assert_almost_equal(pix, pix_ref, decimal=3)
+
+    def test_get_relative_poses(self):
+        objs = [self._obj1, self._obj2, self._obj_non_visible]
+        zeroing = Vector((90, 0, 0))
+        matrices_world = np.array([np.array(obj.matrix_world) for obj in objs])
+        R_gl, t_gl, R_cv, t_cv = geometry.get_relative_poses(matrices_world, np.array(self._cam.matrix_world), zeroing)
+        self.assertEqual((R_gl.shape, t_gl.shape, R_cv.shape, t_cv.shape), ((3, 3, 3), (3, 3), (3, 3, 3), (3, 3)))
+
+        for k, obj in enumerate(objs):
+            R_ref = np.asarray(geometry.get_relative_rotation_to_cam_deg(obj, self._cam, zeroing).to_matrix())
+            t_ref = np.asarray(geometry.get_relative_translation(obj, self._cam))
+            npt.assert_almost_equal(R_gl[k], R_ref, decimal=5)
+            npt.assert_almost_equal(t_gl[k], t_ref, decimal=5)
+            R_cv_ref, t_cv_ref = geometry.gl2cv(R_ref, t_ref)
+            npt.assert_almost_equal(R_cv[k], R_cv_ref, decimal=5)
+            npt.assert_almost_equal(t_cv[k], t_cv_ref, decimal=5)
+
     def test_gl2cv(self):
         R_gl = np.eye(3)
         t_gl = np.array([0, 0, -1])
@@ -124,6 +214,20 @@ class TestGeometry(unittest.TestCase):
         q = 0.5 * np.array([1, 1, 1, 1])
         npt.assert_almost_equal(q, geometry.rotation_matrix_to_quaternion(R))
 
+    def test_rotation_matrices_to_quaternions(self):
+        # random rotations, identity, and rotations by pi around each axis
+        Rs = [geometry.rotation_matrix(a, axis) @ geometry.rotation_matrix(b, 'z')
+              for a, b, axis in zip(np.linspace(-np.pi, np.pi, 15), np.linspace(0, 2 * np.pi, 15), 'xyzxyzxyzxyzxyz')]
+        Rs += [np.eye(3), np.diag([1, -1, -1]), np.diag([-1, 1, -1]), np.diag([-1, -1, 1]),
+               np.array([[0, 0, 1], [1, 0, 0], [0, 1, 0]])]
+        qs = geometry.rotation_matrices_to_quaternions(np.array(Rs))
+        self.assertEqual(qs.shape, (len(Rs), 4))
+        for R, q in zip(Rs, qs):
+            q_ref = geometry.rotation_matrix_to_quaternion(R)
+            # quaternions are equal up to sign for rotations by pi (w = 0)
+            npt.assert_almost_equal(q if np.dot(q, q_ref) >= 0 else -q, q_ref)
+            self.assertGreaterEqual(q[0], 0)
+
     def tearDown(self):
         pass
 
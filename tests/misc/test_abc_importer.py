@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 - for information on the respective copyright owner
+# see the NOTICE file and/or the repository
+# <https://github.com/boschresearch/amira-blender-rendering>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from amira_blender_rendering.abc_importer import read_stl_statistics, is_scalable
+import tests
+
+
+@tests.register(name='test_misc')
+class TestABCImporter(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.mkdtemp()
+        # tetrahedron with 4 vertices and 4 faces, dimensions 2 x 1 x 0.5
+        v = [(0, 0, 0), (2, 0, 0), (0, 1, 0), (0, 0, 0.5)]
+        self._faces = [(v[0], v[1], v[2]), (v[0], v[1], v[3]), (v[0], v[2], v[3]), (v[1], v[2], v[3])]
+        self._dimensions = [2.0, 1.0, 0.5]
+
+    def _write_binary_stl(self, filepath):
+        with open(filepath, 'wb') as f:
+            f.write(b'\0' * 80)
+            f.write(struct.pack('<I', len(self._faces)))
+            for face in self._faces:
+                f.write(struct.pack('<3f', 0, 0, 0))
+                for vertex in face:
+                    f.write(struct.pack('<3f', *vertex))
+                f.write(struct.pack('<H', 0))
+
+    def _write_ascii_stl(self, filepath):
+        with open(filepath, 'w') as f:
+            f.write('solid test\n')
+            for face in self._faces:
+                f.write('facet normal 0 0 0\nouter loop\n')
+                for vertex in face:
+                    f.write('vertex {} {} {}\n'.format(*vertex))
+                f.write('endloop\nendfacet\n')
+            f.write('endsolid test\n')
+
+    def test_read_stl_statistics(self):
+        for write in [self._write_binary_stl, self._write_ascii_stl]:
+            filepath = os.path.join(self._tmpdir, 'test.stl')
+            write(filepath)
+            stats = read_stl_statistics(filepath)
+            self.assertEqual(4, stats['n_vertices'])
+            self.assertEqual(4, stats['n_faces'])
+            for gt, d in zip(self._dimensions, stats['dimensions']):
+                self.assertAlmostEqual(gt, d, places=6)
+
+        filepath = os.path.join(self._tmpdir, 'invalid.stl')
+        with open(filepath, 'w') as f:
+            f.write('not a mesh')
+        self.assertIsNone(read_stl_statistics(filepath))
+
+    def test_is_scalable(self):
+        self.assertTrue(is_scalable(self._dimensions, 0.01, 0.1))
+        self.assertFalse(is_scalable(self._dimensions, 0.01, 0.02))
+        self.assertFalse(is_scalable([1.0, 1.0, 0.0], 0.01, 0.1))
+
+    def tearDown(self):
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+
+def main():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestABCImporter))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
+
+
+if __name__ == '__main__':
+    main()
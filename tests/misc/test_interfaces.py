@@ -48,6 +48,30 @@ def _build_render_result():
     return result
 
 
+def _build_full_render_result(k, visible=True):
+    angle = k * np.pi / 5
+    rotation = np.array([[np.cos(angle), -np.sin(angle), 0], [np.sin(angle), np.cos(angle), 0], [0, 0, 1]])
+    return interfaces.PoseRenderResult(
+        object_class_name=f'class_{k}',
+        object_class_id=k,
+        object_name=f'obj_{k}',
+        object_id=k,
+        rgb_const=None,
+        rgb_random=None,
+        depth=None,
+        mask=None,
+        rotation=rotation,
+        translation=np.array([k, 2.0 * k, 100.0]),
+        corners2d=np.array([[k, k], [10 + k, 20 + k]]) if visible else None,
+        corners3d=np.full((9, 2), 0.5 * k) if visible else None,
+        aabb=np.full((9, 3), 0.25 * k) if visible else None,
+        oobb=np.full((9, 3), 1.5 * k) if visible else None,
+        mask_name=f'_{k}',
+        visible=visible,
+        camera_rotation=rotation.T,
+        camera_translation=np.array([0.0, 0.0, k]))
+
+
 @tests.register(name='test_misc')
 class TestInterfaces(unittest.TestCase):
 
@@ -95,6 +119,35 @@ class TestInterfaces(unittest.TestCase):
         # test lenght
         self.assertEqual(len(results), 3)
 
+    def test_results_arrays(self):
+        # results with (visible) and without (invisible) bounding boxes
+        results = [_build_full_render_result(k, visible=(k % 2 == 0)) for k in range(5)]
+        collection = interfaces.ResultsCollection()
+        collection.add_results(results)
+        arrays = interfaces.PoseResultsArrays(capacity=2)
+        arrays.add_results(results)
+        self.assertEqual(len(arrays), 5)
+        self.assertListEqual(arrays.state_dict(), collection.state_dict())
+        self.assertListEqual(arrays.state_dict(retain_keys=['object_name']),
+                             [{'object_name': f'obj_{k}'} for k in range(5)])
+        self.assertDictEqual(arrays.get_result(-1).state_dict(), results[-1].state_dict())
+
+        # bulk insertion
+        batch = interfaces.PoseResultsArrays()
+        batch.add_batch(
+            [r.object_class_name for r in results], [r.object_class_id for r in results],
+            [r.object_name for r in results], [r.object_id for r in results],
+            np.array([r.q for r in results]), np.array([r.t for r in results]),
+            corners2d=[r.corners2d for r in results], corners3d=[r.corners3d for r in results],
+            aabb=[r.aabb for r in results], oobb=[r.oobb for r in results],
+            mask_name=[r.mask_name for r in results], visible=[r.visible for r in results],
+            camera_rotation=np.array([r.q_cam for r in results]),
+            camera_translation=np.array([r.t_cam for r in results]))
+        self.assertListEqual(batch.state_dict(), collection.state_dict())
+        data = batch.to_arrays()
+        self.assertEqual(data['aabb'].shape, (5, 9, 3))
+        self.assertListEqual(data['aabb_valid'].tolist(), [True, False, True, False, True])
+
     def test_render_result(self):
         result = _build_render_result()
         self.assertDictEqual(result.state_dict(), self.render_test_data)
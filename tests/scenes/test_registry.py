@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 - for information on the respective copyright owner
+# see the NOTICE file and/or the repository
+# <https://github.com/boschresearch/amira-blender-rendering>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import amira_blender_rendering.scenes as abr_scenes
+import tests
+
+"""Test file for the scene registry in amira_blender_rendering.scenes"""
+
+
+@tests.register(name='test_scenes')
+class TestRegistry(unittest.TestCase):
+
+    def test_manifest(self):
+        # each scene in the manifest must register a scene and a config in its module
+        for name in abr_scenes._scene_manifest:
+            registered = abr_scenes.get_registered(name)
+            self.assertIn('scene', registered)
+            self.assertIn('config', registered)
+            self.assertIn(name, abr_scenes.get_scene_names())
+
+    def test_all_registered_in_manifest(self):
+        for name in abr_scenes.get_registered():
+            self.assertIn(name, abr_scenes._scene_manifest, f'Scene {name} missing from scene manifest')
+
+    def test_lazy_attributes(self):
+        from amira_blender_rendering.scenes.rendermanager import RenderManager
+        self.assertIs(abr_scenes.RenderManager, RenderManager)
+        with self.assertRaises(AttributeError):
+            abr_scenes.NotAnAttribute
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            abr_scenes.get_registered('NotAScene')
+
+
+def main():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestRegistry))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
+
+
+if __name__ == '__main__':
+    main()
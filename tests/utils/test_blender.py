@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 - for information on the respective copyright owner
+# see the NOTICE file and/or the repository
+# <https://github.com/boschresearch/amira-blender-rendering>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import bpy
+from mathutils import Vector
+from amira_blender_rendering.utils import blender as blnd
+import tests
+
+
+@tests.register(name='test_utils')
+class TestBlender(unittest.TestCase):
+
+    def setUp(self):
+        bpy.ops.wm.read_homefile(use_empty=True)
+        bpy.ops.mesh.primitive_cube_add(size=2, location=(1, 2, 3))
+        self._obj = bpy.context.object
+        bpy.context.view_layer.update()
+
+    def test_select_object(self):
+        blnd.deselect_all()
+        self.assertEqual(0, len(bpy.context.selected_objects))
+        blnd.select_object(self._obj.name)
+        self.assertEqual([self._obj], bpy.context.selected_objects)
+        self.assertEqual(self._obj, bpy.context.view_layer.objects.active)
+
+    def test_apply_scale(self):
+        blnd.apply_scale(self._obj, (2, 1, 0.5))
+        bpy.context.view_layer.update()
+        self.assertEqual(Vector((1, 1, 1)), self._obj.scale)
+        for gt, d in zip((4, 2, 1), self._obj.dimensions):
+            self.assertAlmostEqual(gt, d, places=5)
+
+    def test_set_origin_to_center_of_mass(self):
+        # shift the mesh w.r.t. its origin, world location of the mesh must not change
+        for v in self._obj.data.vertices:
+            v.co.x += 1.0
+        blnd.set_origin_to_center_of_mass(self._obj)
+        bpy.context.view_layer.update()
+        for gt, loc in zip((2, 2, 3), self._obj.location):
+            self.assertAlmostEqual(gt, loc, places=5)
+        for v in self._obj.data.vertices:
+            self.assertAlmostEqual(1.0, abs(v.co.x), places=5)
+
+    def test_add_rigid_body(self):
+        rigid_body = blnd.add_rigid_body(self._obj)
+        self.assertIsNotNone(rigid_body)
+        self.assertIn(self._obj.name, bpy.context.scene.rigidbody_world.collection.objects)
+
+        # duplicates of rigid bodies take part in the simulation, too
+        new_obj = blnd.duplicate_object(self._obj, linked=True)
+        self.assertIn(new_obj.name, bpy.context.scene.rigidbody_world.collection.objects)
+
+    def test_delete_object(self):
+        new_name = blnd.duplicate_object(self._obj, linked=True).name
+        mesh_name = self._obj.data.name
+        blnd.delete_object(new_name)
+        self.assertNotIn(new_name, bpy.data.objects)
+        # mesh still in use by the original object
+        self.assertIn(mesh_name, bpy.data.meshes)
+        blnd.delete_object(self._obj)
+        self.assertNotIn(mesh_name, bpy.data.meshes)
+
+
+def main():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestBlender))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
+
+
+if __name__ == '__main__':
+    main()
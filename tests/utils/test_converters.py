@@ -18,6 +18,7 @@
 
 
 import os
+import json
 import shutil
 import unittest
 import xml.etree.ElementTree as ET
@@ -62,6 +63,24 @@ class TestConverters(unittest.TestCase):
         for t_xml, c_xml in zip(test_xml.iter(), converted_xml.iter()):
             self.assertTrue(are_xml_element_equal(t_xml, c_xml), 'Different xml element detected')
 
+    def test_to_pascal_voc_size(self):
+        # current annotations do not contain the image size
+        with open(self._fpath_json) as f:
+            data_json = json.load(f)
+        for obj in data_json:
+            obj.pop('dimensions', None)
+        fpath_json = os.path.join(self._datadir, 'annotations', 'test_size.json')
+        with open(fpath_json, 'w') as f:
+            json.dump(data_json, f)
+        try:
+            converters.to_PASCAL_VOC(fpath_json, width=640, height=480)
+        finally:
+            os.remove(fpath_json)
+        size = ET.parse(os.path.join(self._datadir, 'xml', 'test_size.xml')).getroot().find('size')
+        self.assertEqual(size.find('width').text, '640')
+        self.assertEqual(size.find('height').text, '480')
+        self.assertEqual(size.find('depth').text, '3')
+
     def tearDown(self):
         # cleaning directory tree
         shutil.rmtree(os.path.join(self._datadir, 'xml'))
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 - for information on the respective copyright owner
+# see the NOTICE file and/or the repository
+# <https://github.com/boschresearch/amira-blender-rendering>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import bpy
+import numpy as np
+import numpy.testing as npt
+from mathutils import Matrix
+from amira_blender_rendering.utils import mesh as mesh_utils
+import tests
+
+
+@tests.register(name='test_utils')
+class TestMesh(unittest.TestCase):
+
+    def setUp(self):
+        bpy.ops.wm.read_homefile(use_empty=True)
+        # unit cube with vertices at +-1
+        bpy.ops.mesh.primitive_cube_add(size=2, location=(1, 2, 3))
+        self._obj = bpy.context.object
+        bpy.context.view_layer.update()
+
+    def test_get_set_vertices(self):
+        vs = mesh_utils.get_vertices(self._obj.data)
+        self.assertEqual((8, 3), vs.shape)
+        npt.assert_almost_equal(np.ones((8, 3)), np.abs(vs))
+
+        mesh_utils.set_vertices(self._obj.data, vs * 2)
+        npt.assert_almost_equal(vs * 2, mesh_utils.get_vertices(self._obj.data))
+        with self.assertRaises(ValueError):
+            mesh_utils.set_vertices(self._obj.data, vs[:4])
+
+    def test_get_polygons(self):
+        ps = mesh_utils.get_polygons(self._obj.data)
+        self.assertEqual(6, len(ps))
+        for p, p_gt in zip(ps, self._obj.data.polygons):
+            self.assertEqual(list(p_gt.vertices), p.tolist())
+
+    def test_polygon_centers_and_areas(self):
+        centers, areas = mesh_utils.get_polygon_centers_and_areas(self._obj.data)
+        npt.assert_almost_equal(np.full(6, 4.0), areas)
+        npt.assert_almost_equal(np.zeros(3), centers.mean(axis=0))
+
+    def test_world_vertices(self):
+        vs = mesh_utils.get_world_vertices(self._obj)
+        npt.assert_almost_equal(np.array([1, 2, 3]), vs.mean(axis=0))
+        vs_gt = np.array([self._obj.matrix_world @ v.co for v in self._obj.data.vertices])
+        npt.assert_almost_equal(vs_gt, vs, decimal=6)
+
+    def test_transform_points(self):
+        mat = Matrix.Translation((1, 0, 0))
+        ps = mesh_utils.transform_points(mat, np.zeros((2, 3)), homogeneous=True)
+        npt.assert_almost_equal(np.array([[1, 0, 0, 1], [1, 0, 0, 1]]), ps)
+
+
+def main():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestMesh))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
+
+
+if __name__ == '__main__':
+    main()
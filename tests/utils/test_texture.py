@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2020 - for information on the respective copyright owner
+# see the NOTICE file and/or the repository
+# <https://github.com/boschresearch/amira-blender-rendering>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+import bpy
+from amira_blender_rendering.utils.texture import EnvironmentTextureManager, TextureIndex, \
+    get_image_size_bytes, read_image_size
+import tests
+
+
+@tests.register(name='test_utils')
+class TestTexture(unittest.TestCase):
+
+    def setUp(self):
+        # write a couple of small test images to disk
+        self._tmpdir = tempfile.mkdtemp()
+        self._filepaths = []
+        for i in range(4):
+            img = bpy.data.images.new(f'texture_{i}', width=64, height=32)
+            img.filepath_raw = os.path.join(self._tmpdir, f'texture_{i}.png')
+            img.file_format = 'PNG'
+            img.save()
+            bpy.data.images.remove(img)
+            self._filepaths.append(os.path.join(self._tmpdir, f'texture_{i}.png'))
+        self._img_bytes = 64 * 32 * 4
+
+    def test_lru_eviction(self):
+        # budget for two images
+        manager = EnvironmentTextureManager(self._filepaths, capacity_mb=2 * self._img_bytes / 1024 / 1024,
+                                            prefetch=0)
+        img0 = manager.get(self._filepaths[0])
+        self.assertEqual(self._img_bytes, get_image_size_bytes(img0))
+        name0 = img0.name
+        manager.get(self._filepaths[1])
+        # touch first image, such that the second is the least recently used one
+        self.assertEqual(name0, manager.get(self._filepaths[0]).name)
+        manager.get(self._filepaths[2])
+
+        self.assertEqual(2, len(manager))
+        self.assertEqual(2 * self._img_bytes, manager.size_bytes)
+        self.assertIn(name0, bpy.data.images)
+        manager.clear()
+        self.assertEqual(0, len(manager))
+        manager.close()
+
+    def test_sample_with_prefetch(self):
+        manager = EnvironmentTextureManager(self._filepaths, prefetch=2)
+        for _ in range(10):
+            img = manager.sample()
+            self.assertIsNotNone(img)
+            self.assertEqual((64, 32), tuple(img.size))
+        manager.clear()
+        manager.close()
+
+    def test_read_image_size(self):
+        self.assertEqual((64, 32), tuple(read_image_size(self._filepaths[0])))
+        filepath = os.path.join(self._tmpdir, 'not_an_image.txt')
+        with open(filepath, 'w') as f:
+            f.write('not an image')
+        self.assertIsNone(read_image_size(filepath))
+
+    def test_texture_index(self):
+        with open(os.path.join(self._tmpdir, 'not_an_image.txt'), 'w') as f:
+            f.write('not an image')
+        # keep the index outside of the indexed directory
+        index_dir = tempfile.mkdtemp()
+        index_path = os.path.join(index_dir, 'index.json')
+
+        index = TextureIndex(self._tmpdir, index_path=index_path)
+        self.assertFalse(os.path.exists(index_path), 'Index must be loaded lazily')
+        self.assertEqual(sorted(self._filepaths), sorted(index))
+        self.assertTrue(os.path.exists(index_path))
+
+        # filters are applied to the stored index
+        self.assertEqual(0, len(TextureIndex(self._tmpdir, min_size=64, index_path=index_path)))
+        self.assertEqual(4, len(TextureIndex(self._tmpdir, min_aspect=1.5, max_aspect=2.5, index_path=index_path)))
+
+        # sampling from an index without matching textures does not fail
+        manager = EnvironmentTextureManager(TextureIndex(self._tmpdir, min_size=64, index_path=index_path))
+        self.assertIsNone(manager.sample())
+        manager.close()
+        shutil.rmtree(index_dir, ignore_errors=True)
+
+    def tearDown(self):
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+
+def main():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestTexture))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
+
+
+if __name__ == '__main__':
+    main()